@@ -0,0 +1,69 @@
+"""classroom sync watermarks
+
+Revision ID: 3f1c2a9b7d10
+Revises:
+Create Date: 2026-10-17 10:00:00.000000
+
+Primera revisión de Alembic: parte del esquema de database/init.sql. Como init.sql ya trae
+estos cambios, cada paso es idempotente y la revisión corre igual sobre una base recién creada
+con init.sql que sobre una anterior a la sincronización con Classroom.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9b7d10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for table in ("cursos", "tareas", "entregas", "anuncios"):
+        op.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS classroom_updated_at TIMESTAMP WITH TIME ZONE")
+
+    op.execute("ALTER TABLE entregas ADD COLUMN IF NOT EXISTS classroom_id VARCHAR(255)")
+    op.execute(
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'entregas_classroom_id_key') THEN
+                ALTER TABLE entregas ADD CONSTRAINT entregas_classroom_id_key UNIQUE (classroom_id);
+            END IF;
+        END
+        $$
+        """
+    )
+
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS estado_sincronizacion (
+            id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+            usuario_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            curso_id UUID NOT NULL REFERENCES cursos(id) ON DELETE CASCADE,
+            recurso VARCHAR(50) NOT NULL,
+            marca_agua TIMESTAMP WITH TIME ZONE,
+            sincronizado_en TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT uq_estado_sincronizacion UNIQUE (usuario_id, curso_id, recurso)
+        )
+        """
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_estado_sincronizacion_usuario_id ON estado_sincronizacion (usuario_id)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_anuncios_curso_actualizacion "
+        "ON anuncios (curso_id, classroom_updated_at DESC)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_anuncios_curso_actualizacion")
+    op.execute("DROP TABLE IF EXISTS estado_sincronizacion")
+
+    op.execute("ALTER TABLE entregas DROP CONSTRAINT IF EXISTS entregas_classroom_id_key")
+    op.execute("ALTER TABLE entregas DROP COLUMN IF EXISTS classroom_id")
+
+    for table in ("cursos", "tareas", "entregas", "anuncios"):
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS classroom_updated_at")
@@ -0,0 +1,35 @@
+"""shared google credentials
+
+Revision ID: 8a4d6e2f1b37
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4d6e2f1b37'
+down_revision = '3f1c2a9b7d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # database/init.sql ya crea la tabla: la revisión debe poder correr sobre esa base
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS credenciales_google (
+            google_id VARCHAR(255) PRIMARY KEY,
+            access_token TEXT NOT NULL,
+            refresh_token TEXT,
+            expiry TIMESTAMP WITH TIME ZONE,
+            scopes JSONB,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS credenciales_google")
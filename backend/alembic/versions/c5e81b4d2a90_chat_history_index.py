@@ -0,0 +1,31 @@
+"""chat history keyset index
+
+Revision ID: c5e81b4d2a90
+Revises: 8a4d6e2f1b37
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e81b4d2a90'
+down_revision = '8a4d6e2f1b37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # database/init.sql ya crea el índice: la revisión debe poder correr sobre esa base
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_mensajes_conversacion_creacion "
+        "ON mensajes_chat (conversacion_id, created_at, id)"
+    )
+    # El índice compuesto cubre las búsquedas que hacía el de una sola columna
+    op.execute("DROP INDEX IF EXISTS idx_mensajes_conversacion_id")
+    op.execute("DROP INDEX IF EXISTS ix_mensajes_chat_conversacion_id")
+
+
+def downgrade() -> None:
+    op.execute("CREATE INDEX IF NOT EXISTS idx_mensajes_conversacion_id ON mensajes_chat (conversacion_id)")
+    op.execute("DROP INDEX IF EXISTS idx_mensajes_conversacion_creacion")
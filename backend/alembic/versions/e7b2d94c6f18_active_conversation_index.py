@@ -0,0 +1,28 @@
+"""active conversation partial index
+
+Revision ID: e7b2d94c6f18
+Revises: c5e81b4d2a90
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b2d94c6f18'
+down_revision = 'c5e81b4d2a90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # La búsqueda de la conversación activa filtra por alumno y activa y toma la más reciente;
+    # el índice parcial la resuelve leyendo una sola entrada. database/init.sql ya lo crea
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_conversaciones_estudiante_activa "
+        "ON conversaciones_chat (estudiante_id, created_at DESC) WHERE activa"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_conversaciones_estudiante_activa")
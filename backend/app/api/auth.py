@@ -1,6 +1,6 @@
 import asyncio
+import logging
 from datetime import datetime, timedelta, timezone
-from threading import Lock
 from typing import Optional, List, Dict, Any
 
 import httpx
@@ -9,13 +9,18 @@ from google.auth.exceptions import RefreshError
 from google.auth.transport import requests as google_requests
 from google.oauth2 import id_token
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from pydantic import BaseModel
+from sqlalchemy.exc import SQLAlchemyError
 
 from app.core.config import settings
+from app.db.base import SessionLocal
+from app.models.user import User, UserRole
+from app.services.classroom_client import build_classroom_service, classroom_services
+from app.services.credential_store import CredentialStoreError, credential_store
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 class GoogleLoginRequest(BaseModel):
     code: Optional[str] = None
@@ -26,10 +31,6 @@ class LoginResponse(BaseModel):
     token_type: str
     user: dict
 
-_token_store: Dict[str, Dict[str, Any]] = {}
-_token_store_lock = Lock()
-
-
 def _ensure_aware(dt: Optional[datetime]) -> Optional[datetime]:
     if dt is None:
         return None
@@ -39,45 +40,59 @@ def _ensure_aware(dt: Optional[datetime]) -> Optional[datetime]:
 
 def store_user_tokens(google_id: str, token_data: Dict[str, Any], scopes: Optional[List[str]] = None) -> None:
     """
-    Guarda temporalmente los tokens de Google por usuario.
-
-    Solo se usa en desarrollo; en producción debería persistirse en base de datos segura.
+    Guarda los tokens de Google del usuario en el almacén de credenciales compartido.
     """
     if not google_id:
         return
 
-    with _token_store_lock:
-        current_entry = _token_store.get(google_id, {})
-        access_token = token_data.get("access_token") or current_entry.get("access_token")
-        refresh_token = token_data.get("refresh_token") or current_entry.get("refresh_token")
-        expires_in = token_data.get("expires_in")
-        expiry = current_entry.get("expiry")
+    current_entry = credential_store.get(google_id, use_cache=False) or {}
+    access_token = token_data.get("access_token") or current_entry.get("access_token")
+    refresh_token = token_data.get("refresh_token") or current_entry.get("refresh_token")
+    expires_in = token_data.get("expires_in")
+    expiry = current_entry.get("expiry")
 
-        if expires_in:
-            expiry = datetime.now(timezone.utc) + timedelta(seconds=int(expires_in))
-        expiry = _ensure_aware(expiry)
+    if expires_in:
+        expiry = datetime.now(timezone.utc) + timedelta(seconds=int(expires_in))
+    expiry = _ensure_aware(expiry)
 
-        stored_scopes = scopes or current_entry.get("scopes") or _parse_scopes(settings.GOOGLE_CLASSROOM_SCOPES)
+    stored_scopes = scopes or current_entry.get("scopes") or _parse_scopes(settings.GOOGLE_CLASSROOM_SCOPES)
 
-        _token_store[google_id] = {
-            "access_token": access_token,
-            "refresh_token": refresh_token,
-            "expiry": expiry,
-            "scopes": stored_scopes,
-        }
+    credential_store.save(google_id, {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "expiry": expiry,
+        "scopes": stored_scopes,
+    })
 
+    if access_token != current_entry.get("access_token"):
+        classroom_services.invalidate(google_id, current_token=access_token)
 
-def get_credentials_for_user(google_id: str) -> Credentials:
-    """
-    Recupera credenciales de Google para el usuario autenticado, refrescando el token si es necesario.
-    """
-    with _token_store_lock:
-        token_entry = _token_store.get(google_id)
 
-    if not token_entry or not token_entry.get("access_token"):
-        raise HTTPException(status_code=401, detail="No hay credenciales de Google activas. Inicia sesión nuevamente.")
+def list_token_users() -> List[str]:
+    """Retorna los google_id que tienen tokens de Google guardados."""
+    try:
+        return credential_store.list_users()
+    except CredentialStoreError:
+        logger.exception("No se pudo listar a los usuarios con credenciales")
+        return []
 
-    # NO pasar expiry - evita problemas de timezone
+
+# Mayor que el umbral con el que google-auth refresca por su cuenta (3m45s), para que
+# ese refresh interno (fuera del almacén compartido) no llegue a dispararse
+_REQUEST_REFRESH_MARGIN = timedelta(minutes=5)
+
+
+def token_expires_within(token_entry: Dict[str, Any], margin: timedelta) -> bool:
+    expiry = token_entry.get("expiry")
+    return expiry is not None and expiry <= datetime.now(timezone.utc) + margin
+
+
+def _token_expired(token_entry: Dict[str, Any]) -> bool:
+    return token_expires_within(token_entry, _REQUEST_REFRESH_MARGIN)
+
+
+def refresh_token_entry(token_entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Pide a Google un access token nuevo; solo se llama con el lock de refresh tomado."""
     credentials = Credentials(
         token=token_entry.get("access_token"),
         refresh_token=token_entry.get("refresh_token"),
@@ -86,30 +101,53 @@ def get_credentials_for_user(google_id: str) -> Credentials:
         client_secret=settings.GOOGLE_CLIENT_SECRET,
         scopes=token_entry.get("scopes"),
     )
+    credentials.refresh(google_requests.Request())
+    return {
+        "access_token": credentials.token,
+        "refresh_token": credentials.refresh_token or token_entry.get("refresh_token"),
+        "expiry": _ensure_aware(credentials.expiry),
+        "scopes": token_entry.get("scopes"),
+    }
+
 
-    # Verificar si el token está expirado y refrescarlo si es necesario
+def get_credentials_for_user(google_id: str) -> Credentials:
+    """
+    Recupera credenciales de Google para el usuario autenticado.
+
+    Normalmente el token ya viene fresco gracias al refresher de fondo; solo si está por
+    expirar se refresca aquí mismo como respaldo.
+    """
     try:
-        if credentials.expiry and credentials.expired:
-            if not credentials.refresh_token:
+        token_entry = credential_store.get(google_id)
+
+        if token_entry and token_entry.get("access_token") and _token_expired(token_entry):
+            if not token_entry.get("refresh_token"):
                 raise HTTPException(status_code=401, detail="El token de Google ha expirado y no hay refresh token disponible.")
             try:
-                credentials.refresh(google_requests.Request())
+                token_entry = credential_store.refresh(google_id, _token_expired, refresh_token_entry)
             except RefreshError as exc:
                 raise HTTPException(status_code=401, detail=f"No fue posible refrescar el token de Google: {exc}") from exc
+            if token_entry:
+                # Los servicios cacheados quedaron ligados al token anterior
+                classroom_services.invalidate(google_id, current_token=token_entry.get("access_token"))
+    except CredentialStoreError as exc:
+        logger.error("Almacén de credenciales no disponible: %s", exc)
+        raise HTTPException(status_code=503, detail="El almacén de credenciales no está disponible. Intenta de nuevo.") from exc
 
-            with _token_store_lock:
-                _token_store[google_id] = {
-                    "access_token": credentials.token,
-                    "refresh_token": credentials.refresh_token,
-                    "expiry": _ensure_aware(credentials.expiry),
-                    "scopes": token_entry.get("scopes"),
-                }
-    except (TypeError, AttributeError):
-        # Si hay algún problema con la comparación de timezone, simplemente no refrescamos
-        # El token debería funcionar de todos modos
-        pass
+    if not token_entry or not token_entry.get("access_token"):
+        raise HTTPException(status_code=401, detail="No hay credenciales de Google activas. Inicia sesión nuevamente.")
 
-    return credentials
+    expiry = token_entry.get("expiry")
+    return Credentials(
+        token=token_entry.get("access_token"),
+        refresh_token=token_entry.get("refresh_token"),
+        token_uri="https://oauth2.googleapis.com/token",
+        client_id=settings.GOOGLE_CLIENT_ID,
+        client_secret=settings.GOOGLE_CLIENT_SECRET,
+        scopes=token_entry.get("scopes"),
+        # google-auth compara contra utcnow() sin zona horaria
+        expiry=expiry.astimezone(timezone.utc).replace(tzinfo=None) if expiry else None,
+    )
 
 
 def _parse_scopes(raw_scopes: Optional[str]) -> List[str]:
@@ -124,19 +162,14 @@ def _parse_scopes(raw_scopes: Optional[str]) -> List[str]:
         if scope.strip()
     ]
 
-def _detect_user_role_sync(credentials: Credentials) -> str:
+def _detect_user_role_sync(credentials: Credentials, google_id: Optional[str] = None) -> str:
     """
     Lógica sincrónica para detectar el rol del usuario usando la API de Classroom.
 
     Retorna 'profesor' si detecta permisos o cursos de profesor, 'alumno' en caso contrario.
     """
     try:
-        service = build(
-            "classroom",
-            "v1",
-            credentials=credentials,
-            cache_discovery=False
-        )
+        service = build_classroom_service(credentials, google_id=google_id)
 
         # Primero, revisar permisos explícitos de docente
         try:
@@ -176,12 +209,29 @@ def _detect_user_role_sync(credentials: Credentials) -> str:
     # Si no se pudo determinar explícitamente, asumimos alumno
     return "alumno"
 
-async def detect_user_role(credentials: Credentials) -> str:
+async def detect_user_role(credentials: Credentials, google_id: Optional[str] = None) -> str:
     """
     Llama a la versión sincrónica en un thread pool para no bloquear el event loop.
     """
     loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, _detect_user_role_sync, credentials)
+    return await loop.run_in_executor(None, _detect_user_role_sync, credentials, google_id)
+
+def _upsert_user_sync(google_id: str, email: str, name: str, picture: str, role: str) -> None:
+    """
+    Crea o actualiza el usuario local para que la sincronización con Classroom pueda asociarle datos.
+    """
+    try:
+        with SessionLocal() as db:
+            user = db.query(User).filter(User.google_id == google_id).first()
+            if user is None:
+                user = User(google_id=google_id, email=email, rol=UserRole(role))
+                db.add(user)
+            user.nombre = name or email
+            user.foto_url = picture or None
+            user.last_login = datetime.utcnow()
+            db.commit()
+    except SQLAlchemyError:
+        logger.exception("No se pudo registrar al usuario %s en la base de datos", google_id)
 
 async def exchange_code_for_tokens(code: str) -> Dict[str, Any]:
     """
@@ -269,7 +319,7 @@ async def google_login(request: GoogleLoginRequest):
                 scopes=_parse_scopes(settings.GOOGLE_CLASSROOM_SCOPES),
             )
             try:
-                role = await detect_user_role(credentials)
+                role = await detect_user_role(credentials, google_id)
                 store_user_tokens(
                     google_id,
                     token_data,
@@ -284,7 +334,10 @@ async def google_login(request: GoogleLoginRequest):
             if any(keyword in lowered_email for keyword in ("prof", "teacher", "maestro")):
                 role = 'profesor'
 
-        # TODO: Crear o actualizar usuario en la base de datos
+        if google_id and email:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, _upsert_user_sync, google_id, email, name, picture, role)
+
         # TODO: Generar JWT token real
 
         return {
@@ -1,26 +1,38 @@
+import asyncio
+import base64
+import binascii
+import json
 import logging
 import uuid
-from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Tuple, TypeVar
 
-from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from sqlalchemy import desc
+from sqlalchemy import desc, select, tuple_
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
-from app.db.base import get_db
+from app.db.base import get_async_db
 from app.models.chat import ConversacionChat, MensajeChat
 from app.models.user import User
 from app.services.chat_agent import (
+    IncrementalChunker,
     message_buffer,
     split_response_chunks,
     student_support_agent,
 )
+from app.services.chat_persistence import chat_identity_cache, chat_message_writer
 
 router = APIRouter(tags=["chat"])
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+_DISCONNECT_POLL_SECONDS = 0.5
+
 
 class ChatRequest(BaseModel):
     message: str = Field(..., min_length=1, max_length=2000)
@@ -38,6 +50,20 @@ class ChatResponse(BaseModel):
     ai_metadata: Dict[str, Any] = Field(default_factory=dict)
 
 
+class ChatHistoryMessage(BaseModel):
+    id: str
+    sender: str
+    content: str
+    metadata: Optional[Dict[str, Any]] = None
+    created_at: Optional[datetime] = None
+
+
+class ChatHistoryResponse(BaseModel):
+    conversation_id: str
+    messages: List[ChatHistoryMessage] = Field(default_factory=list)
+    next_cursor: Optional[str] = None
+
+
 def _extract_google_id(authorization: str = Header(...)) -> str:
     if not authorization:
         raise HTTPException(status_code=401, detail="Se requiere el encabezado Authorization.")
@@ -61,24 +87,32 @@ def _extract_google_id(authorization: str = Header(...)) -> str:
     return google_id
 
 
-def _get_or_create_conversation(
-    db: Session,
+async def _get_or_create_conversation(
+    db: AsyncSession,
     conversation_id: Optional[str],
     student: Optional[User],
     first_message: str,
-) -> ConversacionChat:
-    if not conversation_id and student is not None:
+) -> Tuple[ConversacionChat, bool]:
+    """
+    Retorna la conversación del turno y si es la activa más reciente del alumno (la que
+    puede guardarse en el caché de identidad).
+    """
+    if student is not None:
         existing = (
-            db.query(ConversacionChat)
-            .filter(
-                ConversacionChat.estudiante_id == student.id,
-                ConversacionChat.activa.is_(True)
+            await db.execute(
+                select(ConversacionChat)
+                .where(
+                    ConversacionChat.estudiante_id == student.id,
+                    # Igual que el predicado de idx_conversaciones_estudiante_activa: con
+                    # "activa IS TRUE" Postgres no reconoce el índice parcial
+                    ConversacionChat.activa,
+                )
+                .order_by(desc(ConversacionChat.created_at))
+                .limit(1)
             )
-            .order_by(desc(ConversacionChat.created_at))
-            .first()
-        )
-        if existing:
-            return existing
+        ).scalars().first()
+        if existing and (not conversation_id or conversation_id == str(existing.id)):
+            return existing, True
 
     if conversation_id:
         try:
@@ -86,11 +120,15 @@ def _get_or_create_conversation(
         except ValueError as exc:
             raise HTTPException(status_code=400, detail="conversation_id inválido.") from exc
 
-        conversation = db.get(ConversacionChat, conversation_uuid)
-        if conversation:
-            return conversation
+        conversation = await db.get(ConversacionChat, conversation_uuid)
+        # Solo se continúa una conversación del mismo alumno: su historial se carga en el prompt
+        if conversation and conversation.estudiante_id == getattr(student, "id", None):
+            return conversation, False
 
-        logger.warning("Conversación %s no encontrada; se creará una nueva.", conversation_id)
+        if conversation:
+            logger.warning("Conversación %s no pertenece al usuario; se creará una nueva.", conversation_id)
+        else:
+            logger.warning("Conversación %s no encontrada; se creará una nueva.", conversation_id)
 
     conversation = ConversacionChat(
         estudiante_id=getattr(student, "id", None),
@@ -98,37 +136,57 @@ def _get_or_create_conversation(
         activa=True,
     )
     db.add(conversation)
-    db.flush()
-    return conversation
+    await db.flush()
+    return conversation, student is not None
 
 
-@router.post("/api/chat", response_model=ChatResponse)
-async def chat_with_agent(
+FALLBACK_RESPONSE = "Necesité un momento, pero estoy aquí contigo. ¿Quieres que lo intentemos de nuevo?"
+
+
+def _ai_metadata() -> Dict[str, Any]:
+    return {
+        "model": student_support_agent.model_name,
+        "temperature": student_support_agent.temperature,
+    }
+
+
+async def _prepare_session(
+    db: AsyncSession,
+    google_id: str,
     payload: ChatRequest,
-    google_id: str = Depends(_extract_google_id),
-    db: Session = Depends(get_db),
-):
-    if not settings.OPENAI_API_KEY:
-        raise HTTPException(status_code=500, detail="No hay OpenAI API Key configurada.")
+) -> Tuple[Optional[uuid.UUID], str]:
+    """
+    Busca al alumno y su conversación; sin base de datos se sigue solo con memoria.
+
+    Retorna el id de la conversación ya confirmada (o None si no hay persistencia) y el id de
+    sesión del agente. Si el turno sigue en la conversación activa del alumno y está en el
+    caché de identidad, no se consulta la base.
+    """
+    cached = await chat_identity_cache.get(google_id)
+    if cached is not None:
+        _, active_conversation_id = cached
+        if not payload.conversation_id or payload.conversation_id == str(active_conversation_id):
+            return active_conversation_id, str(active_conversation_id)
 
     db_available = True
     try:
         student: Optional[User] = (
-            db.query(User).filter(User.google_id == google_id).first()
-        )
+            await db.execute(select(User).where(User.google_id == google_id))
+        ).scalars().first()
     except SQLAlchemyError as exc:
         db_available = False
         logger.exception("Error consultando usuario %s; se continuará sin persistencia.", google_id)
         try:
-            db.rollback()
+            await db.rollback()
         except Exception:  # pragma: no cover - rollback best-effort
             pass
         student = None
 
     try:
         conversation = None
+        is_active = False
         if db_available:
-            conversation = _get_or_create_conversation(
+            conversation, is_active = await _get_or_create_conversation(
                 db=db,
                 conversation_id=payload.conversation_id,
                 student=student,
@@ -142,10 +200,98 @@ async def chat_with_agent(
             raise HTTPException(status_code=500, detail="No se pudo preparar la conversación.") from exc
         conversation = None
 
-    if conversation:
-        session_id = str(conversation.id)
-    else:
-        session_id = payload.conversation_id or f"mem-{google_id}"
+    if not conversation:
+        # Sin base no se puede verificar a quién pertenece el conversation_id recibido: la sesión
+        # en memoria queda ligada al usuario para no cargar (ni rehidratar) una ajena
+        return None, f"mem-{google_id}"
+
+    conversation_id = conversation.id
+    # Los mensajes se guardan después y fuera de esta sesión (cola de escritura diferida),
+    # así que la conversación tiene que quedar confirmada desde ahora
+    try:
+        await db.commit()
+    except SQLAlchemyError:
+        logger.exception("Error guardando conversación %s", conversation_id)
+        await db.rollback()
+        return None, str(conversation_id)
+
+    if is_active:
+        # Una conversación recién creada reemplaza a la que hubiera en el caché
+        await chat_identity_cache.remember(google_id, student.id, conversation_id)
+    return conversation_id, str(conversation_id)
+
+
+async def _persist_exchange(
+    conversation_id: uuid.UUID,
+    utterances: List[str],
+    user_metadata: Dict[str, Any],
+    bot_content: str,
+    chunk_count: int,
+    message_ids: List[str],
+) -> None:
+    """Encola el intercambio para guardarlo en segundo plano; la respuesta no espera a la base."""
+    bot_metadata = {**_ai_metadata(), "chunks": chunk_count}
+    # Marcas de tiempo estrictamente crecientes: el historial se ordena por (created_at, id)
+    # y el id es aleatorio, así que un empate podría invertir pregunta y respuesta
+    created_at = datetime.utcnow()
+
+    # Mismos ids que usa la memoria del agente (ver StudentSupportAgent.arun)
+    messages = [
+        {
+            "id": uuid.UUID(message_ids[position]),
+            "remitente": "user",
+            "contenido": utterance,
+            "metadata_json": dict(user_metadata or {}) or None,
+            "created_at": created_at + timedelta(microseconds=position),
+        }
+        for position, utterance in enumerate(utterances)
+    ]
+    messages.append({
+        "id": uuid.UUID(message_ids[-1]),
+        "remitente": "bot",
+        "contenido": bot_content,
+        "metadata_json": bot_metadata,
+        "created_at": created_at + timedelta(microseconds=len(utterances)),
+    })
+
+    try:
+        await chat_message_writer.submit(conversation_id, messages)
+    except (SQLAlchemyError, OSError):
+        # La respuesta ya se generó: si la base no responde se registra sin tumbar el turno
+        logger.exception("Error persistiendo conversación %s", conversation_id)
+
+
+async def _cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Espera ``awaitable`` pero lo cancela si el cliente cierra la conexión, para no seguir
+    pagando una respuesta del modelo que nadie va a leer.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=_DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                logger.info("Cliente desconectado; se canceló la respuesta del asistente.")
+                raise HTTPException(status_code=499, detail="El cliente cerró la conexión.")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+@router.post("/api/chat", response_model=ChatResponse)
+async def chat_with_agent(
+    payload: ChatRequest,
+    request: Request,
+    google_id: str = Depends(_extract_google_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if not settings.OPENAI_API_KEY:
+        raise HTTPException(status_code=500, detail="No hay OpenAI API Key configurada.")
+
+    conversation_id, session_id = await _prepare_session(db, google_id, payload)
 
     bundle, is_primary = await message_buffer.collect(
         session_id=session_id,
@@ -160,63 +306,228 @@ async def chat_with_agent(
             conversation_id=session_id,
             queued_messages=max(0, len(bundle["utterances"]) - 1),
             buffered=True,
-            ai_metadata={
-                "model": student_support_agent.model_name,
-                "temperature": student_support_agent.temperature,
-            },
+            ai_metadata=_ai_metadata(),
         )
 
+    message_ids = [str(uuid.uuid4()) for _ in range(len(bundle["utterances"]) + 1)]
     try:
-        ai_message = await student_support_agent.arun(
-            session_id=session_id,
-            user_message=bundle["utterances"],
-            context=bundle["context"],
+        ai_message = await _cancel_on_disconnect(
+            request,
+            student_support_agent.arun(
+                session_id=session_id,
+                user_message=bundle["utterances"],
+                context=bundle["context"],
+                message_ids=message_ids,
+            ),
         )
     except HTTPException:
         raise
+    except asyncio.TimeoutError as exc:
+        logger.warning("El modelo no respondió a tiempo para usuario %s", google_id)
+        raise HTTPException(status_code=504, detail="El asistente tardó demasiado en responder.") from exc
     except Exception as exc:
         logger.exception("Error obteniendo respuesta de IA para usuario %s", google_id)
         raise HTTPException(status_code=502, detail="No pudimos obtener respuesta del asistente.") from exc
 
-    chunks = split_response_chunks(ai_message.content) or [
-        "Necesité un momento, pero estoy aquí contigo. ¿Quieres que lo intentemos de nuevo?"
-    ]
+    chunks = split_response_chunks(ai_message.content) or [FALLBACK_RESPONSE]
 
-    if db_available and conversation:
-        try:
-            user_metadata = dict(payload.metadata or {})
-            bot_metadata = {
-                "model": student_support_agent.model_name,
-                "temperature": student_support_agent.temperature,
-                "chunks": len(chunks),
-            }
-
-            for utterance in bundle["utterances"]:
-                db.add(MensajeChat(
-                    conversacion_id=conversation.id,
-                    remitente="user",
-                    contenido=utterance,
-                    metadata_json=user_metadata or None,
-                ))
-
-            db.add(MensajeChat(
-                conversacion_id=conversation.id,
-                remitente="bot",
-                contenido=ai_message.content,
-                metadata_json=bot_metadata,
-            ))
-            db.commit()
-        except SQLAlchemyError as exc:
-            logger.exception("Error persistiendo conversación %s", conversation.id)
-            db.rollback()
+    if conversation_id:
+        await _persist_exchange(
+            conversation_id,
+            bundle["utterances"],
+            payload.metadata,
+            ai_message.content,
+            len(chunks),
+            message_ids,
+        )
 
     return ChatResponse(
         responses=chunks,
         response=chunks[0] if chunks else "",
         conversation_id=session_id,
         queued_messages=max(0, len(bundle["utterances"]) - 1),
-        ai_metadata={
-            "model": student_support_agent.model_name,
-            "temperature": student_support_agent.temperature,
-        },
+        ai_metadata=_ai_metadata(),
+    )
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/api/chat/stream")
+async def stream_chat_with_agent(
+    payload: ChatRequest,
+    google_id: str = Depends(_extract_google_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Variante de /api/chat con Server-Sent Events.
+
+    Eventos: ``meta`` (id de conversación y si el mensaje quedó agrupado con otros), ``token``
+    (texto conforme lo genera el modelo), ``chunk`` (cada mensaje en cuanto queda completo,
+    con las mismas reglas que /api/chat), ``done`` (respuesta final, ya encolada para guardarse) y ``error``.
+    Si el cliente se desconecta, Starlette cancela el generador y con él la llamada al modelo.
+    """
+    if not settings.OPENAI_API_KEY:
+        raise HTTPException(status_code=500, detail="No hay OpenAI API Key configurada.")
+
+    conversation_id, session_id = await _prepare_session(db, google_id, payload)
+
+    async def event_stream() -> AsyncIterator[str]:
+        bundle, is_primary = await message_buffer.collect(
+            session_id=session_id,
+            message=payload.message,
+            context=payload.context,
+        )
+        queued_messages = max(0, len(bundle["utterances"]) - 1)
+        yield _sse("meta", {
+            "conversation_id": session_id,
+            "queued_messages": queued_messages,
+            "buffered": not is_primary,
+        })
+
+        if not is_primary:
+            yield _sse("done", {
+                "responses": [],
+                "response": "",
+                "conversation_id": session_id,
+                "queued_messages": queued_messages,
+                "buffered": True,
+                "ai_metadata": _ai_metadata(),
+            })
+            return
+
+        chunker = IncrementalChunker()
+        chunks: List[str] = []
+        parts: List[str] = []
+        message_ids = [str(uuid.uuid4()) for _ in range(len(bundle["utterances"]) + 1)]
+        try:
+            async for delta in student_support_agent.astream(
+                session_id=session_id,
+                user_message=bundle["utterances"],
+                context=bundle["context"],
+                message_ids=message_ids,
+            ):
+                parts.append(delta)
+                yield _sse("token", {"text": delta})
+                for chunk in chunker.feed(delta):
+                    yield _sse("chunk", {"index": len(chunks), "text": chunk})
+                    chunks.append(chunk)
+        except asyncio.TimeoutError:
+            logger.warning("El modelo no respondió a tiempo para usuario %s", google_id)
+            yield _sse("error", {"detail": "El asistente tardó demasiado en responder."})
+            return
+        except Exception:
+            logger.exception("Error obteniendo respuesta de IA para usuario %s", google_id)
+            yield _sse("error", {"detail": "No pudimos obtener respuesta del asistente."})
+            return
+
+        for chunk in chunker.finish() or ([] if chunks else [FALLBACK_RESPONSE]):
+            yield _sse("chunk", {"index": len(chunks), "text": chunk})
+            chunks.append(chunk)
+
+        content = "".join(parts)
+        if conversation_id is not None:
+            await _persist_exchange(
+                conversation_id,
+                bundle["utterances"],
+                payload.metadata,
+                content,
+                len(chunks),
+                message_ids,
+            )
+
+        yield _sse("done", {
+            "responses": chunks,
+            "response": chunks[0],
+            "conversation_id": session_id,
+            "queued_messages": queued_messages,
+            "buffered": False,
+            "ai_metadata": _ai_metadata(),
+        })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _encode_cursor(created_at: datetime, message_id: uuid.UUID) -> str:
+    raw = json.dumps([created_at.isoformat(), str(message_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, message_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), uuid.UUID(message_id)
+    except (binascii.Error, ValueError, TypeError) as exc:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido.") from exc
+
+
+@router.get("/api/chat/conversations/{conversation_id}/messages", response_model=ChatHistoryResponse)
+async def get_chat_history(
+    conversation_id: str,
+    limit: int = Query(default=30, ge=1, le=100),
+    cursor: Optional[str] = Query(default=None),
+    google_id: str = Depends(_extract_google_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Historial de una conversación del alumno, de lo más reciente hacia atrás.
+
+    Cada página viene en orden cronológico; ``next_cursor`` pide la página anterior. La
+    paginación es por llave (created_at, id) sobre el índice de la conversación, así que
+    cualquier página cuesta lo mismo sin importar qué tan larga sea la conversación.
+    """
+    try:
+        conversation_uuid = uuid.UUID(conversation_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="conversation_id inválido.") from exc
+
+    query = (
+        select(MensajeChat)
+        .join(ConversacionChat, ConversacionChat.id == MensajeChat.conversacion_id)
+        .join(User, User.id == ConversacionChat.estudiante_id)
+        .where(MensajeChat.conversacion_id == conversation_uuid, User.google_id == google_id)
+        .order_by(MensajeChat.created_at.desc(), MensajeChat.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        created_at, message_id = _decode_cursor(cursor)
+        query = query.where(tuple_(MensajeChat.created_at, MensajeChat.id) < tuple_(created_at, message_id))
+
+    try:
+        rows = list((await db.execute(query)).scalars())
+        if not rows and not cursor:
+            owned = (
+                await db.execute(
+                    select(ConversacionChat.id)
+                    .join(User, User.id == ConversacionChat.estudiante_id)
+                    .where(ConversacionChat.id == conversation_uuid, User.google_id == google_id)
+                )
+            ).first()
+            if owned is None:
+                raise HTTPException(status_code=404, detail="Conversación no encontrada.")
+    except SQLAlchemyError as exc:
+        logger.exception("Error leyendo el historial de la conversación %s", conversation_id)
+        raise HTTPException(status_code=503, detail="No se pudo leer el historial.") from exc
+
+    page = rows[:limit]
+    next_cursor = _encode_cursor(page[-1].created_at, page[-1].id) if len(rows) > limit else None
+    return ChatHistoryResponse(
+        conversation_id=conversation_id,
+        messages=[
+            ChatHistoryMessage(
+                id=str(message.id),
+                sender=message.remitente,
+                content=message.contenido,
+                metadata=message.metadata_json,
+                created_at=message.created_at,
+            )
+            for message in reversed(page)
+        ],
+        next_cursor=next_cursor,
     )
@@ -1,7 +1,8 @@
 import asyncio
 import logging
+from functools import partial
 
-from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from googleapiclient.errors import HttpError
 
 from app.services.google_classroom import (
@@ -12,6 +13,8 @@ from app.services.google_classroom import (
     get_assignment_detail,
     get_prioritized_tasks_with_ai,
 )
+from app.services.classroom_sync import load_synced_student_dashboard
+from app.services.response_cache import dashboard_cache
 
 router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
 logger = logging.getLogger(__name__)
@@ -40,12 +43,32 @@ def _extract_google_id(authorization: str = Header(...)) -> str:
     return google_id
 
 
+# Solo el dashboard de alumno lee de Postgres. La sincronización no guarda lo que necesitan el
+# dashboard de profesor (roster y entregas de todos los alumnos), la lista de cursos (roster y
+# profesor) ni el detalle de curso (materiales y enlaces), así que esos endpoints siguen
+# consultando Classroom en vivo en cada fallo del caché.
+def _load_student_dashboard(google_id: str):
+    # Postgres sincronizado primero; Classroom en vivo si el usuario aún no se sincroniza
+    synced = load_synced_student_dashboard(google_id)
+    if synced is not None:
+        return synced
+    return get_student_dashboard_data(google_id)
+
+
+def _set_cache_headers(response: Response, status: str, age: int) -> None:
+    response.headers["X-Cache"] = status
+    response.headers["Age"] = str(age)
+
+
 @router.get("/student")
-async def get_student_dashboard(google_id: str = Depends(_extract_google_id)):
+async def get_student_dashboard(response: Response, google_id: str = Depends(_extract_google_id)):
     """Obtiene datos del dashboard para alumnos desde Google Classroom."""
-    loop = asyncio.get_running_loop()
     try:
-        data = await loop.run_in_executor(None, get_student_dashboard_data, google_id)
+        data, cache_status, age = await dashboard_cache.fetch(
+            ("student", google_id),
+            partial(_load_student_dashboard, google_id),
+        )
+        _set_cache_headers(response, cache_status, age)
         return data
     except HttpError as exc:
         logger.exception("Error consultando Classroom para alumno %s", google_id)
@@ -64,11 +87,14 @@ async def get_student_dashboard(google_id: str = Depends(_extract_google_id)):
 
 
 @router.get("/teacher")
-async def get_teacher_dashboard(google_id: str = Depends(_extract_google_id)):
+async def get_teacher_dashboard(response: Response, google_id: str = Depends(_extract_google_id)):
     """Obtiene datos del dashboard para profesores desde Google Classroom."""
-    loop = asyncio.get_running_loop()
     try:
-        data = await loop.run_in_executor(None, get_teacher_dashboard_data, google_id)
+        data, cache_status, age = await dashboard_cache.fetch(
+            ("teacher", google_id),
+            partial(get_teacher_dashboard_data, google_id),
+        )
+        _set_cache_headers(response, cache_status, age)
         return data
     except HttpError as exc:
         logger.exception("Error consultando Classroom para profesor %s", google_id)
@@ -87,11 +113,14 @@ async def get_teacher_dashboard(google_id: str = Depends(_extract_google_id)):
 
 
 @router.get("/student/courses")
-async def get_courses(google_id: str = Depends(_extract_google_id)):
+async def get_courses(response: Response, google_id: str = Depends(_extract_google_id)):
     """Obtiene la lista completa de cursos del estudiante."""
-    loop = asyncio.get_running_loop()
     try:
-        data = await loop.run_in_executor(None, get_student_courses, google_id)
+        data, cache_status, age = await dashboard_cache.fetch(
+            ("courses", google_id),
+            partial(get_student_courses, google_id),
+        )
+        _set_cache_headers(response, cache_status, age)
         return data
     except HttpError as exc:
         logger.exception("Error consultando cursos para alumno %s", google_id)
@@ -110,11 +139,14 @@ async def get_courses(google_id: str = Depends(_extract_google_id)):
 
 
 @router.get("/student/courses/{course_id}")
-async def get_course(course_id: str, google_id: str = Depends(_extract_google_id)):
+async def get_course(course_id: str, response: Response, google_id: str = Depends(_extract_google_id)):
     """Obtiene detalles de un curso específico."""
-    loop = asyncio.get_running_loop()
     try:
-        data = await loop.run_in_executor(None, get_course_detail, google_id, course_id)
+        data, cache_status, age = await dashboard_cache.fetch(
+            ("course", google_id, course_id),
+            partial(get_course_detail, google_id, course_id),
+        )
+        _set_cache_headers(response, cache_status, age)
         return data
     except HttpError as exc:
         logger.exception("Error consultando curso %s para alumno %s", course_id, google_id)
@@ -171,10 +203,8 @@ async def get_prioritized_tasks(google_id: str = Depends(_extract_google_id)):
 
     Retorna tareas ordenadas por prioridad con metadata de IA.
     """
-    loop = asyncio.get_running_loop()
     try:
-        data = await loop.run_in_executor(None, get_prioritized_tasks_with_ai, google_id)
-        return data
+        return await get_prioritized_tasks_with_ai(google_id)
     except HttpError as exc:
         logger.exception("Error consultando tareas priorizadas para alumno %s", google_id)
         raise HTTPException(
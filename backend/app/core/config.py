@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 class Settings(BaseSettings):
     # App
@@ -9,6 +9,14 @@ class Settings(BaseSettings):
 
     # Database
     DATABASE_URL: str
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 10.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800  # 30 minutes
+    DB_POOL_PRE_PING: bool = False  # ping en cada checkout; por defecto solo a conexiones inactivas
+    DB_POOL_IDLE_PING_SECONDS: int = 300
+    DB_STATEMENT_TIMEOUT_MS: int = 15000
+    DB_ECHO: bool = False
 
     # Security
     SECRET_KEY: str
@@ -20,15 +28,64 @@ class Settings(BaseSettings):
     GOOGLE_CLIENT_SECRET: str
     GOOGLE_REDIRECT_URI: str
     GOOGLE_CLASSROOM_SCOPES: str
+    CLASSROOM_MAX_CONCURRENCY: int = 8  # llamadas simultáneas por proceso
+    CLASSROOM_SERVICE_CACHE_SIZE: int = 256
+    CLASSROOM_SERVICE_CACHE_TTL_SECONDS: int = 900  # 15 minutes
+
+    # Almacén de credenciales OAuth: "memory" (un solo proceso), "redis" o "postgres"
+    CREDENTIAL_STORE_BACKEND: str = "memory"
+    CREDENTIAL_CACHE_TTL_SECONDS: int = 30
+    CREDENTIAL_REFRESH_LOCK_TIMEOUT_SECONDS: int = 30
+    # Llaves Fernet para cifrar los tokens en Redis/Postgres, separadas por coma (la primera cifra,
+    # las demás solo descifran, para rotarlas). Sin valor se deriva una de SECRET_KEY
+    CREDENTIAL_ENCRYPTION_KEY: Optional[str] = None
+
+    # Refresh proactivo de tokens OAuth
+    TOKEN_REFRESH_ENABLED: bool = True
+    TOKEN_REFRESH_SCAN_INTERVAL_SECONDS: int = 60
+    TOKEN_REFRESH_WINDOW_SECONDS: int = 600  # refrescar si expira en menos de 10 minutos
+    TOKEN_REFRESH_JITTER_SECONDS: int = 120
+    TOKEN_REFRESH_MAX_CONCURRENCY: int = 4
+
+    # Classroom -> Postgres sync
+    CLASSROOM_SYNC_ENABLED: bool = True
+    CLASSROOM_SYNC_INTERVAL_SECONDS: int = 300  # 5 minutes
+    CLASSROOM_SYNC_MAX_CONCURRENCY: int = 4
+    CLASSROOM_SYNC_MAX_STALENESS_SECONDS: int = 900  # después de esto se consulta Classroom en vivo
+
+    # Redis (opcional; sin URL se usan cachés en memoria)
+    REDIS_URL: Optional[str] = None
+
+    # Dashboard cache
+    DASHBOARD_CACHE_SOFT_TTL_SECONDS: int = 60
+    DASHBOARD_CACHE_HARD_TTL_SECONDS: int = 900  # 15 minutes
+    DASHBOARD_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
 
     # AI/ML
     OPENAI_API_KEY: str
     OPENAI_MODEL: str = "gpt-3.5-turbo"
+    OPENAI_TIMEOUT_SECONDS: float = 30.0
+    OPENAI_MAX_CONNECTIONS: int = 20
+    AI_PRIORITY_CACHE_TTL_SECONDS: int = 604800  # 7 days; la llave cambia si la tarea se edita
+    AI_PRIORITY_BATCH_SIZE: int = 20  # tareas por llamada al modelo
+    AI_PRIORITY_WAIT_SECONDS: float = 2.0  # después se responde con el orden local y la IA sigue en segundo plano
+    AI_PRIORITY_CACHE_MAX_BYTES: int = 8 * 1024 * 1024
     CHAT_OPENAI_MODEL: str = "gpt-4o"
     CHAT_TEMPERATURE: float = 0.7
+    CHAT_LLM_TIMEOUT_SECONDS: float = 45.0
     CHAT_SESSION_TTL_SECONDS: int = 1800  # 30 minutes
     CHAT_MEMORY_MAX_MESSAGES: int = 20
+    CHAT_MEMORY_MAX_SESSIONS: int = 5000  # tope del caché local; las sesiones menos usadas salen primero
+    CHAT_HISTORY_TOKEN_BUDGET: int = 1500  # tokens de historial literal por turno; lo anterior va resumido
+    CHAT_SUMMARY_ENABLED: bool = True
+    CHAT_SUMMARY_MODEL: str = "gpt-4o-mini"
+    CHAT_SUMMARY_MAX_TOKENS: int = 300
     CHAT_BUFFER_SECONDS: float = 0.6
+    CHAT_BUFFER_BACKEND: str = "memory"  # "memory" (un solo worker) o "redis" (varios workers)
+    CHAT_PERSIST_BATCH_SIZE: int = 200
+    CHAT_PERSIST_FLUSH_INTERVAL_SECONDS: float = 0.5
+    CHAT_PERSIST_MAX_QUEUE: int = 20000
+    CHAT_IDENTITY_CACHE_TTL_SECONDS: int = 300  # alumno y conversación activa por google_id
 
     # CORS
     CORS_ORIGINS: List[str] = [
@@ -0,0 +1,42 @@
+import logging
+
+from app.core.config import settings
+
+try:
+    import redis
+    import redis.asyncio as redis_asyncio
+except ImportError:  # pragma: no cover - redis es opcional
+    redis = None
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_async_client = None
+
+
+def get_redis():
+    """
+    Cliente Redis sincrónico compartido, o None si no hay REDIS_URL o falta la librería.
+    """
+    global _client
+    if _client is None and settings.REDIS_URL and redis is not None:
+        _client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _client
+
+
+def get_async_redis():
+    """
+    Cliente Redis asíncrono compartido, o None si no hay REDIS_URL o falta la librería.
+    """
+    global _async_client
+    if _async_client is None and settings.REDIS_URL and redis_asyncio is not None:
+        _async_client = redis_asyncio.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _async_client
+
+
+def redis_errors() -> tuple:
+    """Excepciones a tratar como 'Redis no disponible' para caer al backend en memoria."""
+    if redis is None:
+        return (ConnectionError,)
+    return (redis.RedisError, ConnectionError, OSError)
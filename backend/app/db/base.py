@@ -1,17 +1,49 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.db.pool import (
+    async_pool_metrics,
+    engine_options,
+    install_idle_liveness_check,
+    sync_pool_metrics,
+)
+
+
+def _async_database_url(url: str):
+    """Deriva la URL asyncpg a partir de DATABASE_URL (la versión sincrónica sigue usando psycopg2)."""
+    parsed = make_url(url)
+    query = dict(parsed.query)
+    # asyncpg no entiende sslmode; su equivalente es ssl
+    if "sslmode" in query:
+        query["ssl"] = query.pop("sslmode")
+    return parsed.set(drivername="postgresql+asyncpg", query=query)
 
-# Create database engine
+
+# Create database engine (sincrónico: Alembic, sincronización con Classroom y scripts)
 engine = create_engine(
     settings.DATABASE_URL,
-    pool_pre_ping=True,
-    echo=settings.DEBUG
+    **engine_options(async_driver=False)
 )
+install_idle_liveness_check(engine, sync_pool_metrics)
+
+# Create async engine para el camino de peticiones de FastAPI
+async_engine = create_async_engine(
+    _async_database_url(settings.DATABASE_URL),
+    **engine_options(async_driver=True)
+)
+install_idle_liveness_check(async_engine.sync_engine, async_pool_metrics)
 
 # Create sessionmaker
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
 
 # Create base class for models
 Base = declarative_base()
@@ -23,3 +55,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Dependency to get async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
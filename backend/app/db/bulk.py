@@ -0,0 +1,79 @@
+from typing import Any, Dict, List
+
+from sqlalchemy import literal_column, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from typing_extensions import TypedDict
+
+
+class UpsertResult(TypedDict):
+    inserted: int
+    updated: int
+    skipped: int
+    ids: Dict[str, Any]
+
+
+def empty_result() -> UpsertResult:
+    return {"inserted": 0, "updated": 0, "skipped": 0, "ids": {}}
+
+
+def bulk_upsert(
+    db: Session,
+    model,
+    rows: List[Dict[str, Any]],
+    conflict_column: str = "classroom_id",
+    version_column: str = "classroom_updated_at",
+    chunk_size: int = 500,
+) -> UpsertResult:
+    """
+    Inserta o actualiza filas con INSERT ... ON CONFLICT DO UPDATE en bloques de ``chunk_size``.
+
+    Las filas cuyo ``version_column`` no cambió se dejan intactas (cuentan como omitidas).
+    Retorna los conteos y el mapa ``conflict_column -> id`` de todas las filas recibidas.
+    """
+    result = empty_result()
+    if not rows:
+        return result
+
+    table = model.__table__
+    key_column = table.c[conflict_column]
+    version = table.c[version_column]
+
+    # Un mismo INSERT no puede tocar dos veces la misma fila: nos quedamos con la última versión
+    deduplicated = list({row[conflict_column]: row for row in rows}.values())
+
+    # Se compila una sola vez; SQLAlchemy agrupa cada bloque en INSERTs multi-fila (insertmanyvalues)
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[conflict_column],
+        set_={
+            column: stmt.excluded[column]
+            for column in deduplicated[0]
+            if column != conflict_column
+        },
+        where=version.is_distinct_from(stmt.excluded[version_column]),
+    ).returning(
+        key_column,
+        table.c.id,
+        # xmax = 0 solo en filas recién insertadas
+        literal_column("(xmax = 0)").label("inserted"),
+    )
+
+    for start in range(0, len(deduplicated), chunk_size):
+        chunk = deduplicated[start:start + chunk_size]
+        written = db.execute(stmt, chunk).all()
+        for key, row_id, inserted in written:
+            result["ids"][key] = row_id
+            if inserted:
+                result["inserted"] += 1
+            else:
+                result["updated"] += 1
+
+        skipped_keys = [row[conflict_column] for row in chunk if row[conflict_column] not in result["ids"]]
+        result["skipped"] += len(skipped_keys)
+        if skipped_keys:
+            result["ids"].update(
+                db.execute(select(key_column, table.c.id).where(key_column.in_(skipped_keys))).all()
+            )
+
+    return result
@@ -0,0 +1,153 @@
+import logging
+import time
+from threading import Lock
+from typing import Any, Dict, Type
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics:
+    """
+    Contadores de un pool de conexiones: espera al hacer checkout, desbordes y timeouts.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = Lock()
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.liveness_failures = 0
+
+    def record_checkout(self, wait_seconds: float, overflowed: bool) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+            if overflowed:
+                self.overflow_events += 1
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def record_liveness_failure(self) -> None:
+        with self._lock:
+            self.liveness_failures += 1
+
+    def snapshot(self, pool: QueuePool) -> Dict[str, Any]:
+        with self._lock:
+            average_wait = self.wait_seconds_total / self.checkouts if self.checkouts else 0.0
+            return {
+                "pool_size": pool.size(),
+                "in_use": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+                "checkouts": self.checkouts,
+                "checkout_wait_avg_ms": round(average_wait * 1000, 3),
+                "checkout_wait_max_ms": round(self.wait_seconds_max * 1000, 3),
+                "overflow_events": self.overflow_events,
+                "timeouts": self.timeouts,
+                "liveness_failures": self.liveness_failures,
+            }
+
+
+def _instrumented(base: Type[QueuePool], metrics: PoolMetrics) -> Type[QueuePool]:
+    """
+    Crea una subclase del pool que mide cuánto espera cada checkout.
+
+    Se usa una clase (y no un atributo de instancia) porque SQLAlchemy recrea el pool
+    con ``self.__class__`` al invalidarlo.
+    """
+
+    class InstrumentedPool(base):  # type: ignore[misc, valid-type]
+        def _do_get(self):
+            overflow_before = self._overflow
+            started = time.perf_counter()
+            try:
+                record = super()._do_get()
+            except exc.TimeoutError:
+                metrics.record_timeout()
+                raise
+            overflowed = self._overflow > overflow_before and self._overflow > 0
+            metrics.record_checkout(time.perf_counter() - started, overflowed)
+            return record
+
+    InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+    return InstrumentedPool
+
+
+sync_pool_metrics = PoolMetrics("sync")
+async_pool_metrics = PoolMetrics("async")
+
+
+def engine_options(async_driver: bool) -> Dict[str, Any]:
+    """
+    Opciones comunes de ``create_engine`` / ``create_async_engine`` leídas de Settings.
+    """
+    if async_driver:
+        poolclass = _instrumented(AsyncAdaptedQueuePool, async_pool_metrics)
+        connect_args: Dict[str, Any] = {}
+        if settings.DB_STATEMENT_TIMEOUT_MS:
+            connect_args["server_settings"] = {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)}
+    else:
+        poolclass = _instrumented(QueuePool, sync_pool_metrics)
+        connect_args = {}
+        if settings.DB_STATEMENT_TIMEOUT_MS:
+            connect_args["options"] = f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"
+
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_use_lifo": True,
+        "connect_args": connect_args,
+        "echo": settings.DB_ECHO,
+    }
+
+
+def install_idle_liveness_check(engine: Engine, metrics: PoolMetrics) -> None:
+    """
+    Hace ping solo a conexiones que estuvieron inactivas más de DB_POOL_IDLE_PING_SECONDS.
+
+    Con pool_use_lifo las conexiones calientes se reutilizan primero, así que el ping
+    (un viaje extra al servidor) casi nunca ocurre en el camino caliente.
+    """
+    idle_threshold = settings.DB_POOL_IDLE_PING_SECONDS
+    if settings.DB_POOL_PRE_PING or idle_threshold <= 0:
+        return
+
+    @event.listens_for(engine, "checkin")
+    def _mark_checkin(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(engine, "checkout")
+    def _ping_if_idle(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_threshold:
+            return
+        try:
+            engine.dialect.do_ping(dbapi_connection)
+        except Exception as error:
+            metrics.record_liveness_failure()
+            logger.warning("Conexión inactiva descartada por fallar el ping: %s", error)
+            # El pool descarta esta conexión y reintenta con una nueva
+            raise exc.DisconnectionError() from error
+
+
+def pool_status(sync_engine: Engine, async_sync_engine: Engine) -> Dict[str, Any]:
+    return {
+        "sync": sync_pool_metrics.snapshot(sync_engine.pool),
+        "async": async_pool_metrics.snapshot(async_sync_engine.pool),
+    }
@@ -1,6 +1,13 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.db.base import async_engine, engine
+from app.db.pool import pool_status
+from app.services.classroom_sync import classroom_sync_worker
+from app.services.token_refresher import token_refresh_worker
+from app.services.ai_task_prioritizer import close_client as close_openai_client
+from app.services.chat_agent import message_buffer, prompt_cache_metrics
+from app.services.chat_persistence import chat_identity_cache, chat_message_writer
 
 app = FastAPI(
     title="CALMA TECH API",
@@ -17,6 +24,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_background_workers():
+    chat_message_writer.start()
+    if settings.TOKEN_REFRESH_ENABLED:
+        token_refresh_worker.start()
+    if settings.CLASSROOM_SYNC_ENABLED:
+        classroom_sync_worker.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await classroom_sync_worker.stop()
+    await token_refresh_worker.stop()
+    # Vacía la cola de mensajes de chat antes de que termine el proceso
+    await chat_message_writer.stop()
+    await close_openai_client()
+
 @app.get("/")
 async def root():
     return {
@@ -29,6 +52,21 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/db")
+async def database_pool_health():
+    """Métricas de los pools de conexiones (espera de checkout, conexiones en uso, desbordes)."""
+    return pool_status(engine, async_engine.sync_engine)
+
+@app.get("/health/chat")
+async def chat_buffer_health():
+    """Métricas del chat: buffer de mensajes (cola, retraso de flush) y tokens de prompt cacheados."""
+    return {
+        "buffer": message_buffer.stats(),
+        "prompt_cache": prompt_cache_metrics.snapshot(),
+        "persistence": chat_message_writer.stats(),
+        "identity": chat_identity_cache.stats(),
+    }
+
 # Include routers
 from app.api.auth import router as auth_router
 from app.api.dashboard import router as dashboard_router
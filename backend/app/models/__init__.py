@@ -6,6 +6,8 @@ from app.models.alerta import Alerta, AlertLevel, AlertType
 from app.models.chat import ConversacionChat, MensajeChat
 from app.models.metrica import MetricaEstudiante
 from app.models.anuncio import Anuncio
+from app.models.sincronizacion import EstadoSincronizacion
+from app.models.credencial import CredencialGoogle
 
 __all__ = [
     "User",
@@ -22,4 +24,6 @@ __all__ = [
     "MensajeChat",
     "MetricaEstudiante",
     "Anuncio",
+    "EstadoSincronizacion",
+    "CredencialGoogle",
 ]
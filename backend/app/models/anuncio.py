@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -16,6 +16,7 @@ class Anuncio(Base):
     profesor_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"))
     titulo = Column(String(500))
     contenido = Column(Text, nullable=False)
+    classroom_updated_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -24,3 +25,11 @@ class Anuncio(Base):
 
     def __repr__(self):
         return f"<Anuncio {self.titulo}>"
+
+
+# Últimos anuncios por curso: mismo orden (DESC) que la consulta y que init.sql
+Index(
+    "idx_anuncios_curso_actualizacion",
+    Anuncio.curso_id,
+    Anuncio.classroom_updated_at.desc(),
+)
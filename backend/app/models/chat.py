@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Boolean, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -25,11 +25,24 @@ class ConversacionChat(Base):
         return f"<ConversacionChat {self.id}>"
 
 
+# Conversación activa más reciente de un alumno: solo indexa las activas y ya en el orden de la consulta
+Index(
+    "idx_conversaciones_estudiante_activa",
+    ConversacionChat.estudiante_id,
+    ConversacionChat.created_at.desc(),
+    postgresql_where=ConversacionChat.activa,
+)
+
+
 class MensajeChat(Base):
     __tablename__ = "mensajes_chat"
+    __table_args__ = (
+        # Sirve al historial por conversación (últimos N y paginación por llave)
+        Index("idx_mensajes_conversacion_creacion", "conversacion_id", "created_at", "id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    conversacion_id = Column(UUID(as_uuid=True), ForeignKey("conversaciones_chat.id", ondelete="CASCADE"), index=True)
+    conversacion_id = Column(UUID(as_uuid=True), ForeignKey("conversaciones_chat.id", ondelete="CASCADE"))
     remitente = Column(String(50), nullable=False)  # 'user' o 'bot'
     contenido = Column(Text, nullable=False)
     metadata_json = Column("metadata", JSONB)
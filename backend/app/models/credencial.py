@@ -0,0 +1,21 @@
+from sqlalchemy import Column, String, DateTime, Text
+from sqlalchemy.dialects.postgresql import JSONB
+from datetime import datetime
+
+from app.db.base import Base
+
+
+class CredencialGoogle(Base):
+    """Tokens OAuth de Google por usuario, compartidos entre todos los procesos del backend."""
+
+    __tablename__ = "credenciales_google"
+
+    google_id = Column(String(255), primary_key=True)
+    access_token = Column(Text, nullable=False)
+    refresh_token = Column(Text)
+    expiry = Column(DateTime(timezone=True))
+    scopes = Column(JSONB)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CredencialGoogle {self.google_id}>"
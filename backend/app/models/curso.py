@@ -18,6 +18,7 @@ class Curso(Base):
     seccion = Column(String(255))
     sala = Column(String(255))
     estado = Column(String(50), default="ACTIVE")
+    classroom_updated_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
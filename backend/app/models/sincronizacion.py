@@ -0,0 +1,30 @@
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime, timezone
+import uuid
+
+from app.db.base import Base
+
+
+class EstadoSincronizacion(Base):
+    """Marca de agua (updateTime más reciente) sincronizada por usuario, curso y recurso de Classroom."""
+
+    __tablename__ = "estado_sincronizacion"
+    __table_args__ = (
+        UniqueConstraint("usuario_id", "curso_id", "recurso", name="uq_estado_sincronizacion"),
+        Index("idx_estado_sincronizacion_usuario_id", "usuario_id"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    usuario_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    curso_id = Column(UUID(as_uuid=True), ForeignKey("cursos.id", ondelete="CASCADE"), nullable=False)
+    recurso = Column(String(50), nullable=False)  # 'coursework', 'announcements', 'submissions'
+    marca_agua = Column(DateTime(timezone=True))
+    sincronizado_en = Column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
+
+    def __repr__(self):
+        return f"<EstadoSincronizacion {self.recurso} curso={self.curso_id}>"
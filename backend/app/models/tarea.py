@@ -28,6 +28,7 @@ class Tarea(Base):
     fecha_limite = Column(DateTime, index=True)
     puntos_maximos = Column(Numeric(10, 2))
     estado = Column(Enum(TaskStatus), default=TaskStatus.pendiente)
+    classroom_updated_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -43,6 +44,7 @@ class Entrega(Base):
     __tablename__ = "entregas"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    classroom_id = Column(String(255), unique=True)
     tarea_id = Column(UUID(as_uuid=True), ForeignKey("tareas.id", ondelete="CASCADE"), index=True)
     estudiante_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), index=True)
     fecha_entrega = Column(DateTime, index=True)
@@ -51,6 +53,7 @@ class Entrega(Base):
     comentarios = Column(Text)
     retrasada = Column(Boolean, default=False)
     minutos_retraso = Column(Integer, default=0)
+    classroom_updated_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -1,127 +1,306 @@
+import asyncio
+import hashlib
 import json
 import logging
-from typing import List, Dict, Any
-from openai import OpenAI
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
 
 from app.core.config import settings
+from app.core.redis_client import get_async_redis, redis_errors
+from app.services.response_cache import MemoryBackend, RedisBackend
+from app.services.task_scorer import DIFFICULTY_LEVELS, ESTIMATED_TIMES, rank_tasks
 
 logger = logging.getLogger(__name__)
 
+_client: Optional[AsyncOpenAI] = None
+
+# Anotaciones en curso por huella de tarea; otra petición que necesite la misma tarea
+# espera ese lote en lugar de volver a mandarla al modelo
+_inflight: Dict[str, "asyncio.Task[Dict[str, Dict[str, Any]]]"] = {}
+
+_DESCRIPTION_LIMIT = 200
+
 
-def prioritize_tasks_with_ai(tasks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+class AnalysisCache:
     """
-    Usa OpenAI para analizar y priorizar tareas basándose en:
-    - Dificultad estimada (analizando la descripción)
-    - Fecha de entrega
-    - Estado actual
-    - Puntos asignados
+    Caché direccionado por contenido de las anotaciones de IA (Redis o, si no hay, memoria).
 
-    Retorna las tareas ordenadas por prioridad con metadata adicional de IA.
+    La llave es la huella del contenido enviado al modelo, así que editar una tarea produce
+    otra llave y nunca se sirve una anotación de una versión distinta.
     """
-    if not tasks:
-        return []
 
-    try:
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-
-        # Preparar datos de tareas para el análisis
-        tasks_summary = []
-        for i, task in enumerate(tasks):
-            tasks_summary.append({
-                "index": i,
-                "title": task.get("title", "Sin título"),
-                "description": task.get("description", "")[:200],  # Limitar descripción
-                "dueDate": task.get("due", "Sin fecha"),
-                "status": task.get("status", "ok"),
-                "maxPoints": task.get("maxPoints", 0)
-            })
-
-        prompt = f"""Eres un asistente educativo que ayuda a estudiantes a priorizar sus tareas.
-
-Analiza estas {len(tasks_summary)} tareas y determina cuáles deberían tener prioridad ALTA, MEDIA o BAJA.
-
-Criterios de priorización:
-1. **Urgencia**: Tareas vencidas o que vencen pronto tienen prioridad ALTA
-2. **Dificultad**: Tareas complejas (muchos puntos, descripciones largas, proyectos) necesitan más tiempo → prioridad ALTA
-3. **Complejidad**: Palabras clave como "proyecto", "investigación", "análisis", "ensayo" indican alta complejidad
-4. **Facilidad**: Tareas simples (lectura, cuestionario corto, pocos puntos) → prioridad BAJA o MEDIA
+    def __init__(self, namespace: str, max_bytes: int, redis_client=None):
+        self._namespace = namespace
+        self._memory = MemoryBackend(max_bytes)
+        self._redis = RedisBackend(redis_client) if redis_client is not None else None
+
+    def _key(self, fingerprint: str) -> str:
+        return f"{self._namespace}:{fingerprint}"
+
+    async def get_many(self, fingerprints: List[str]) -> List[Optional[Dict[str, Any]]]:
+        keys = [self._key(fingerprint) for fingerprint in fingerprints]
+        entries = None
+        if self._redis is not None:
+            try:
+                entries = await self._redis.get_many(keys)
+            except redis_errors() as exc:
+                logger.warning("Redis no disponible para leer %d anotaciones: %s", len(keys), exc)
+        if entries is None:
+            entries = await self._memory.get_many(keys)
+        return [json.loads(entry[1]) if entry else None for entry in entries]
+
+    async def set(self, fingerprint: str, value: Dict[str, Any], ttl_seconds: int) -> None:
+        if ttl_seconds <= 0:
+            return
+        key = self._key(fingerprint)
+        payload = json.dumps(value, ensure_ascii=False)
+        if self._redis is not None:
+            try:
+                await self._redis.set(key, time.time(), payload, ttl_seconds)
+                return
+            except redis_errors() as exc:
+                logger.warning("Redis no disponible para escribir %s: %s", key, exc)
+        await self._memory.set(key, time.time(), payload, ttl_seconds)
+
+
+annotation_cache = AnalysisCache(
+    namespace="ai_task_annotation",
+    max_bytes=settings.AI_PRIORITY_CACHE_MAX_BYTES,
+    redis_client=get_async_redis(),
+)
+
+
+def _get_client() -> AsyncOpenAI:
+    """
+    Cliente asíncrono compartido por todo el proceso; reutiliza conexiones HTTP (keep-alive).
+    """
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            timeout=settings.OPENAI_TIMEOUT_SECONDS,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OPENAI_MAX_CONNECTIONS,
+                ),
+                timeout=settings.OPENAI_TIMEOUT_SECONDS,
+            ),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def _annotation_payload(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Solo el contenido que define la dificultad; la urgencia se calcula localmente."""
+    return {
+        "id": task.get("id"),
+        "title": task.get("title", "Sin título"),
+        "description": (task.get("description") or "")[:_DESCRIPTION_LIMIT],
+        "maxPoints": task.get("maxPoints", 0),
+        "workType": task.get("workType"),
+    }
+
+
+def _task_fingerprint(task: Dict[str, Any]) -> str:
+    """Hash estable de la tarea (id de coursework y contenido) y del modelo que la anota."""
+    canonical = json.dumps(_annotation_payload(task), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{settings.OPENAI_MODEL}|{canonical}".encode("utf-8")).hexdigest()
+
+
+def _build_prompt(tasks_summary: List[Dict[str, Any]]) -> str:
+    return f"""Eres un asistente educativo que ayuda a estudiantes a planear sus tareas.
+
+Analiza estas {len(tasks_summary)} tareas y estima para cada una su dificultad y el tiempo que tomará.
+
+Criterios:
+1. **Dificultad**: Tareas complejas (muchos puntos, descripciones largas, proyectos) → dificultad ALTA
+2. **Complejidad**: Palabras clave como "proyecto", "investigación", "análisis", "ensayo" indican alta complejidad
+3. **Facilidad**: Tareas simples (lectura, cuestionario corto, pocos puntos) → dificultad BAJA o MEDIA
 
 Tareas:
 {json.dumps(tasks_summary, indent=2, ensure_ascii=False)}
 
 Responde ÚNICAMENTE con un JSON válido en este formato (sin texto adicional):
 {{
-  "prioritized_tasks": [
+  "annotations": [
     {{
       "index": 0,
-      "priority": "ALTA|MEDIA|BAJA",
       "difficulty": "ALTA|MEDIA|BAJA",
       "estimated_time": "30min|1h|2h|3h+",
-      "reason": "Breve explicación de por qué tiene esta prioridad"
+      "reason": "Breve explicación de la dificultad estimada"
     }}
   ]
 }}
 
-Ordena el array por prioridad (ALTA primero, luego MEDIA, luego BAJA)."""
+Incluye una anotación por cada tarea."""
 
-        response = client.chat.completions.create(
-            model=settings.OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": "Eres un asistente educativo experto en gestión del tiempo y priorización de tareas para estudiantes."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=1500
+
+def _parse_ai_response(ai_response: str) -> Optional[Dict[str, Any]]:
+    # A veces la API devuelve markdown con ```json
+    if "```json" in ai_response:
+        ai_response = ai_response.split("```json")[1].split("```")[0].strip()
+    elif "```" in ai_response:
+        ai_response = ai_response.split("```")[1].split("```")[0].strip()
+
+    try:
+        return json.loads(ai_response)
+    except json.JSONDecodeError as e:
+        logger.error(f"Error al parsear respuesta de IA: {e}")
+        logger.error(f"Respuesta recibida: {ai_response}")
+        return None
+
+
+async def _annotate_batch(batch: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Anota un lote de tareas nuevas o editadas y guarda cada anotación en el caché.
+
+    Retorna ``huella -> anotación`` solo para las tareas que el modelo sí anotó.
+    """
+    tasks_summary = [
+        {"index": i, **_annotation_payload(task)}
+        for i, (_, task) in enumerate(batch)
+    ]
+    response = await _get_client().chat.completions.create(
+        model=settings.OPENAI_MODEL,
+        messages=[
+            {"role": "system", "content": "Eres un asistente educativo experto en gestión del tiempo y priorización de tareas para estudiantes."},
+            {"role": "user", "content": _build_prompt(tasks_summary)}
+        ],
+        temperature=0.3,
+        # Presupuesto proporcional al lote para que la respuesta no se trunque
+        max_tokens=100 + 90 * len(batch)
+    )
+    ai_analysis = _parse_ai_response(response.choices[0].message.content.strip())
+    if ai_analysis is None:
+        return {}
+
+    annotations: Dict[str, Dict[str, Any]] = {}
+    for item in ai_analysis.get("annotations", []):
+        index = item.get("index")
+        if not isinstance(index, int) or not 0 <= index < len(batch):
+            continue
+        difficulty = item.get("difficulty")
+        estimated_time = item.get("estimated_time")
+        if difficulty not in DIFFICULTY_LEVELS or estimated_time not in ESTIMATED_TIMES:
+            # Sin valores válidos la tarea se queda con la estimación local
+            continue
+        annotations[batch[index][0]] = {
+            "difficulty": difficulty,
+            "estimated_time": estimated_time,
+            "reason": item.get("reason", ""),
+        }
+
+    for fingerprint, annotation in annotations.items():
+        await annotation_cache.set(fingerprint, annotation, settings.AI_PRIORITY_CACHE_TTL_SECONDS)
+    return annotations
+
+
+def _finish_batch(batch_task: "asyncio.Task[Dict[str, Dict[str, Any]]]", chunk: List[str]) -> None:
+    for fingerprint in chunk:
+        _inflight.pop(fingerprint, None)
+    # Los lotes pueden terminar sin que nadie los espere (refinamiento en segundo plano)
+    if not batch_task.cancelled() and batch_task.exception() is not None:
+        logger.error(f"Error al anotar tareas con IA: {batch_task.exception()}")
+
+
+async def _get_annotations(
+    tasks: List[Dict[str, Any]],
+    fingerprints: List[str],
+    wait_seconds: Optional[float],
+) -> Tuple[Dict[str, Dict[str, Any]], int]:
+    """
+    Anotaciones por huella: las memorizadas salen del caché y solo las faltantes van al modelo.
+
+    Las tareas que ya está anotando otra petición esperan ese mismo lote. Cada lote corre en
+    su propia tarea, así que cancelar la petición que lo inició no afecta a las demás, y los
+    lotes que no terminen dentro de ``wait_seconds`` siguen en segundo plano y quedan en caché.
+
+    Retorna las anotaciones disponibles y cuántas tareas siguen pendientes de anotar.
+    """
+    unique = list(dict.fromkeys(fingerprints))
+    annotations = {
+        fingerprint: cached
+        for fingerprint, cached in zip(unique, await annotation_cache.get_many(unique))
+        if cached is not None
+    }
+
+    task_by_fingerprint = dict(zip(fingerprints, tasks))
+    pending: Dict[str, "asyncio.Task[Dict[str, Dict[str, Any]]]"] = {}
+    to_request = []
+    for fingerprint in unique:
+        if fingerprint in annotations:
+            continue
+        if fingerprint in _inflight:
+            pending[fingerprint] = _inflight[fingerprint]
+        else:
+            to_request.append(fingerprint)
+
+    batch_size = max(1, settings.AI_PRIORITY_BATCH_SIZE)
+    for start in range(0, len(to_request), batch_size):
+        chunk = to_request[start:start + batch_size]
+        batch_task = asyncio.create_task(
+            _annotate_batch([(fingerprint, task_by_fingerprint[fingerprint]) for fingerprint in chunk])
         )
+        for fingerprint in chunk:
+            _inflight[fingerprint] = batch_task
+            pending[fingerprint] = batch_task
+        batch_task.add_done_callback(lambda done, chunk=chunk: _finish_batch(done, chunk))
+
+    if to_request:
+        logger.info(f"Anotando con IA {len(to_request)} tareas nuevas o editadas ({len(annotations)} desde caché)")
+
+    batches = set(pending.values())
+    if batches and (wait_seconds is None or wait_seconds > 0):
+        # asyncio.wait no cancela los lotes al vencer el timeout; siguen compartidos
+        await asyncio.wait(batches, timeout=wait_seconds)
+
+    still_pending = 0
+    for fingerprint, batch_task in pending.items():
+        if not batch_task.done():
+            still_pending += 1
+        elif not batch_task.cancelled() and batch_task.exception() is None:
+            annotation = batch_task.result().get(fingerprint)
+            if annotation is not None:
+                annotations[fingerprint] = annotation
+    return annotations, still_pending
+
 
-        ai_response = response.choices[0].message.content.strip()
-
-        # Intentar extraer JSON de la respuesta
-        try:
-            # A veces la API devuelve markdown con ```json
-            if "```json" in ai_response:
-                ai_response = ai_response.split("```json")[1].split("```")[0].strip()
-            elif "```" in ai_response:
-                ai_response = ai_response.split("```")[1].split("```")[0].strip()
-
-            ai_analysis = json.loads(ai_response)
-        except json.JSONDecodeError as e:
-            logger.error(f"Error al parsear respuesta de IA: {e}")
-            logger.error(f"Respuesta recibida: {ai_response}")
-            # Fallback: devolver tareas en orden original
-            return tasks
-
-        # Mapear el análisis de IA a las tareas originales
-        prioritized = []
-        priority_order = {"ALTA": 0, "MEDIA": 1, "BAJA": 2}
-
-        for ai_task in ai_analysis.get("prioritized_tasks", []):
-            original_index = ai_task.get("index")
-            if original_index is not None and 0 <= original_index < len(tasks):
-                task_copy = tasks[original_index].copy()
-
-                # Agregar metadata de IA
-                task_copy["ai_priority"] = ai_task.get("priority", "MEDIA")
-                task_copy["ai_difficulty"] = ai_task.get("difficulty", "MEDIA")
-                task_copy["ai_estimated_time"] = ai_task.get("estimated_time", "1h")
-                task_copy["ai_reason"] = ai_task.get("reason", "")
-                task_copy["ai_analyzed"] = True
-
-                prioritized.append(task_copy)
-
-        # Si falta alguna tarea (por si la IA omitió alguna), agregarla al final
-        included_indices = {ai_task.get("index") for ai_task in ai_analysis.get("prioritized_tasks", [])}
-        for i, task in enumerate(tasks):
-            if i not in included_indices:
-                task_copy = task.copy()
-                task_copy["ai_priority"] = "MEDIA"
-                task_copy["ai_analyzed"] = False
-                prioritized.append(task_copy)
-
-        logger.info(f"Tareas priorizadas con IA: {len(prioritized)} tareas analizadas")
-        return prioritized
+async def prioritize_tasks_with_ai(
+    tasks: List[Dict[str, Any]],
+    wait_seconds: Optional[float] = None,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Prioriza tareas en dos etapas:
+    1. La IA estima dificultad y tiempo de cada tarea una sola vez (memorizado por id y contenido).
+    2. El orden final se calcula localmente (``rank_tasks``) con esas estimaciones y la fecha
+       de entrega; las tareas sin anotación usan la estimación local.
+
+    Con ``wait_seconds`` se responde a lo sumo en ese tiempo: las tareas cuya anotación no llegó
+    se ordenan con la estimación local y la IA termina de anotarlas en segundo plano. ``None``
+    espera a la IA. Si el modelo falla, el orden local funciona igual como respaldo.
 
+    Retorna las tareas ordenadas y cuántas siguen pendientes de refinar con IA.
+    """
+    if not tasks:
+        return [], 0
+
+    fingerprints = [_task_fingerprint(task) for task in tasks]
+    try:
+        annotations, pending = await _get_annotations(tasks, fingerprints, wait_seconds)
     except Exception as e:
         logger.exception(f"Error al priorizar tareas con IA: {e}")
-        # En caso de error, devolver tareas en orden original
-        return tasks
+        annotations, pending = {}, 0
+
+    prioritized = rank_tasks(tasks, [annotations.get(fingerprint) for fingerprint in fingerprints])
+    logger.info(f"Tareas priorizadas: {len(prioritized)} ({len(prioritized) - pending} sin refinamiento pendiente)")
+    return prioritized, pending
@@ -1,10 +1,12 @@
 import asyncio
 import json
 import logging
-from collections import deque
-from datetime import datetime, timedelta, timezone
+import time
+import uuid
+from collections import OrderedDict, deque
+from functools import lru_cache
 from threading import Lock
-from typing import Annotated, Any, Deque, Dict, List, Optional, Tuple, Union
+from typing import Annotated, Any, AsyncIterator, Dict, List, Optional, Tuple, Union
 
 import re
 
@@ -12,20 +14,23 @@ from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 from langgraph.graph import END, StateGraph
 from langgraph.graph.message import add_messages
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
 from typing_extensions import TypedDict
 
 from app.core.config import settings
+from app.core.redis_client import get_async_redis, redis_errors
+from app.db.base import AsyncSessionLocal
+from app.services.chat_history import ConversationHistory
+from app.models.chat import MensajeChat
 
 logger = logging.getLogger(__name__)
 
 
-def _utcnow() -> datetime:
-    return datetime.now(timezone.utc)
-
-
 class ChatAgentState(TypedDict):
     messages: Annotated[List[BaseMessage], add_messages]
     context: Dict[str, Any]
+    summary: Optional[str]
 
 
 class MessageBundle(TypedDict):
@@ -34,15 +39,49 @@ class MessageBundle(TypedDict):
     context: Dict[str, Any]
 
 
+class BufferMetrics:
+    """
+    Contadores del buffer: profundidad de la cola y retraso de cada flush respecto a su plazo.
+    """
+
+    def __init__(self):
+        self.flushes = 0
+        self.messages = 0
+        self.flush_lag_seconds_total = 0.0
+        self.flush_lag_seconds_max = 0.0
+
+    def record_flush(self, lag_seconds: float, message_count: int) -> None:
+        self.flushes += 1
+        self.messages += message_count
+        self.flush_lag_seconds_total += lag_seconds
+        self.flush_lag_seconds_max = max(self.flush_lag_seconds_max, lag_seconds)
+
+    def snapshot(self, open_sessions: int, queued_messages: int) -> Dict[str, Any]:
+        average_lag = self.flush_lag_seconds_total / self.flushes if self.flushes else 0.0
+        return {
+            "open_sessions": open_sessions,
+            "queued_messages": queued_messages,
+            "flushes": self.flushes,
+            "messages_per_flush_avg": round(self.messages / self.flushes, 3) if self.flushes else 0.0,
+            "flush_lag_avg_ms": round(average_lag * 1000, 3),
+            "flush_lag_max_ms": round(self.flush_lag_seconds_max * 1000, 3),
+        }
+
+
 class MessageBuffer:
     """
     Agrupa mensajes rápidos del alumno para enviarlos juntos al agente.
+
+    Todo corre en el event loop y ninguna sección crítica tiene un ``await``, así que cada
+    sesión se modifica sin locks. El primer mensaje de una ventana agenda un solo timer
+    (``call_at``, sin crear una tarea) y es quien procesa el bundle; el resto solo espera.
     """
 
     def __init__(self, window_seconds: float):
         self._window = max(0.1, window_seconds)
         self._sessions: Dict[str, Dict[str, Any]] = {}
-        self._lock = asyncio.Lock()
+        self._queued_messages = 0
+        self.metrics = BufferMetrics()
 
     async def collect(
         self,
@@ -58,62 +97,237 @@ class MessageBuffer:
             }
             return bundle, True
 
-        async with self._lock:
-            entry = self._sessions.get(session_id)
-            if not entry:
-                event = asyncio.Event()
-                entry = {
-                    "messages": [message],
-                    "context": context or {},
-                    "event": event,
-                    "bundle": None,
-                    "waiters": 1,
-                    "leader_assigned": False,
-                }
-                self._sessions[session_id] = entry
-                asyncio.create_task(self._flush_after_delay(session_id))
-                primary = True
-            else:
-                entry["messages"].append(message)
-                if context:
-                    entry["context"] = context
-                entry["waiters"] += 1
-                primary = False
-            event: asyncio.Event = entry["event"]
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self._window
+            entry = {
+                "messages": [message],
+                "context": context or {},
+                "event": asyncio.Event(),
+                "bundle": None,
+                "deadline": deadline,
+            }
+            self._sessions[session_id] = entry
+            loop.call_at(deadline, self._flush, session_id, entry)
+            primary = True
+        else:
+            entry["messages"].append(message)
+            if context:
+                entry["context"] = context
+            primary = False
+        self._queued_messages += 1
 
+        event: asyncio.Event = entry["event"]
         await event.wait()
+        return entry["bundle"], primary
+
+    def _flush(self, session_id: str, entry: Dict[str, Any]) -> None:
+        # Se saca la sesión antes de resolver: un mensaje posterior abre una ventana nueva
+        if self._sessions.get(session_id) is entry:
+            del self._sessions[session_id]
+        messages: List[str] = entry["messages"]
+        self._queued_messages -= len(messages)
+        self.metrics.record_flush(asyncio.get_running_loop().time() - entry["deadline"], len(messages))
+
+        entry["bundle"] = {
+            "text": "\n\n".join(messages),
+            "utterances": list(messages),
+            "context": entry["context"],
+        }
+        entry["event"].set()
+
+    def stats(self) -> Dict[str, Any]:
+        return self.metrics.snapshot(len(self._sessions), self._queued_messages)
+
+
+# Agrega el mensaje y, si la ventana no tiene líder, este worker lo toma.
+# KEYS: mensajes, contexto, líder. ARGV: mensaje, contexto JSON ('' = sin cambio), token, ttl ms
+_BUFFER_COLLECT_SCRIPT = """
+redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+if ARGV[2] ~= '' then
+    redis.call('SET', KEYS[2], ARGV[2], 'PX', ARGV[4])
+end
+local leader = redis.call('GET', KEYS[3])
+if leader then
+    return leader
+end
+redis.call('SET', KEYS[3], ARGV[3], 'PX', ARGV[4])
+return ''
+"""
+
+# Cierra la ventana de un solo golpe: lee y borra los mensajes, libera el líder y deja el
+# bundle para los seguidores. Un mensaje posterior abre una ventana nueva.
+# KEYS: mensajes, contexto, líder, bundle. ARGV: token, ttl ms del bundle
+_BUFFER_FLUSH_SCRIPT = """
+local messages = redis.call('LRANGE', KEYS[1], 0, -1)
+local context = redis.call('GET', KEYS[2])
+redis.call('DEL', KEYS[1], KEYS[2])
+if redis.call('GET', KEYS[3]) == ARGV[1] then
+    redis.call('DEL', KEYS[3])
+end
+local bundle = cjson.encode({messages = messages, context = context or ''})
+redis.call('SET', KEYS[4], bundle, 'PX', ARGV[2])
+return bundle
+"""
+
+
+class DistributedMessageBuffer:
+    """
+    Variante de ``MessageBuffer`` para varios workers: los mensajes se acumulan en Redis.
 
-        async with self._lock:
-            entry = self._sessions.get(session_id)
-            if not entry:
-                raise RuntimeError("Buffer inconsistente para la sesión.")
-
-            bundle: MessageBundle = entry["bundle"]
-            if not entry["leader_assigned"]:
-                entry["leader_assigned"] = True
-                is_primary = True
-            else:
-                is_primary = False
-
-            entry["waiters"] -= 1
-            if entry["waiters"] <= 0:
-                self._sessions.pop(session_id, None)
-
-        return bundle, is_primary and primary
-
-    async def _flush_after_delay(self, session_id: str) -> None:
-        await asyncio.sleep(self._window)
-        async with self._lock:
-            entry = self._sessions.get(session_id)
-            if not entry:
-                return
-            bundle: MessageBundle = {
-                "text": "\n\n".join(entry["messages"]),
-                "utterances": list(entry["messages"]),
-                "context": entry["context"],
-            }
-            entry["bundle"] = bundle
-            entry["event"].set()
+    El worker que recibe el primer mensaje de la ventana queda como líder (``SET NX``), espera
+    la ventana y cierra el bundle; solo él llama al agente. Los demás, en cualquier worker,
+    esperan ese bundle para responder como mensajes en cola. Si Redis falla, se cae al buffer
+    local del proceso.
+    """
+
+    _prefix = "chat:buffer:"
+
+    def __init__(self, client, window_seconds: float, fallback: MessageBuffer):
+        self._client = client
+        self._window = max(0.1, window_seconds)
+        self._fallback = fallback
+        # Si el líder muere, su ventana caduca sola y el siguiente mensaje se lleva lo pendiente
+        self._ttl_ms = int((self._window * 2 + 5) * 1000)
+        self._collect_script = client.register_script(_BUFFER_COLLECT_SCRIPT)
+        self._flush_script = client.register_script(_BUFFER_FLUSH_SCRIPT)
+        self._leading = 0
+        self.metrics = BufferMetrics()
+
+    def _keys(self, session_id: str) -> Tuple[str, str, str]:
+        base = self._prefix + session_id
+        return f"{base}:messages", f"{base}:context", f"{base}:leader"
+
+    def _bundle_key(self, session_id: str, token: str) -> str:
+        return f"{self._prefix}{session_id}:bundle:{token}"
+
+    async def collect(
+        self,
+        session_id: str,
+        message: str,
+        context: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[MessageBundle, bool]:
+        if not message:
+            return await self._fallback.collect(session_id, message, context)
+
+        token = uuid.uuid4().hex
+        try:
+            leader = await self._collect_script(
+                keys=self._keys(session_id),
+                args=[message, json.dumps(context) if context else "", token, self._ttl_ms],
+            )
+        except redis_errors() as exc:
+            logger.warning("Redis no disponible para el buffer de chat %s: %s", session_id, exc)
+            return await self._fallback.collect(session_id, message, context)
+
+        if leader:
+            return await self._wait_for_leader(session_id, leader, message, context), False
+        return await self._lead(session_id, token, message, context), True
+
+    async def _lead(
+        self,
+        session_id: str,
+        token: str,
+        message: str,
+        context: Optional[Dict[str, Any]],
+    ) -> MessageBundle:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._window
+        self._leading += 1
+        try:
+            await asyncio.sleep(self._window)
+            raw = await self._flush_script(
+                keys=[*self._keys(session_id), self._bundle_key(session_id, token)],
+                args=[token, self._ttl_ms],
+            )
+        except redis_errors() as exc:
+            # Lo acumulado queda en Redis y se enviará con el próximo mensaje de la sesión
+            logger.warning("Redis no disponible al cerrar el buffer de chat %s: %s", session_id, exc)
+            return {"text": message, "utterances": [message], "context": context or {}}
+        finally:
+            self._leading -= 1
+
+        payload = json.loads(raw)
+        # cjson codifica una lista vacía como objeto
+        messages = payload["messages"] if isinstance(payload["messages"], list) else []
+        self.metrics.record_flush(loop.time() - deadline, len(messages))
+        return {
+            "text": "\n\n".join(messages),
+            "utterances": messages,
+            "context": json.loads(payload["context"]) if payload["context"] else {},
+        }
+
+    async def _wait_for_leader(
+        self,
+        session_id: str,
+        token: str,
+        message: str,
+        context: Optional[Dict[str, Any]],
+    ) -> MessageBundle:
+        """Espera el bundle del líder (que puede estar en otro worker) consultando Redis."""
+        loop = asyncio.get_running_loop()
+        give_up_at = loop.time() + self._ttl_ms / 1000
+        poll_interval = min(0.1, self._window / 4)
+        bundle_key = self._bundle_key(session_id, token)
+        await asyncio.sleep(self._window / 2)
+        while loop.time() < give_up_at:
+            try:
+                raw = await self._client.get(bundle_key)
+            except redis_errors() as exc:
+                logger.warning("Redis no disponible para el buffer de chat %s: %s", session_id, exc)
+                break
+            if raw is not None:
+                payload = json.loads(raw)
+                messages = payload["messages"] if isinstance(payload["messages"], list) else []
+                return {"text": "\n\n".join(messages), "utterances": messages, "context": context or {}}
+            await asyncio.sleep(poll_interval)
+
+        # El líder no cerró la ventana (murió): el mensaje sigue en Redis y saldrá con el próximo
+        logger.warning("El líder del buffer de chat %s no respondió a tiempo", session_id)
+        return {"text": message, "utterances": [message], "context": context or {}}
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self.metrics.snapshot(self._leading, 0)
+        snapshot["backend"] = "redis"
+        snapshot["local_fallback"] = self._fallback.stats()
+        return snapshot
+
+
+def _create_message_buffer():
+    local_buffer = MessageBuffer(window_seconds=settings.CHAT_BUFFER_SECONDS)
+    backend = settings.CHAT_BUFFER_BACKEND.lower()
+    if backend == "redis":
+        client = get_async_redis()
+        if client is not None:
+            return DistributedMessageBuffer(client, settings.CHAT_BUFFER_SECONDS, local_buffer)
+        logger.warning("CHAT_BUFFER_BACKEND=redis sin REDIS_URL; se usa el buffer en memoria")
+    elif backend != "memory":
+        logger.warning("CHAT_BUFFER_BACKEND desconocido (%s); se usa el buffer en memoria", backend)
+    return local_buffer
+
+
+_PARAGRAPH_MAX_CHARS = 320
+_SENTENCE_GROUP_MAX_CHARS = 280
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+
+def _group_sentences(sentences: List[str]) -> List[str]:
+    """Junta oraciones consecutivas mientras quepan en un mensaje."""
+    groups: List[str] = []
+    buffer = ""
+    for sentence in sentences:
+        candidate = f"{buffer} {sentence}".strip() if buffer else sentence
+        if len(candidate) <= _SENTENCE_GROUP_MAX_CHARS:
+            buffer = candidate
+        else:
+            if buffer:
+                groups.append(buffer)
+            buffer = sentence
+    if buffer:
+        groups.append(buffer)
+    return groups
 
 
 def split_response_chunks(text: str) -> List[str]:
@@ -129,77 +343,336 @@ def split_response_chunks(text: str) -> List[str]:
 
     chunks: List[str] = []
     for paragraph in paragraphs:
-        if len(paragraph) <= 320:
+        if len(paragraph) <= _PARAGRAPH_MAX_CHARS:
             chunks.append(paragraph)
             continue
-
-        sentences = re.split(r"(?<=[.!?])\s+", paragraph)
-        buffer = ""
-        for sentence in sentences:
-            candidate = f"{buffer} {sentence}".strip() if buffer else sentence
-            if len(candidate) <= 280:
-                buffer = candidate
-            else:
-                if buffer:
-                    chunks.append(buffer)
-                buffer = sentence
-        if buffer:
-            chunks.append(buffer)
+        chunks.extend(_group_sentences(_SENTENCE_BOUNDARY.split(paragraph)))
 
     return chunks
 
 
+class IncrementalChunker:
+    """
+    Aplica las reglas de ``split_response_chunks`` mientras el texto llega por tokens.
+
+    Un mensaje se emite en cuanto ya no puede cambiar: al cerrar un párrafo (doble salto de
+    línea) o, en párrafos largos, cuando la siguiente oración completa ya no cabe en el grupo
+    actual. Concatenar lo emitido por ``feed`` y ``finish`` da lo mismo que
+    ``split_response_chunks`` sobre el texto completo.
+    """
+
+    def __init__(self):
+        self._paragraph = ""
+        self._emitted_in_paragraph = 0
+
+    def feed(self, delta: str) -> List[str]:
+        self._paragraph += delta
+        chunks: List[str] = []
+        while "\n\n" in self._paragraph:
+            paragraph, self._paragraph = self._paragraph.split("\n\n", 1)
+            chunks.extend(self._close_paragraph(paragraph))
+        chunks.extend(self._ready_sentence_groups())
+        return chunks
+
+    def finish(self) -> List[str]:
+        chunks = self._close_paragraph(self._paragraph)
+        self._paragraph = ""
+        return chunks
+
+    def _close_paragraph(self, paragraph: str) -> List[str]:
+        paragraph = paragraph.strip()
+        already_emitted = self._emitted_in_paragraph
+        self._emitted_in_paragraph = 0
+        if not paragraph:
+            return []
+        if len(paragraph) <= _PARAGRAPH_MAX_CHARS:
+            return [paragraph]
+        return _group_sentences(_SENTENCE_BOUNDARY.split(paragraph))[already_emitted:]
+
+    def _ready_sentence_groups(self) -> List[str]:
+        paragraph = self._paragraph.strip()
+        if len(paragraph) <= _PARAGRAPH_MAX_CHARS:
+            return []
+        # La última oración puede seguir creciendo, y el último grupo aún puede absorber más
+        complete_sentences = _SENTENCE_BOUNDARY.split(paragraph)[:-1]
+        final_groups = _group_sentences(complete_sentences)[:-1]
+        ready = final_groups[self._emitted_in_paragraph:]
+        self._emitted_in_paragraph = len(final_groups)
+        return ready
+
+
+_MESSAGE_ROLES = {HumanMessage: "h", AIMessage: "a", SystemMessage: "s"}
+_ROLE_MESSAGES = {role: message_class for message_class, role in _MESSAGE_ROLES.items()}
+_DB_SENDER_MESSAGES = {"user": HumanMessage, "bot": AIMessage}
+
+
+def _serialize_message(message: BaseMessage) -> str:
+    """Formato compacto para Redis: rol, contenido e id."""
+    role = _MESSAGE_ROLES.get(type(message), "a" if message.type == "ai" else "h")
+    return json.dumps({"r": role, "c": message.content, "i": message.id}, ensure_ascii=False, separators=(",", ":"))
+
+
+def _deserialize_message(raw: str) -> BaseMessage:
+    payload = json.loads(raw)
+    return _ROLE_MESSAGES.get(payload.get("r"), HumanMessage)(content=payload.get("c", ""), id=payload.get("i"))
+
+
+class _RedisSessionStore:
+    """
+    Historial por sesión como lista de Redis con TTL del lado del servidor.
+
+    Junto a la lista se guarda un contador de versión; así un worker sabe si su copia local
+    sigue vigente con un GET pequeño en lugar de traer toda la lista.
+    """
+
+    def __init__(self, client, max_messages: int, ttl_seconds: int):
+        self._client = client
+        self._max_messages = max_messages
+        self._ttl = ttl_seconds
+
+    @staticmethod
+    def _keys(session_id: str) -> Tuple[str, str]:
+        return f"chat:memory:{session_id}", f"chat:memory:{session_id}:v"
+
+    async def version(self, session_id: str) -> Optional[str]:
+        _, version_key = self._keys(session_id)
+        return await self._client.get(version_key)
+
+    async def load(self, session_id: str) -> Tuple[Optional[str], List[BaseMessage]]:
+        list_key, version_key = self._keys(session_id)
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.get(version_key)
+            pipe.lrange(list_key, 0, -1)
+            version, raw_messages = await pipe.execute()
+        return version, [_deserialize_message(raw) for raw in raw_messages]
+
+    async def append(self, session_id: str, messages: List[BaseMessage]) -> str:
+        list_key, version_key = self._keys(session_id)
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.rpush(list_key, *[_serialize_message(message) for message in messages])
+            pipe.ltrim(list_key, -self._max_messages, -1)
+            pipe.expire(list_key, self._ttl)
+            pipe.incr(version_key)
+            pipe.expire(version_key, self._ttl)
+            results = await pipe.execute()
+        return str(results[3])
+
+    async def replace(self, session_id: str, messages: List[BaseMessage]) -> str:
+        list_key, version_key = self._keys(session_id)
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.delete(list_key)
+            pipe.rpush(list_key, *[_serialize_message(message) for message in messages])
+            pipe.ltrim(list_key, -self._max_messages, -1)
+            pipe.expire(list_key, self._ttl)
+            pipe.incr(version_key)
+            pipe.expire(version_key, self._ttl)
+            results = await pipe.execute()
+        return str(results[4])
+
+    async def delete(self, session_id: str) -> None:
+        await self._client.delete(*self._keys(session_id))
+
+
 class SessionMemory:
     """
-    In-memory storage for recent chat messages per conversation.
+    Historial reciente por conversación en dos niveles más un respaldo en Postgres.
 
-    Keeps the last N messages and expires sessions after a TTL.
+    - L1: diccionario del proceso ordenado por última escritura. Como todas las sesiones
+      tienen el mismo TTL, ese orden es también el de expiración: podar y desalojar solo
+      mira el inicio, sin recorrer todas las sesiones.
+    - L2 (opcional): listas de Redis compartidas entre workers, con expiración del servidor.
+    - Si la sesión no está en ninguno (fría), se rehidrata de ``mensajes_chat``.
     """
 
-    def __init__(self, max_messages: int, ttl_seconds: int):
+    def __init__(self, max_messages: int, ttl_seconds: int, max_sessions: int, redis_client=None):
         self._max_messages = max_messages
-        self._ttl = timedelta(seconds=ttl_seconds)
-        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._ttl = ttl_seconds
+        self._max_sessions = max(1, max_sessions)
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
         self._lock = Lock()
+        self._redis = (
+            _RedisSessionStore(redis_client, max_messages, ttl_seconds)
+            if redis_client is not None else None
+        )
 
     def _prune_expired(self) -> None:
-        now = _utcnow()
-        expired_keys = [
-            key for key, payload in self._sessions.items()
-            if payload.get("expires_at") and payload["expires_at"] <= now
-        ]
-        for key in expired_keys:
+        # Las sesiones vencidas siempre están al inicio: O(vencidas), no O(sesiones)
+        now = time.monotonic()
+        while self._sessions:
+            key, payload = next(iter(self._sessions.items()))
+            if payload["expires_at"] > now:
+                break
             logger.debug("Expiring chat session %s due to TTL", key)
-            self._sessions.pop(key, None)
+            del self._sessions[key]
 
-    def get_messages(self, session_id: str) -> List[BaseMessage]:
+    def _local_entry(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._prune_expired()
+            return self._sessions.get(session_id)
+
+    def _store_local(
+        self,
+        session_id: str,
+        messages: List[BaseMessage],
+        version: Optional[str],
+        replace: bool,
+    ) -> List[BaseMessage]:
         with self._lock:
             self._prune_expired()
-            payload = self._sessions.get(session_id)
-            if not payload:
-                return []
+            payload = None if replace else self._sessions.get(session_id)
+            if payload is None:
+                payload = {"messages": deque(maxlen=self._max_messages)}  # type: ignore[arg-type]
+                self._sessions[session_id] = payload
+            payload["messages"].extend(messages)
+            payload["expires_at"] = time.monotonic() + self._ttl
+            payload["version"] = version
+            # Mantiene el orden por expiración
+            self._sessions.move_to_end(session_id)
+
+            # Tope global: se descartan las sesiones escritas hace más tiempo
+            while len(self._sessions) > self._max_sessions:
+                evicted, _ = self._sessions.popitem(last=False)
+                logger.debug("Evicting chat session %s from local memory (LRU)", evicted)
 
             # Return a shallow copy to avoid accidental mutation
             return list(payload["messages"])
 
-    def append_message(self, session_id: str, message: BaseMessage) -> None:
-        with self._lock:
-            self._prune_expired()
-            payload = self._sessions.setdefault(
-                session_id,
-                {
-                    "messages": deque(maxlen=self._max_messages),  # type: ignore[arg-type]
-                    "expires_at": _utcnow() + self._ttl,
-                }
-            )
+    async def _rehydrate(self, session_id: str) -> List[BaseMessage]:
+        """Carga los últimos mensajes guardados de la conversación (solo ids de conversación reales)."""
+        try:
+            conversation_id = uuid.UUID(session_id)
+        except ValueError:
+            return []
+
+        try:
+            async with AsyncSessionLocal() as db:
+                rows = (
+                    await db.execute(
+                        select(MensajeChat.id, MensajeChat.remitente, MensajeChat.contenido)
+                        .where(MensajeChat.conversacion_id == conversation_id)
+                        .order_by(MensajeChat.created_at.desc(), MensajeChat.id.desc())
+                        .limit(self._max_messages)
+                    )
+                ).all()
+        except SQLAlchemyError:
+            logger.exception("No se pudo rehidratar la sesión de chat %s", session_id)
+            return []
+
+        return [
+            _DB_SENDER_MESSAGES.get(sender, AIMessage)(content=content, id=str(message_id))
+            for message_id, sender, content in reversed(rows)
+        ]
 
-            messages: Deque[BaseMessage] = payload["messages"]
-            messages.append(message)
-            payload["expires_at"] = _utcnow() + self._ttl
+    async def get_messages(self, session_id: str) -> List[BaseMessage]:
+        entry = self._local_entry(session_id)
 
-    def reset(self, session_id: str) -> None:
+        if self._redis is not None:
+            try:
+                version = await self._redis.version(session_id)
+                if version is not None:
+                    if entry is not None and entry.get("version") == version:
+                        return list(entry["messages"])
+                    version, messages = await self._redis.load(session_id)
+                    return self._store_local(session_id, messages, version, replace=True)
+                if entry is None:
+                    messages = await self._rehydrate(session_id)
+                    if not messages:
+                        return []
+                    version = await self._redis.append(session_id, messages)
+                    return self._store_local(session_id, messages, version, replace=True)
+            except redis_errors() as exc:
+                logger.warning("Redis no disponible para la memoria de chat %s: %s", session_id, exc)
+
+        if entry is not None:
+            return list(entry["messages"])
+
+        messages = await self._rehydrate(session_id)
+        if not messages:
+            return []
+        return self._store_local(session_id, messages, None, replace=True)
+
+    async def append_messages(self, session_id: str, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """Agrega mensajes al historial (cargándolo antes si está frío) y retorna el historial completo."""
+        await self.get_messages(session_id)
+
+        version = None
+        if self._redis is not None:
+            entry = self._local_entry(session_id)
+            seen_version = entry.get("version") if entry is not None else None
+            try:
+                version = await self._redis.append(session_id, messages)
+                if int(version) == 1 and entry is not None:
+                    # Redis perdió la lista (TTL o desalojo): se vuelve a sembrar con la copia local
+                    history = list(entry["messages"]) + list(messages)
+                    version = await self._redis.replace(session_id, history)
+                    return self._store_local(session_id, history, version, replace=True)
+                if int(version) != int(seen_version or 0) + 1:
+                    # Otro worker escribió entre la lectura y este append y la copia local no tiene
+                    # sus mensajes: se recarga la lista en lugar de sellarla con la versión nueva
+                    version, history = await self._redis.load(session_id)
+                    return self._store_local(session_id, history, version, replace=True)
+            except redis_errors() as exc:
+                logger.warning("Redis no disponible para la memoria de chat %s: %s", session_id, exc)
+        return self._store_local(session_id, messages, version, replace=False)
+
+    async def reset(self, session_id: str) -> None:
         with self._lock:
             self._sessions.pop(session_id, None)
+        if self._redis is not None:
+            try:
+                await self._redis.delete(session_id)
+            except redis_errors() as exc:
+                logger.warning("Redis no disponible para la memoria de chat %s: %s", session_id, exc)
+
+
+class PromptCacheMetrics:
+    """
+    Tokens de prompt por llamada al modelo y cuántos salieron del caché de prefijos del proveedor.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+
+    def record(self, usage: Optional[Dict[str, Any]]) -> None:
+        if not usage:
+            return
+        input_tokens = usage.get("input_tokens") or 0
+        cached_tokens = (usage.get("input_token_details") or {}).get("cache_read") or 0
+        self.requests += 1
+        self.input_tokens += input_tokens
+        self.cached_tokens += cached_tokens
+        logger.info("Prompt de chat: %d tokens, %d desde caché", input_tokens, cached_tokens)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "input_tokens": self.input_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cached_ratio": round(self.cached_tokens / self.input_tokens, 4) if self.input_tokens else 0.0,
+        }
+
+
+prompt_cache_metrics = PromptCacheMetrics()
+
+
+@lru_cache(maxsize=1024)
+def _context_message_for(serialized: str) -> SystemMessage:
+    return SystemMessage(content=f"Información adicional del alumno para apoyar mejor:\n{serialized}")
+
+
+def _context_message(context: Dict[str, Any]) -> SystemMessage:
+    """
+    Mensaje de contexto memorizado por su serialización canónica.
+
+    Con claves ordenadas el mismo contexto siempre produce los mismos bytes.
+    """
+    try:
+        serialized = json.dumps(context, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    except (TypeError, ValueError):
+        serialized = str(context)
+    return _context_message_for(serialized)
 
 
 class StudentSupportAgent:
@@ -229,14 +702,22 @@ class StudentSupportAgent:
         model_name: str,
         temperature: float,
         memory: SessionMemory,
+        history: ConversationHistory,
     ) -> None:
         self._memory = memory
+        self._history = history
+        # Mismo objeto (y mismos bytes) en cada llamada: es el inicio del prefijo cacheable
+        self._system_message = SystemMessage(content=self.SYSTEM_PROMPT)
         self.model_name = model_name
         self.temperature = temperature
+        self._timeout = settings.CHAT_LLM_TIMEOUT_SECONDS
         self._llm = ChatOpenAI(
             model=model_name,
             temperature=temperature,
             api_key=settings.OPENAI_API_KEY,
+            timeout=self._timeout,
+            # El último chunk del stream trae el uso de tokens (incluidos los cacheados)
+            stream_usage=True,
         )
         self._graph = self._build_graph()
 
@@ -247,78 +728,168 @@ class StudentSupportAgent:
         graph.add_edge("chat", END)
         return graph.compile()
 
-    def _chat_node(self, state: ChatAgentState) -> Dict[str, Any]:
-        history = state.get("messages", [])
-        context = state.get("context") or {}
-
-        context_message: Optional[SystemMessage] = None
+    def _build_prompt_messages(
+        self,
+        history: List[BaseMessage],
+        context: Dict[str, Any],
+        summary: Optional[str] = None,
+    ) -> List[BaseMessage]:
+        """
+        Arma el prompt de lo más estable a lo más cambiante para aprovechar el caché de prefijos
+        del proveedor: instrucciones, resumen, historial y, al final, el contexto del alumno.
+        """
+        prompt_messages: List[BaseMessage] = [self._system_message]
+        if summary:
+            prompt_messages.append(SystemMessage(content=f"Resumen de la conversación anterior:\n{summary}"))
+        prompt_messages.extend(history)
         if context:
-            try:
-                serialized = json.dumps(context, ensure_ascii=False, indent=2)
-            except (TypeError, ValueError):
-                serialized = str(context)
-            context_message = SystemMessage(
-                content=(
-                    "Información adicional del alumno para apoyar mejor:\n"
-                    f"{serialized}"
-                )
-            )
+            prompt_messages.append(_context_message(context))
+        return prompt_messages
 
-        prompt_messages: List[BaseMessage] = [SystemMessage(content=self.SYSTEM_PROMPT)]
-        if context_message:
-            prompt_messages.append(context_message)
-        prompt_messages.extend(history)
+    async def _chat_node(self, state: ChatAgentState) -> Dict[str, Any]:
+        history = state.get("messages", [])
+        prompt_messages = self._build_prompt_messages(history, state.get("context") or {}, state.get("summary"))
 
         logger.debug("Invocando modelo con %d mensajes de historial", len(history))
-        response = self._llm.invoke(prompt_messages)
+        # ainvoke no ocupa el event loop ni un hilo del executor mientras espera a OpenAI
+        response = await self._llm.ainvoke(prompt_messages)
+        prompt_cache_metrics.record(getattr(response, "usage_metadata", None))
         return {"messages": [response]}
 
     def get_memory(self) -> SessionMemory:
         return self._memory
 
+    async def _remember_utterances(
+        self,
+        session_id: str,
+        user_message: Union[str, List[str]],
+        message_ids: List[str],
+    ) -> List[BaseMessage]:
+        """Guarda los mensajes del alumno en memoria y retorna el historial resultante."""
+        utterances = [user_message] if isinstance(user_message, str) else list(user_message)
+        messages = [
+            HumanMessage(content=utterance, id=message_id)
+            for utterance, message_id in zip(utterances, message_ids)
+            if utterance
+        ]
+
+        if not messages:
+            return await self._memory.get_messages(session_id)
+        return await self._memory.append_messages(session_id, messages)
+
+    @staticmethod
+    def _message_ids(user_message: Union[str, List[str]], message_ids: Optional[List[str]]) -> List[str]:
+        """Ids para los mensajes del alumno y, al final, la respuesta; se generan si no vienen."""
+        count = 1 if isinstance(user_message, str) else len(user_message)
+        if message_ids is not None and len(message_ids) == count + 1:
+            return list(message_ids)
+        return [str(uuid.uuid4()) for _ in range(count + 1)]
+
     async def arun(
         self,
         session_id: str,
         user_message: Union[str, List[str]],
         context: Optional[Dict[str, Any]] = None,
+        message_ids: Optional[List[str]] = None,
     ) -> AIMessage:
-        context = context or {}
-        if isinstance(user_message, str):
-            utterances = [user_message] if user_message else []
-        else:
-            utterances = [text for text in user_message if text]
+        """
+        Responde al turno del alumno.
 
-        for utterance in utterances:
-            human = HumanMessage(content=utterance)
-            self._memory.append_message(session_id, human)
-        history = self._memory.get_messages(session_id)
+        ``message_ids`` son los ids con que se guardarán en ``mensajes_chat`` los mensajes del
+        alumno y, al final, la respuesta; la memoria usa los mismos para que el historial
+        rehidratado de la base conserve las marcas del resumen.
+        """
+        context = context or {}
+        message_ids = self._message_ids(user_message, message_ids)
+        history = await self._remember_utterances(session_id, user_message, message_ids[:-1])
+        summary, window = await self._history.build_window(session_id, history)
 
         state: ChatAgentState = {
-            "messages": history,
+            "messages": window,
             "context": context,
+            "summary": summary,
         }
 
-        result = await self._graph.ainvoke(state)
+        # Lanza asyncio.TimeoutError si el modelo no responde a tiempo; cancelar la tarea
+        # que espera aquí (p. ej. porque el cliente se desconectó) cancela la llamada HTTP
+        result = await asyncio.wait_for(self._graph.ainvoke(state), timeout=self._timeout)
         ai_messages = result.get("messages", [])
         if not ai_messages:
             raise RuntimeError("El agente no devolvió respuesta.")
 
         ai_message = ai_messages[-1]
-        self._memory.append_message(session_id, ai_message)
+        ai_message.id = message_ids[-1]
+        await self._memory.append_messages(session_id, [ai_message])
         return ai_message
 
+    async def astream(
+        self,
+        session_id: str,
+        user_message: Union[str, List[str]],
+        context: Optional[Dict[str, Any]] = None,
+        message_ids: Optional[List[str]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Igual que ``arun`` pero entrega el texto de la respuesta conforme el modelo lo genera.
+
+        La respuesta solo se guarda en memoria si el stream termina completo. Lanza
+        asyncio.TimeoutError si la respuesta completa tarda más de CHAT_LLM_TIMEOUT_SECONDS.
+        """
+        message_ids = self._message_ids(user_message, message_ids)
+        history = await self._remember_utterances(session_id, user_message, message_ids[:-1])
+        summary, window = await self._history.build_window(session_id, history)
+        prompt_messages = self._build_prompt_messages(window, context or {}, summary)
+
+        logger.debug("Invocando modelo en streaming con %d mensajes de historial", len(window))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._timeout
+        parts: List[str] = []
+        stream = self._llm.astream(prompt_messages)
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), timeout=max(0.0, deadline - loop.time()))
+                except StopAsyncIteration:
+                    break
+                if getattr(chunk, "usage_metadata", None):
+                    prompt_cache_metrics.record(chunk.usage_metadata)
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+        finally:
+            # Cierra la conexión con OpenAI también si el consumidor abandona el stream
+            await stream.aclose()
+
+        await self._memory.append_messages(session_id, [AIMessage(content="".join(parts), id=message_ids[-1])])
+
 
 session_memory = SessionMemory(
     max_messages=settings.CHAT_MEMORY_MAX_MESSAGES,
     ttl_seconds=settings.CHAT_SESSION_TTL_SECONDS,
+    max_sessions=settings.CHAT_MEMORY_MAX_SESSIONS,
+    redis_client=get_async_redis(),
 )
 
-message_buffer = MessageBuffer(
-    window_seconds=settings.CHAT_BUFFER_SECONDS,
+conversation_history = ConversationHistory(
+    token_budget=settings.CHAT_HISTORY_TOKEN_BUDGET,
+    max_messages=settings.CHAT_MEMORY_MAX_MESSAGES,
+    summarizer=ChatOpenAI(
+        model=settings.CHAT_SUMMARY_MODEL,
+        temperature=0,
+        max_tokens=settings.CHAT_SUMMARY_MAX_TOKENS,
+        api_key=settings.OPENAI_API_KEY,
+        timeout=settings.CHAT_LLM_TIMEOUT_SECONDS,
+    ) if settings.CHAT_SUMMARY_ENABLED else None,
+    max_sessions=settings.CHAT_MEMORY_MAX_SESSIONS,
+    ttl_seconds=settings.CHAT_SESSION_TTL_SECONDS,
+    redis_client=get_async_redis(),
 )
 
+message_buffer = _create_message_buffer()
+
 student_support_agent = StudentSupportAgent(
     model_name=settings.CHAT_OPENAI_MODEL,
     temperature=settings.CHAT_TEMPERATURE,
     memory=session_memory,
+    history=conversation_history,
 )
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from langchain.schema import BaseMessage, HumanMessage, SystemMessage
+
+from app.core.config import settings
+from app.core.redis_client import redis_errors
+
+logger = logging.getLogger(__name__)
+
+# Tokens fijos que la API agrega por mensaje (rol y separadores)
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+# Al resumir se cubre hasta dejar este tanto del presupuesto: el resumen va algo por delante
+# del corte y alcanza para varios turnos antes de tener que actualizarlo otra vez
+_SUMMARY_LOW_WATER = 0.6
+
+# Mientras se actualiza el resumen la ventana puede pasarse un poco del presupuesto en lugar de
+# recortarse por el frente: así el prefijo del prompt solo cambia cuando llega el resumen nuevo
+_BUDGET_SLACK = 1.25
+
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    """Codificador de tiktoken; None si no se puede cargar (p. ej. sin red para bajar el vocabulario)."""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+
+            try:
+                _encoding = tiktoken.encoding_for_model(settings.CHAT_OPENAI_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as exc:
+            _encoding_failed = True
+            logger.warning("No se pudo cargar tiktoken (%s); se estiman los tokens por longitud", exc)
+    return _encoding
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """Tokens de un texto; memorizado porque el mismo historial se cuenta en cada turno."""
+    encoding = _get_encoding()
+    if encoding is None:
+        # ~4 caracteres por token en español
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def message_tokens(message: BaseMessage) -> int:
+    return count_tokens(str(message.content)) + _MESSAGE_OVERHEAD_TOKENS
+
+
+def _message_marker(message: BaseMessage) -> str:
+    # La memoria asigna un id a cada mensaje; el hash del contenido es solo un respaldo
+    return message.id or hashlib.sha1(f"{message.type}:{message.content}".encode()).hexdigest()
+
+
+class ConversationHistory:
+    """
+    Recorta el historial a un presupuesto de tokens y resume lo que queda fuera.
+
+    Los turnos más recientes entran completos hasta ``token_budget`` (y sin pasar de lo que
+    guarda la memoria de la sesión, ``max_messages``); los anteriores se
+    condensan en un resumen por sesión que se actualiza en segundo plano con un modelo barato.
+    El turno actual usa el último resumen disponible, así que resumir no agrega latencia.
+    """
+
+    SUMMARY_PROMPT = (
+        "Resume la conversación entre un estudiante y CalmaBot, su mentor de bienestar académico. "
+        "Conserva lo que sirva para seguir acompañándolo: nombre, materias, fechas, preocupaciones, "
+        "estado de ánimo y acuerdos o sugerencias ya dadas. Escribe en español, en tercera persona, "
+        "en un solo párrafo breve. Integra el resumen anterior con los mensajes nuevos."
+    )
+
+    def __init__(
+        self,
+        token_budget: int,
+        max_messages: int,
+        summarizer,
+        max_sessions: int,
+        ttl_seconds: int,
+        redis_client=None,
+    ):
+        self._token_budget = max(1, token_budget)
+        # La memoria descarta los mensajes más viejos al llenarse: se resumen un turno antes
+        self._max_messages = max(1, max_messages - 2)
+        self._summarizer = summarizer
+        self._max_sessions = max(1, max_sessions)
+        self._ttl = ttl_seconds
+        self._redis = redis_client
+        self._summaries: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self._lock = Lock()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def _split(history: List[BaseMessage], token_budget: float, max_count: float) -> int:
+        """Índice del primer mensaje que cabe en el presupuesto (el último siempre entra)."""
+        used = 0
+        start = len(history)
+        while start > 0:
+            tokens = message_tokens(history[start - 1])
+            if (used + tokens > token_budget or len(history) - start + 1 > max_count) and start < len(history):
+                break
+            used += tokens
+            start -= 1
+        return start
+
+    async def _load_summary(self, session_id: str) -> Optional[Dict[str, str]]:
+        if self._redis is not None:
+            try:
+                raw = await self._redis.get(f"chat:summary:{session_id}")
+                if raw is not None:
+                    return json.loads(raw)
+            except redis_errors() as exc:
+                logger.warning("Redis no disponible para el resumen de chat %s: %s", session_id, exc)
+        with self._lock:
+            return self._summaries.get(session_id)
+
+    async def _store_summary(self, session_id: str, summary: Dict[str, str]) -> None:
+        with self._lock:
+            self._summaries[session_id] = summary
+            self._summaries.move_to_end(session_id)
+            while len(self._summaries) > self._max_sessions:
+                self._summaries.popitem(last=False)
+        if self._redis is not None:
+            try:
+                await self._redis.set(f"chat:summary:{session_id}", json.dumps(summary), ex=self._ttl)
+            except redis_errors() as exc:
+                logger.warning("Redis no disponible para el resumen de chat %s: %s", session_id, exc)
+
+    async def build_window(
+        self,
+        session_id: str,
+        history: List[BaseMessage],
+    ) -> Tuple[Optional[str], List[BaseMessage]]:
+        """
+        Retorna ``(resumen, mensajes recientes)`` para armar el prompt.
+
+        Si hay mensajes fuera de la ventana que el resumen aún no cubre, agenda su actualización.
+        Hasta que termine, el turno usa el resumen anterior.
+        """
+        # También sin mensajes fuera de la ventana: el resumen puede cubrir turnos que ya
+        # salieron de la memoria de la sesión
+        summary = await self._load_summary(session_id)
+        summary_text = (summary or {}).get("text")
+
+        # El resumen cubre hasta su marcador; si el marcador ya salió de la memoria,
+        # todo lo que hay en ella es posterior a él
+        folded = 0
+        if summary:
+            markers = [_message_marker(message) for message in history]
+            if summary.get("marker") in markers:
+                folded = len(markers) - markers[::-1].index(summary["marker"])
+
+        start = self._split(history, self._token_budget, self._max_messages)
+        if folded < start and self._summarizer is not None and session_id not in self._refreshing:
+            fold_until = self._split(
+                history,
+                self._token_budget * _SUMMARY_LOW_WATER,
+                self._max_messages * _SUMMARY_LOW_WATER,
+            )
+            task = asyncio.create_task(self._refresh_summary(session_id, summary, history[folded:fold_until]))
+            self._refreshing[session_id] = task
+            task.add_done_callback(lambda done, session_id=session_id: self._finish_refresh(done, session_id))
+
+        # Si lo que sigue al resumen cabe (con holgura), la ventana arranca justo después de él
+        # y su inicio no se mueve hasta el próximo resumen: prefijo estable para el caché
+        if folded >= self._split(history, self._token_budget * _BUDGET_SLACK, self._max_messages + 2):
+            return summary_text, history[folded:]
+        return summary_text, history[start:]
+
+    async def _refresh_summary(
+        self,
+        session_id: str,
+        summary: Optional[Dict[str, str]],
+        messages: List[BaseMessage],
+    ) -> None:
+        transcript = "\n".join(
+            f"{'Estudiante' if isinstance(message, HumanMessage) else 'CalmaBot'}: {message.content}"
+            for message in messages
+        )
+        previous = (summary or {}).get("text") or "(sin resumen previo)"
+        response = await self._summarizer.ainvoke([
+            SystemMessage(content=self.SUMMARY_PROMPT),
+            HumanMessage(content=f"Resumen anterior:\n{previous}\n\nMensajes nuevos:\n{transcript}"),
+        ])
+        await self._store_summary(session_id, {
+            "text": str(response.content).strip(),
+            "marker": _message_marker(messages[-1]),
+        })
+
+    def _finish_refresh(self, task: asyncio.Task, session_id: str) -> None:
+        self._refreshing.pop(session_id, None)
+        # Nadie espera esta tarea: si falla, el próximo turno lo vuelve a intentar
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Error actualizando el resumen de la sesión de chat %s: %s", session_id, task.exception())
+
+    async def reset(self, session_id: str) -> None:
+        with self._lock:
+            self._summaries.pop(session_id, None)
+        if self._redis is not None:
+            try:
+                await self._redis.delete(f"chat:summary:{session_id}")
+            except redis_errors() as exc:
+                logger.warning("Redis no disponible para el resumen de chat %s: %s", session_id, exc)
@@ -0,0 +1,284 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.core.redis_client import get_async_redis, redis_errors
+from app.db.base import AsyncSessionLocal
+from app.models.chat import ConversacionChat, MensajeChat
+
+logger = logging.getLogger(__name__)
+
+
+class ChatWriteMetrics:
+    """
+    Contadores de la cola de escritura: profundidad, lotes y cuánto tarda cada flush.
+    """
+
+    def __init__(self):
+        self.batches = 0
+        self.rows = 0
+        self.failures = 0
+        self.dropped = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+
+    def record_flush(self, seconds: float, rows: int) -> None:
+        self.batches += 1
+        self.rows += rows
+        self.flush_seconds_total += seconds
+        self.flush_seconds_max = max(self.flush_seconds_max, seconds)
+
+    def snapshot(self, queued_rows: int, oldest_age_seconds: float) -> Dict[str, Any]:
+        average = self.flush_seconds_total / self.batches if self.batches else 0.0
+        return {
+            "queued_rows": queued_rows,
+            "oldest_queued_ms": round(oldest_age_seconds * 1000, 3),
+            "batches": self.batches,
+            "rows": self.rows,
+            "rows_per_batch_avg": round(self.rows / self.batches, 3) if self.batches else 0.0,
+            "flush_avg_ms": round(average * 1000, 3),
+            "flush_max_ms": round(self.flush_seconds_max * 1000, 3),
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+
+
+class ChatMessageWriter:
+    """
+    Cola de escritura diferida (write-behind) para los mensajes del chat.
+
+    Las peticiones encolan las filas y responden sin esperar a la base; una tarea de fondo
+    las inserta en lotes multi-fila (al juntar ``batch_size`` o cada ``flush_interval``) y
+    actualiza ``updated_at`` de las conversaciones en el mismo commit. Al apagar se vacía la
+    cola. Sin la tarea corriendo (scripts, pruebas) cada envío se escribe en el momento.
+    """
+
+    def __init__(self, batch_size: int, flush_interval_seconds: float, max_queue: int):
+        self._batch_size = max(1, batch_size)
+        self._interval = max(0.01, flush_interval_seconds)
+        self._max_queue = max(self._batch_size, max_queue)
+        # (momento en que se encoló, fila): los reintentos vuelven al frente con su hora original
+        self._rows: List[Tuple[float, Dict[str, Any]]] = []
+        # Lote que se está escribiendo; sigue contando como pendiente en las métricas
+        self._in_flight: List[Tuple[float, Dict[str, Any]]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.metrics = ChatWriteMetrics()
+
+    async def submit(
+        self,
+        conversation_id: uuid.UUID,
+        messages: List[Dict[str, Any]],
+    ) -> None:
+        """
+        Encola los mensajes de un intercambio (``remitente``, ``contenido``, ``metadata_json``,
+        ``created_at`` y opcionalmente ``id``). Solo espera a la base si el writer no está corriendo.
+        """
+        rows = [
+            {"id": uuid.uuid4(), "conversacion_id": conversation_id, **message}
+            for message in messages
+        ]
+        if not rows:
+            return
+        if self._task is None or self._task.done():
+            await self._write(rows)
+            return
+
+        if len(self._rows) + len(rows) > self._max_queue:
+            # La base lleva un buen rato caída: se descarta lo más viejo antes que crecer sin límite
+            overflow = len(self._rows) + len(rows) - self._max_queue
+            del self._rows[:overflow]
+            self.metrics.dropped += overflow
+            logger.error("Cola de mensajes de chat llena; se descartaron %d mensajes", overflow)
+
+        enqueued_at = time.monotonic()
+        self._rows.extend((enqueued_at, row) for row in rows)
+        if len(self._rows) >= self._batch_size:
+            self._wakeup.set()
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> None:
+        started = time.perf_counter()
+        conversation_ids = {row["conversacion_id"] for row in rows}
+        async with AsyncSessionLocal() as db:
+            try:
+                # Un solo INSERT ... VALUES multi-fila por lote (con asyncpg, pasar la lista como
+                # parámetros sería un executemany: una sentencia por fila). Los ids se asignan al
+                # encolar, así que reintentar un lote que sí llegó a escribirse no duplica nada
+                await db.execute(
+                    insert(MensajeChat).values(rows).on_conflict_do_nothing(index_elements=["id"])
+                )
+                await db.execute(
+                    update(ConversacionChat)
+                    .where(ConversacionChat.id.in_(conversation_ids))
+                    .values(updated_at=datetime.utcnow())
+                )
+                await db.commit()
+            except Exception:
+                self.metrics.failures += 1
+                await db.rollback()
+                raise
+        self.metrics.record_flush(time.perf_counter() - started, len(rows))
+
+    async def flush(self) -> None:
+        while self._rows:
+            batch = self._rows[:self._batch_size]
+            del self._rows[:len(batch)]
+            self._in_flight = batch
+            try:
+                try:
+                    await self._write([row for _, row in batch])
+                except IntegrityError:
+                    # Una fila inválida (p. ej. conversación inexistente) no debe atorar la cola:
+                    # se reintenta por conversación y se descarta solo la que falla
+                    await self._write_per_conversation([row for _, row in batch])
+            except Exception:
+                # Cualquier falla (con asyncpg, una base caída llega como OSError y no como
+                # SQLAlchemyError): el lote vuelve al frente para reintentarse en el próximo ciclo
+                self._rows[:0] = batch
+                raise
+            finally:
+                self._in_flight = []
+
+    async def _write_per_conversation(self, rows: List[Dict[str, Any]]) -> None:
+        by_conversation: Dict[uuid.UUID, List[Dict[str, Any]]] = {}
+        for row in rows:
+            by_conversation.setdefault(row["conversacion_id"], []).append(row)
+        for conversation_id, conversation_rows in by_conversation.items():
+            try:
+                await self._write(conversation_rows)
+            except IntegrityError:
+                self.metrics.dropped += len(conversation_rows)
+                logger.exception(
+                    "Se descartaron %d mensajes de la conversación %s", len(conversation_rows), conversation_id
+                )
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # La tarea sigue viva: lo que quedó en cola se reintenta en el próximo ciclo
+                logger.exception("No se pudieron guardar %d mensajes de chat; se reintentará", len(self._rows))
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        # Se deja terminar el ciclo en curso en lugar de cancelarlo a mitad de un lote
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        # Lo que quedó en cola se escribe antes de terminar el proceso
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Se perdieron %d mensajes de chat al apagar", len(self._rows))
+
+    def stats(self) -> Dict[str, Any]:
+        pending = self._in_flight or self._rows
+        oldest_age = time.monotonic() - pending[0][0] if pending else 0.0
+        return self.metrics.snapshot(len(self._in_flight) + len(self._rows), oldest_age)
+
+
+chat_message_writer = ChatMessageWriter(
+    batch_size=settings.CHAT_PERSIST_BATCH_SIZE,
+    flush_interval_seconds=settings.CHAT_PERSIST_FLUSH_INTERVAL_SECONDS,
+    max_queue=settings.CHAT_PERSIST_MAX_QUEUE,
+)
+
+
+class ChatIdentityCache:
+    """
+    Caché ``google_id -> (id del alumno, id de su conversación activa)``.
+
+    Con él un turno de chat no consulta la base: el alumno y su conversación solo se buscan
+    la primera vez (o al expirar la entrada). Al crear una conversación nueva la entrada se
+    sobrescribe con ella. Se comparte por Redis si está disponible; si no, vive en el proceso.
+    """
+
+    _prefix = "chat:identity:"
+
+    def __init__(self, ttl_seconds: int, max_entries: int, redis_client=None):
+        self._ttl = ttl_seconds
+        self._max_entries = max(1, max_entries)
+        self._redis = redis_client
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, str]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def _load(self, google_id: str) -> Optional[Dict[str, str]]:
+        if self._redis is not None:
+            try:
+                raw = await self._redis.get(self._prefix + google_id)
+                return json.loads(raw) if raw is not None else None
+            except redis_errors() as exc:
+                logger.warning("Redis no disponible para la identidad de chat de %s: %s", google_id, exc)
+        cached = self._entries.get(google_id)
+        if cached is None:
+            return None
+        if cached[0] <= time.monotonic():
+            del self._entries[google_id]
+            return None
+        return cached[1]
+
+    async def get(self, google_id: str) -> Optional[Tuple[uuid.UUID, uuid.UUID]]:
+        """Retorna ``(id del alumno, id de la conversación activa)`` o None si no está en caché."""
+        entry = await self._load(google_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return uuid.UUID(entry["user_id"]), uuid.UUID(entry["conversation_id"])
+
+    async def remember(self, google_id: str, user_id: uuid.UUID, conversation_id: uuid.UUID) -> None:
+        if self._ttl <= 0:
+            return
+        entry = {"user_id": str(user_id), "conversation_id": str(conversation_id)}
+        # La copia local también se escribe: respalda a Redis si deja de responder
+        self._entries[google_id] = (time.monotonic() + self._ttl, entry)
+        self._entries.move_to_end(google_id)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+        if self._redis is not None:
+            try:
+                await self._redis.set(self._prefix + google_id, json.dumps(entry), ex=self._ttl)
+            except redis_errors() as exc:
+                logger.warning("Redis no disponible para la identidad de chat de %s: %s", google_id, exc)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "local_entries": len(self._entries),
+        }
+
+
+chat_identity_cache = ChatIdentityCache(
+    ttl_seconds=settings.CHAT_IDENTITY_CACHE_TTL_SECONDS,
+    max_entries=settings.CHAT_MEMORY_MAX_SESSIONS,
+    redis_client=get_async_redis(),
+)
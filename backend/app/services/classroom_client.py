@@ -0,0 +1,133 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import HttpRequest
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_discovery_lock = threading.Lock()
+_discovery_document: Optional[Dict[str, Any]] = None
+
+_thread_local = threading.local()
+
+
+def authorized_http(credentials) -> AuthorizedHttp:
+    """
+    Http autorizado para una sola llamada.
+
+    httplib2 no es thread-safe, así que cada hilo usa su propio ``httplib2.Http`` (y conserva
+    sus conexiones keep-alive); el AuthorizedHttp que lo envuelve solo agrega el token.
+    """
+    http = getattr(_thread_local, "http", None)
+    if http is None:
+        http = _thread_local.http = httplib2.Http()
+    return AuthorizedHttp(credentials, http=http)
+
+
+def _get_discovery_document() -> Optional[Dict[str, Any]]:
+    """
+    Retorna el discovery document de Classroom ya parseado, compartido por todo el proceso.
+
+    googleapiclient completa los métodos del documento de forma perezosa; esas escrituras son
+    idempotentes, así que compartir el dict entre servicios es seguro.
+    """
+    global _discovery_document
+    if _discovery_document is None:
+        with _discovery_lock:
+            if _discovery_document is None:
+                raw_document = get_static_doc("classroom", "v1")
+                if raw_document:
+                    _discovery_document = json.loads(raw_document)
+    return _discovery_document
+
+
+def _create_service(credentials):
+    def request_builder(http, *args, **kwargs):
+        # Cada petición resuelve su Http al crearse, en el hilo que la va a ejecutar:
+        # así un mismo servicio se puede compartir entre los hilos del pool
+        return HttpRequest(authorized_http(credentials), *args, **kwargs)
+
+    document = _get_discovery_document()
+    if document is None:
+        # Versiones sin discovery estático: construimos como antes
+        return build(
+            "classroom",
+            "v1",
+            credentials=credentials,
+            cache_discovery=False,
+            requestBuilder=request_builder,
+        )
+    return build_from_document(document, credentials=credentials, requestBuilder=request_builder)
+
+
+class ClassroomServiceCache:
+    """
+    Caché LRU con TTL de servicios de Classroom por usuario y token.
+
+    Un solo servicio por entrada, compartido por todos los hilos: las peticiones que arma
+    no comparten Http (ver ``authorized_http``).
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self._max_entries = max(1, max_entries)
+        self._ttl = ttl_seconds
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, credentials, google_id: Optional[str] = None):
+        key = (google_id, credentials.token)
+        now = time.monotonic()
+
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and cached[0] > now:
+                self._entries.move_to_end(key)
+                return cached[1]
+            self._entries.pop(key, None)
+
+        service = _create_service(credentials)
+
+        with self._lock:
+            # Si otro hilo lo construyó mientras tanto, todos usan el mismo
+            cached = self._entries.get(key)
+            if cached and cached[0] > now:
+                return cached[1]
+            self._entries[key] = (now + self._ttl, service)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+        return service
+
+    def invalidate(self, google_id: str, current_token: Optional[str] = None) -> None:
+        """Descarta los servicios del usuario ligados a un token distinto de ``current_token``."""
+        with self._lock:
+            stale_keys = [
+                key for key in self._entries
+                if key[0] == google_id and (current_token is None or key[1] != current_token)
+            ]
+            for key in stale_keys:
+                self._entries.pop(key, None)
+        if stale_keys:
+            logger.debug("Invalidados %d servicios de Classroom para %s", len(stale_keys), google_id)
+
+
+classroom_services = ClassroomServiceCache(
+    max_entries=settings.CLASSROOM_SERVICE_CACHE_SIZE,
+    ttl_seconds=settings.CLASSROOM_SERVICE_CACHE_TTL_SECONDS,
+)
+
+
+def build_classroom_service(credentials, google_id: Optional[str] = None):
+    """Obtiene un servicio de Classroom reutilizable para las credenciales dadas."""
+    return classroom_services.get(credentials, google_id=google_id)
@@ -0,0 +1,485 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from googleapiclient.errors import HttpError
+from sqlalchemy import delete, exists, func, select
+from sqlalchemy.orm import Session
+
+from app.api.auth import get_credentials_for_user, list_token_users
+from app.core.config import settings
+from app.db.base import SessionLocal
+from app.db.bulk import UpsertResult, bulk_upsert
+from app.models import Anuncio, Curso, CursoEstudiante, Entrega, EstadoSincronizacion, Tarea, User
+from app.services.google_classroom import (
+    _build_service,
+    _ensure_aware,
+    _list_courses,
+    _parse_due_datetime,
+    _parse_iso_datetime,
+    build_student_dashboard,
+)
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_COURSEWORK = "coursework"
+RESOURCE_ANNOUNCEMENTS = "announcements"
+RESOURCE_SUBMISSIONS = "submissions"
+
+_SUBMITTED_STATES = {"TURNED_IN", "RETURNED"}
+
+
+def _list_updated_since(
+    request_factory: Callable[[Optional[str]], Any],
+    items_key: str,
+    watermark: Optional[datetime],
+) -> List[Dict[str, Any]]:
+    """
+    Pagina un listado ordenado por updateTime desc y se detiene al alcanzar la marca de agua.
+    """
+    items: List[Dict[str, Any]] = []
+    page_token: Optional[str] = None
+    while True:
+        response = request_factory(page_token).execute()
+        for item in response.get(items_key, []):
+            updated_at = _parse_iso_datetime(item.get("updateTime"))
+            if watermark and updated_at and updated_at <= watermark:
+                return items
+            items.append(item)
+
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return items
+
+
+def _list_submissions_since(service, course_id: str, watermark: Optional[datetime]) -> List[Dict[str, Any]]:
+    # studentSubmissions no admite orderBy: se recorre todo y se filtra localmente
+    submissions: List[Dict[str, Any]] = []
+    page_token: Optional[str] = None
+    while True:
+        response = service.courses().courseWork().studentSubmissions().list(
+            courseId=course_id,
+            courseWorkId="-",
+            userId="me",
+            pageSize=100,
+            pageToken=page_token,
+        ).execute()
+        for submission in response.get("studentSubmissions", []):
+            updated_at = _parse_iso_datetime(submission.get("updateTime"))
+            if watermark is None or updated_at is None or updated_at > watermark:
+                submissions.append(submission)
+
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return submissions
+
+
+def _list_ids(request_factory: Callable[[Optional[str]], Any], items_key: str) -> Set[str]:
+    """Ids de todos los elementos vigentes; con ``fields`` cada página solo trae los ids."""
+    ids: Set[str] = set()
+    page_token: Optional[str] = None
+    while True:
+        response = request_factory(page_token).execute()
+        ids.update(item["id"] for item in response.get(items_key, []))
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return ids
+
+
+def _max_update_time(items: Iterable[Dict[str, Any]], current: Optional[datetime]) -> Optional[datetime]:
+    latest = current
+    for item in items:
+        updated_at = _parse_iso_datetime(item.get("updateTime"))
+        if updated_at and (latest is None or updated_at > latest):
+            latest = updated_at
+    return latest
+
+
+def _below_first_skipped(
+    persisted: List[Dict[str, Any]],
+    fetched: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """
+    Elementos guardados que pueden mover la marca de agua.
+
+    Las entregas no vienen ordenadas: si alguna se omitió (su tarea aún no está sincronizada),
+    la marca no puede pasar de su updateTime o la siguiente pasada ya no la pediría.
+    """
+    persisted_ids = {item["id"] for item in persisted}
+    skipped_times = [
+        _parse_iso_datetime(item.get("updateTime"))
+        for item in fetched
+        if item["id"] not in persisted_ids
+    ]
+    skipped_times = [updated_at for updated_at in skipped_times if updated_at is not None]
+    if not skipped_times:
+        return persisted
+    first_skipped = min(skipped_times)
+    return [
+        item for item in persisted
+        if (_parse_iso_datetime(item.get("updateTime")) or first_skipped) < first_skipped
+    ]
+
+
+def _curso_row(course: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "classroom_id": course["id"],
+        "nombre": course.get("name") or "Curso sin nombre",
+        "descripcion": course.get("descriptionHeading"),
+        "seccion": course.get("section"),
+        "sala": course.get("room"),
+        "estado": course.get("courseState", "ACTIVE"),
+        "classroom_updated_at": _parse_iso_datetime(course.get("updateTime")),
+    }
+
+
+def _tarea_row(work: Dict[str, Any], curso_id) -> Dict[str, Any]:
+    return {
+        "classroom_id": work["id"],
+        "curso_id": curso_id,
+        "titulo": work.get("title") or "Sin título",
+        "descripcion": work.get("description"),
+        "fecha_creacion": _parse_iso_datetime(work.get("creationTime")),
+        "fecha_limite": _parse_due_datetime(work.get("dueDate"), work.get("dueTime")),
+        "puntos_maximos": work.get("maxPoints"),
+        "classroom_updated_at": _parse_iso_datetime(work.get("updateTime")),
+    }
+
+
+def _anuncio_row(announcement: Dict[str, Any], curso_id) -> Dict[str, Any]:
+    text = announcement.get("text") or ""
+    return {
+        "classroom_id": announcement["id"],
+        "curso_id": curso_id,
+        "titulo": text[:500] or None,
+        "contenido": text,
+        "classroom_updated_at": _parse_iso_datetime(announcement.get("updateTime")),
+    }
+
+
+def _entrega_row(submission: Dict[str, Any], tarea_id, estudiante_id) -> Dict[str, Any]:
+    state = submission.get("state")
+    updated_at = _parse_iso_datetime(submission.get("updateTime"))
+    return {
+        "classroom_id": submission["id"],
+        "tarea_id": tarea_id,
+        "estudiante_id": estudiante_id,
+        "estado": state or "NEW",
+        "calificacion": submission.get("assignedGrade"),
+        "retrasada": bool(submission.get("late")),
+        "fecha_entrega": updated_at if state in _SUBMITTED_STATES else None,
+        "classroom_updated_at": updated_at,
+    }
+
+
+def _accumulate(counts: Dict[str, Dict[str, int]], table: str, result: UpsertResult) -> None:
+    totals = counts.setdefault(table, {"inserted": 0, "updated": 0, "skipped": 0})
+    for field in ("inserted", "updated", "skipped"):
+        totals[field] += result[field]
+
+
+def _count_deleted(counts: Dict[str, Dict[str, int]], table: str, deleted: int) -> None:
+    totals = counts.setdefault(table, {"inserted": 0, "updated": 0, "skipped": 0})
+    totals["deleted"] = totals.get("deleted", 0) + deleted
+
+
+def _sync_enrollments(db: Session, estudiante_id, curso_ids: Iterable[Any]) -> None:
+    active = set(curso_ids)
+    enrolled = {
+        row.curso_id: row
+        for row in db.query(CursoEstudiante).filter(CursoEstudiante.estudiante_id == estudiante_id)
+    }
+    for curso_id in active - set(enrolled):
+        db.add(CursoEstudiante(curso_id=curso_id, estudiante_id=estudiante_id))
+    for curso_id in set(enrolled) - active:
+        db.delete(enrolled[curso_id])
+
+
+def _load_watermarks(db: Session, usuario_id) -> Dict[Tuple[Any, str], EstadoSincronizacion]:
+    return {
+        (state.curso_id, state.recurso): state
+        for state in db.query(EstadoSincronizacion).filter(EstadoSincronizacion.usuario_id == usuario_id)
+    }
+
+
+def _sync_course(
+    db: Session,
+    service,
+    user: User,
+    course_id: str,
+    curso_id,
+    watermarks: Dict[Tuple[Any, str], EstadoSincronizacion],
+    counts: Dict[str, Dict[str, int]],
+) -> None:
+    def _watermark(resource: str) -> Optional[datetime]:
+        state = watermarks.get((curso_id, resource))
+        return _ensure_aware(state.marca_agua) if state else None
+
+    def _advance(resource: str, items: List[Dict[str, Any]]) -> None:
+        state = watermarks.get((curso_id, resource))
+        if state is None:
+            state = EstadoSincronizacion(usuario_id=user.id, curso_id=curso_id, recurso=resource)
+            db.add(state)
+            watermarks[(curso_id, resource)] = state
+        state.marca_agua = _max_update_time(items, _ensure_aware(state.marca_agua))
+        state.sincronizado_en = datetime.now(timezone.utc)
+
+    coursework = _list_updated_since(
+        lambda token: service.courses().courseWork().list(
+            courseId=course_id, pageSize=50, orderBy="updateTime desc", pageToken=token
+        ),
+        "courseWork",
+        _watermark(RESOURCE_COURSEWORK),
+    )
+    tareas = bulk_upsert(db, Tarea, [_tarea_row(work, curso_id) for work in coursework])
+    _advance(RESOURCE_COURSEWORK, coursework)
+    _accumulate(counts, "tareas", tareas)
+
+    announcements = _list_updated_since(
+        lambda token: service.courses().announcements().list(
+            courseId=course_id, pageSize=50, orderBy="updateTime desc", pageToken=token
+        ),
+        "announcements",
+        _watermark(RESOURCE_ANNOUNCEMENTS),
+    )
+    _accumulate(counts, "anuncios", bulk_upsert(db, Anuncio, [_anuncio_row(item, curso_id) for item in announcements]))
+    _advance(RESOURCE_ANNOUNCEMENTS, announcements)
+
+    submissions = _list_submissions_since(service, course_id, _watermark(RESOURCE_SUBMISSIONS))
+    tarea_ids = dict(tareas["ids"])
+    missing_ids = {submission["courseWorkId"] for submission in submissions} - set(tarea_ids)
+    if missing_ids:
+        tarea_ids.update(
+            db.query(Tarea.classroom_id, Tarea.id).filter(Tarea.classroom_id.in_(missing_ids))
+        )
+    persisted = [submission for submission in submissions if submission["courseWorkId"] in tarea_ids]
+    entrega_rows = [
+        _entrega_row(submission, tarea_ids[submission["courseWorkId"]], user.id)
+        for submission in persisted
+    ]
+    _accumulate(counts, "entregas", bulk_upsert(db, Entrega, entrega_rows))
+    _advance(RESOURCE_SUBMISSIONS, _below_first_skipped(persisted, submissions))
+
+
+def _prune_course(
+    db: Session,
+    service,
+    user: User,
+    course_id: str,
+    curso_id,
+    counts: Dict[str, Dict[str, int]],
+) -> None:
+    """
+    Borra lo que ya no existe en Classroom; las marcas de agua no ven eliminaciones.
+
+    El alumno solo ve las tareas asignadas a él, así que una tarea ausente de su listado
+    solo pierde su entrega; la tarea se borra cuando nadie conserva entregas de ella.
+    """
+    coursework_ids = _list_ids(
+        lambda token: service.courses().courseWork().list(
+            courseId=course_id, pageSize=100, pageToken=token, fields="courseWork(id),nextPageToken"
+        ),
+        "courseWork",
+    )
+    missing_tareas = select(Tarea.id).where(Tarea.curso_id == curso_id, Tarea.classroom_id.not_in(coursework_ids))
+    entregas = db.execute(
+        delete(Entrega)
+        .where(Entrega.estudiante_id == user.id, Entrega.tarea_id.in_(missing_tareas))
+        .execution_options(synchronize_session=False)
+    )
+    tareas = db.execute(
+        delete(Tarea)
+        .where(Tarea.id.in_(missing_tareas), ~exists().where(Entrega.tarea_id == Tarea.id))
+        .execution_options(synchronize_session=False)
+    )
+    _count_deleted(counts, "entregas", entregas.rowcount)
+    _count_deleted(counts, "tareas", tareas.rowcount)
+
+    announcement_ids = _list_ids(
+        lambda token: service.courses().announcements().list(
+            courseId=course_id, pageSize=100, pageToken=token, fields="announcements(id),nextPageToken"
+        ),
+        "announcements",
+    )
+    anuncios = db.execute(
+        delete(Anuncio)
+        .where(Anuncio.curso_id == curso_id, Anuncio.classroom_id.not_in(announcement_ids))
+        .execution_options(synchronize_session=False)
+    )
+    _count_deleted(counts, "anuncios", anuncios.rowcount)
+
+
+def sync_student(google_id: str) -> Dict[str, Dict[str, int]]:
+    """
+    Sincroniza de forma incremental los cursos, tareas, entregas y anuncios del alumno en Postgres.
+
+    Cada curso y recurso guarda la marca de agua del updateTime más reciente, de modo que en
+    las siguientes pasadas solo se descargan y escriben los elementos que cambiaron. Después,
+    un listado de solo ids por curso borra las tareas y anuncios eliminados en Classroom.
+    """
+    counts: Dict[str, Dict[str, int]] = {}
+    credentials = get_credentials_for_user(google_id)
+    service = _build_service(credentials, google_id)
+
+    with SessionLocal() as db:
+        user = db.query(User).filter(User.google_id == google_id).first()
+        if user is None:
+            logger.debug("Usuario %s sin registro local; se omite la sincronización.", google_id)
+            return counts
+
+        courses = _list_courses(service, studentId="me", courseStates=["ACTIVE"], pageSize=20)
+        cursos = bulk_upsert(db, Curso, [_curso_row(course) for course in courses])
+        course_map = cursos["ids"]
+        _sync_enrollments(db, user.id, course_map.values())
+        _accumulate(counts, "cursos", cursos)
+
+        watermarks = _load_watermarks(db, user.id)
+        for course in courses:
+            try:
+                with db.begin_nested():
+                    _sync_course(db, service, user, course["id"], course_map[course["id"]], watermarks, counts)
+                    _prune_course(db, service, user, course["id"], course_map[course["id"]], counts)
+            except HttpError:
+                # El curso conserva su marca de agua y se reintenta en la siguiente pasada
+                logger.warning("No se pudo sincronizar el curso %s de %s", course["id"], google_id, exc_info=True)
+
+        db.commit()
+
+    logger.info("Sincronización Classroom de %s: %s", google_id, counts)
+    return counts
+
+
+def _classroom_due_fields(due_dt: Optional[datetime]) -> Dict[str, Any]:
+    due_dt = _ensure_aware(due_dt)
+    if not due_dt:
+        return {}
+    return {
+        "dueDate": {"year": due_dt.year, "month": due_dt.month, "day": due_dt.day},
+        "dueTime": {"hours": due_dt.hour, "minutes": due_dt.minute, "seconds": due_dt.second},
+    }
+
+
+def load_synced_student_dashboard(google_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Arma el dashboard de alumno desde Postgres.
+
+    Retorna None si el usuario no se ha sincronizado o su última sincronización es demasiado
+    antigua; en ese caso el llamador debe consultar Classroom en vivo.
+    """
+    with SessionLocal() as db:
+        user_id = db.scalar(select(User.id).where(User.google_id == google_id))
+        if user_id is None:
+            return None
+
+        last_sync = db.scalar(
+            select(func.max(EstadoSincronizacion.sincronizado_en))
+            .where(EstadoSincronizacion.usuario_id == user_id)
+        )
+        max_age = timedelta(seconds=settings.CLASSROOM_SYNC_MAX_STALENESS_SECONDS)
+        if last_sync is None or datetime.now(timezone.utc) - _ensure_aware(last_sync) > max_age:
+            return None
+
+        course_rows = db.execute(
+            select(Curso.id, Curso.classroom_id, Curso.nombre)
+            .join(CursoEstudiante, CursoEstudiante.curso_id == Curso.id)
+            .where(CursoEstudiante.estudiante_id == user_id, Curso.estado == "ACTIVE")
+            .order_by(Curso.nombre)
+        ).all()
+        selected = {row.id: row.classroom_id for row in course_rows[:5]}
+
+        coursework_by_course: Dict[str, List[Dict[str, Any]]] = {}
+        announcements_by_course: Dict[str, List[Dict[str, Any]]] = {}
+        if selected:
+            ranked_tareas = (
+                select(
+                    Tarea.curso_id,
+                    Tarea.titulo,
+                    Tarea.fecha_limite,
+                    func.row_number().over(
+                        partition_by=Tarea.curso_id,
+                        order_by=Tarea.fecha_limite.desc().nullslast(),
+                    ).label("posicion"),
+                )
+                .where(Tarea.curso_id.in_(selected.keys()))
+                .subquery()
+            )
+            for row in db.execute(select(ranked_tareas).where(ranked_tareas.c.posicion <= 10)):
+                coursework_by_course.setdefault(selected[row.curso_id], []).append({
+                    "title": row.titulo,
+                    **_classroom_due_fields(row.fecha_limite),
+                })
+
+            ranked_anuncios = (
+                select(
+                    Anuncio.curso_id,
+                    Anuncio.contenido,
+                    Anuncio.classroom_updated_at,
+                    func.row_number().over(
+                        partition_by=Anuncio.curso_id,
+                        order_by=Anuncio.classroom_updated_at.desc().nullslast(),
+                    ).label("posicion"),
+                )
+                .where(Anuncio.curso_id.in_(selected.keys()))
+                .subquery()
+            )
+            for row in db.execute(
+                select(ranked_anuncios)
+                .where(ranked_anuncios.c.posicion <= 3)
+                .order_by(ranked_anuncios.c.curso_id, ranked_anuncios.c.posicion)
+            ):
+                updated_at = _ensure_aware(row.classroom_updated_at)
+                announcements_by_course.setdefault(selected[row.curso_id], []).append({
+                    "text": row.contenido,
+                    "updateTime": updated_at.isoformat() if updated_at else None,
+                })
+
+    courses = [{"id": row.classroom_id, "name": row.nombre} for row in course_rows]
+    return build_student_dashboard(courses, coursework_by_course, announcements_by_course)
+
+
+class ClassroomSyncWorker:
+    """
+    Tarea de fondo que sincroniza periódicamente a todos los usuarios con tokens activos.
+    """
+
+    def __init__(self, interval_seconds: int, max_concurrency: int):
+        self._interval = max(1, interval_seconds)
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._task: Optional[asyncio.Task] = None
+
+    async def _sync_one(self, google_id: str) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            try:
+                await loop.run_in_executor(None, sync_student, google_id)
+            except Exception:
+                logger.exception("Falló la sincronización de Classroom para %s", google_id)
+
+    async def sync_all(self) -> None:
+        await asyncio.gather(*(self._sync_one(google_id) for google_id in list_token_users()))
+
+    async def _run(self) -> None:
+        while True:
+            await self.sync_all()
+            await asyncio.sleep(self._interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+classroom_sync_worker = ClassroomSyncWorker(
+    interval_seconds=settings.CLASSROOM_SYNC_INTERVAL_SECONDS,
+    max_concurrency=settings.CLASSROOM_SYNC_MAX_CONCURRENCY,
+)
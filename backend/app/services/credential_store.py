@@ -0,0 +1,352 @@
+import base64
+import hashlib
+import json
+import logging
+import threading
+import time
+import weakref
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.core.config import settings
+from app.core.redis_client import get_redis, redis_errors
+from app.db.base import SessionLocal, engine
+from app.models.credencial import CredencialGoogle
+
+logger = logging.getLogger(__name__)
+
+TokenEntry = Dict[str, Any]
+
+# Espacio de nombres para pg_advisory_xact_lock(int, int); evita chocar con otros locks
+_ADVISORY_LOCK_NAMESPACE = 4107
+
+
+class CredentialStoreError(Exception):
+    """El backend de credenciales (Redis o Postgres) no respondió."""
+
+
+def _ensure_aware(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+class _TokenCipher:
+    """
+    Cifra con Fernet los tokens que salen del proceso (Redis y Postgres).
+
+    Los valores sin el prefijo de Fernet son tokens guardados antes de cifrar: se leen tal cual
+    y quedan cifrados en el siguiente ``save`` (login o refresh).
+    """
+
+    _fields = ("access_token", "refresh_token")
+    # Todo token Fernet empieza con el byte de versión 0x80, que en base64 es "gAAAAA"
+    _prefix = "gAAAAA"
+
+    def __init__(self, keys: List[str]):
+        self._fernet = MultiFernet([Fernet(key) for key in keys])
+
+    def encrypt(self, entry: TokenEntry) -> TokenEntry:
+        encrypted = dict(entry)
+        for field in self._fields:
+            if encrypted.get(field):
+                encrypted[field] = self._fernet.encrypt(encrypted[field].encode()).decode()
+        return encrypted
+
+    def decrypt(self, entry: TokenEntry) -> TokenEntry:
+        decrypted = dict(entry)
+        for field in self._fields:
+            value = decrypted.get(field)
+            if not value or not value.startswith(self._prefix):
+                continue
+            try:
+                decrypted[field] = self._fernet.decrypt(value.encode()).decode()
+            except InvalidToken as exc:
+                raise CredentialStoreError(
+                    "No se pudo descifrar el token guardado; revisa CREDENTIAL_ENCRYPTION_KEY"
+                ) from exc
+        return decrypted
+
+
+def _create_cipher() -> _TokenCipher:
+    keys = [key.strip() for key in (settings.CREDENTIAL_ENCRYPTION_KEY or "").split(",") if key.strip()]
+    if not keys:
+        keys = [base64.urlsafe_b64encode(hashlib.sha256(settings.SECRET_KEY.encode()).digest()).decode()]
+    return _TokenCipher(keys)
+
+
+class _MemoryCredentialBackend:
+    """
+    Diccionario del proceso; solo sirve con un único worker.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, TokenEntry] = {}
+        self._lock = threading.Lock()
+
+    def load(self, google_id: str) -> Optional[TokenEntry]:
+        with self._lock:
+            entry = self._entries.get(google_id)
+            return dict(entry) if entry else None
+
+    def save(self, google_id: str, entry: TokenEntry) -> None:
+        with self._lock:
+            self._entries[google_id] = dict(entry)
+
+    def list_users(self) -> List[str]:
+        with self._lock:
+            return list(self._entries.keys())
+
+    def refresh_lock(self, google_id: str):
+        # El lock por usuario de CredentialStore ya serializa dentro del proceso
+        return nullcontext()
+
+
+class _RedisCredentialBackend:
+    """
+    Un JSON por usuario en ``credentials:<google_id>``; el refresh se serializa con un lock de Redis.
+    """
+
+    _prefix = "credentials:"
+
+    def __init__(self, client, lock_timeout_seconds: int, cipher: _TokenCipher):
+        self._client = client
+        self._lock_timeout = lock_timeout_seconds
+        self._cipher = cipher
+
+    def load(self, google_id: str) -> Optional[TokenEntry]:
+        try:
+            raw = self._client.get(self._prefix + google_id)
+        except redis_errors() as exc:
+            raise CredentialStoreError(str(exc)) from exc
+        if raw is None:
+            return None
+        entry = self._cipher.decrypt(json.loads(raw))
+        entry["expiry"] = _ensure_aware(datetime.fromisoformat(entry["expiry"])) if entry.get("expiry") else None
+        return entry
+
+    def save(self, google_id: str, entry: TokenEntry) -> None:
+        payload = self._cipher.encrypt(entry)
+        payload["expiry"] = entry["expiry"].isoformat() if entry.get("expiry") else None
+        try:
+            self._client.set(self._prefix + google_id, json.dumps(payload))
+        except redis_errors() as exc:
+            raise CredentialStoreError(str(exc)) from exc
+
+    def list_users(self) -> List[str]:
+        try:
+            return [
+                key[len(self._prefix):]
+                for key in self._client.scan_iter(match=self._prefix + "*", count=500)
+                if not key.startswith(self._prefix + "lock:")
+            ]
+        except redis_errors() as exc:
+            raise CredentialStoreError(str(exc)) from exc
+
+    @contextmanager
+    def refresh_lock(self, google_id: str) -> Iterator[None]:
+        lock = self._client.lock(
+            f"{self._prefix}lock:{google_id}",
+            timeout=self._lock_timeout,
+            blocking_timeout=self._lock_timeout,
+        )
+        try:
+            acquired = lock.acquire()
+        except redis_errors() as exc:
+            raise CredentialStoreError(str(exc)) from exc
+        if not acquired:
+            # Otro worker tardó demasiado; refrescar por duplicado es preferible a fallar la petición
+            logger.warning("No se obtuvo el lock de refresh para %s; se continúa sin él", google_id)
+        try:
+            yield
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except redis_errors() as exc:
+                    # El lock expira solo; no vale la pena tumbar la petición
+                    logger.warning("No se pudo liberar el lock de refresh de %s: %s", google_id, exc)
+
+
+class _PostgresCredentialBackend:
+    """
+    Tabla ``credenciales_google``; el refresh se serializa con un advisory lock de transacción.
+    """
+
+    def __init__(self, lock_timeout_seconds: int, cipher: _TokenCipher):
+        self._lock_timeout_ms = lock_timeout_seconds * 1000
+        self._cipher = cipher
+
+    def load(self, google_id: str) -> Optional[TokenEntry]:
+        try:
+            with SessionLocal() as db:
+                row = db.get(CredencialGoogle, google_id)
+        except SQLAlchemyError as exc:
+            raise CredentialStoreError(str(exc)) from exc
+        if row is None:
+            return None
+        return self._cipher.decrypt({
+            "access_token": row.access_token,
+            "refresh_token": row.refresh_token,
+            "expiry": _ensure_aware(row.expiry),
+            "scopes": row.scopes,
+        })
+
+    def save(self, google_id: str, entry: TokenEntry) -> None:
+        entry = self._cipher.encrypt(entry)
+        values = {
+            "access_token": entry.get("access_token"),
+            "refresh_token": entry.get("refresh_token"),
+            "expiry": entry.get("expiry"),
+            "scopes": entry.get("scopes"),
+            "updated_at": datetime.utcnow(),
+        }
+        stmt = insert(CredencialGoogle).values(google_id=google_id, **values)
+        stmt = stmt.on_conflict_do_update(index_elements=[CredencialGoogle.google_id], set_=values)
+        try:
+            with SessionLocal() as db:
+                db.execute(stmt)
+                db.commit()
+        except SQLAlchemyError as exc:
+            raise CredentialStoreError(str(exc)) from exc
+
+    def list_users(self) -> List[str]:
+        try:
+            with SessionLocal() as db:
+                return list(db.execute(select(CredencialGoogle.google_id)).scalars())
+        except SQLAlchemyError as exc:
+            raise CredentialStoreError(str(exc)) from exc
+
+    @contextmanager
+    def refresh_lock(self, google_id: str) -> Iterator[None]:
+        try:
+            connection = engine.connect()
+            transaction = connection.begin()
+            connection.execute(text(f"SET LOCAL lock_timeout = {int(self._lock_timeout_ms)}"))
+            connection.execute(
+                text("SELECT pg_advisory_xact_lock(:namespace, hashtext(:google_id))"),
+                {"namespace": _ADVISORY_LOCK_NAMESPACE, "google_id": google_id},
+            )
+        except SQLAlchemyError as exc:
+            raise CredentialStoreError(str(exc)) from exc
+        try:
+            yield
+        finally:
+            # Al cerrar la transacción se libera el advisory lock
+            transaction.rollback()
+            connection.close()
+
+
+class CredentialStore:
+    """
+    Tokens de Google por usuario con caché local de lectura.
+
+    El backend (memoria, Redis o Postgres) es la fuente de verdad compartida entre workers.
+    ``refresh`` garantiza que, por usuario y expiración, solo un proceso llame a Google.
+    """
+
+    def __init__(self, backend, cache_ttl_seconds: int):
+        self._backend = backend
+        self._cache_ttl = cache_ttl_seconds
+        self._cache: Dict[str, Tuple[float, TokenEntry]] = {}
+        self._lock = threading.Lock()
+        # Solo viven mientras algún hilo los usa; así no queda un lock por cada usuario que pasó
+        self._refresh_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+
+    def _remember(self, google_id: str, entry: TokenEntry) -> None:
+        with self._lock:
+            self._cache[google_id] = (time.monotonic() + self._cache_ttl, dict(entry))
+
+    def get(self, google_id: str, use_cache: bool = True) -> Optional[TokenEntry]:
+        if use_cache:
+            with self._lock:
+                cached = self._cache.get(google_id)
+                if cached and cached[0] > time.monotonic():
+                    return dict(cached[1])
+
+        entry = self._backend.load(google_id)
+        if entry is not None:
+            self._remember(google_id, entry)
+        return entry
+
+    def save(self, google_id: str, entry: TokenEntry) -> None:
+        entry = dict(entry, expiry=_ensure_aware(entry.get("expiry")))
+        self._backend.save(google_id, entry)
+        self._remember(google_id, entry)
+
+    def list_users(self) -> List[str]:
+        return self._backend.list_users()
+
+    def _refresh_lock_for(self, google_id: str) -> threading.Lock:
+        with self._lock:
+            return self._refresh_locks.setdefault(google_id, threading.Lock())
+
+    def refresh(
+        self,
+        google_id: str,
+        needs_refresh: Callable[[TokenEntry], bool],
+        refresher: Callable[[TokenEntry], TokenEntry],
+    ) -> Optional[TokenEntry]:
+        """
+        Refresca el token una sola vez aunque lo pidan varios hilos o workers a la vez.
+
+        Dentro del lock se vuelve a leer el backend: si otro proceso ya refrescó, se usa
+        su token en lugar de llamar a Google otra vez.
+        """
+        with self._refresh_lock_for(google_id), self._backend.refresh_lock(google_id):
+            entry = self._backend.load(google_id)
+            if entry is None:
+                return None
+            if needs_refresh(entry):
+                entry = refresher(entry)
+                entry["expiry"] = _ensure_aware(entry.get("expiry"))
+                self._backend.save(google_id, entry)
+            self._remember(google_id, entry)
+            return entry
+
+    def revoke_refresh_token(self, google_id: str, refresh_token: Optional[str]) -> bool:
+        """
+        Olvida un refresh token que Google rechazó (``invalid_grant``) para no reintentarlo.
+
+        Solo se borra si sigue siendo el guardado: si el usuario ya volvió a iniciar sesión,
+        su token nuevo se respeta. Retorna True si se borró.
+        """
+        with self._refresh_lock_for(google_id), self._backend.refresh_lock(google_id):
+            entry = self._backend.load(google_id)
+            if entry is None or not refresh_token or entry.get("refresh_token") != refresh_token:
+                return False
+            entry["refresh_token"] = None
+            self._backend.save(google_id, entry)
+            self._remember(google_id, entry)
+            return True
+
+
+
+def _create_backend():
+    backend = settings.CREDENTIAL_STORE_BACKEND.lower()
+    lock_timeout = settings.CREDENTIAL_REFRESH_LOCK_TIMEOUT_SECONDS
+
+    if backend == "postgres":
+        return _PostgresCredentialBackend(lock_timeout, _create_cipher())
+    if backend == "redis":
+        client = get_redis()
+        if client is not None:
+            return _RedisCredentialBackend(client, lock_timeout, _create_cipher())
+        logger.warning("CREDENTIAL_STORE_BACKEND=redis sin REDIS_URL; se usan credenciales en memoria")
+    elif backend != "memory":
+        logger.warning("CREDENTIAL_STORE_BACKEND desconocido (%s); se usan credenciales en memoria", backend)
+    return _MemoryCredentialBackend()
+
+
+credential_store = CredentialStore(
+    backend=_create_backend(),
+    cache_ttl_seconds=settings.CREDENTIAL_CACHE_TTL_SECONDS,
+)
@@ -1,21 +1,89 @@
+import asyncio
 import itertools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.errors import BatchError, HttpError
 
 from app.api.auth import get_credentials_for_user
+from app.core.config import settings
 from app.services.ai_task_prioritizer import prioritize_tasks_with_ai
+from app.services.classroom_client import authorized_http, build_classroom_service
 
+# Classroom acepta como máximo 50 llamadas por batch request.
+_CLASSROOM_BATCH_LIMIT = 50
 
-def _build_service(credentials):
-    return build(
-        "classroom",
-        "v1",
-        credentials=credentials,
-        cache_discovery=False,
-    )
+# Pool compartido para las llamadas por curso; acota la concurrencia total hacia Classroom.
+_classroom_executor = ThreadPoolExecutor(
+    max_workers=max(1, settings.CLASSROOM_MAX_CONCURRENCY),
+    thread_name_prefix="classroom-fetch",
+)
+
+
+def _build_service(credentials, google_id: Optional[str] = None):
+    return build_classroom_service(credentials, google_id=google_id)
+
+
+def _authorized_http(credentials) -> AuthorizedHttp:
+    # httplib2 no es thread-safe: cada llamada concurrente necesita su propio Http.
+    return authorized_http(credentials)
+
+
+def _fetch_concurrently(
+    credentials,
+    fetchers: List[Callable[[AuthorizedHttp], List[Dict[str, Any]]]],
+) -> List[List[Dict[str, Any]]]:
+    """
+    Ejecuta en paralelo llamadas independientes a Classroom y retorna sus resultados en orden.
+
+    Un HttpError solo vacía el resultado de la llamada que falló; el resto del dashboard se arma igual.
+    """
+    def _run(fetcher):
+        try:
+            return fetcher(_authorized_http(credentials))
+        except HttpError:
+            return []
+
+    return list(_classroom_executor.map(_run, fetchers))
+
+
+def _execute_batch(service, requests: Dict[str, Any]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Ejecuta varias llamadas a Classroom agrupadas en batch requests (una ida y vuelta por cada 50).
+
+    Las sub-peticiones que fallen dentro del batch se reintentan de forma individual;
+    si vuelven a fallar, su resultado queda en None.
+    """
+    results: Dict[str, Optional[Dict[str, Any]]] = {}
+    failed: List[str] = []
+
+    def _callback(request_id, response, exception):
+        if exception is not None:
+            failed.append(request_id)
+        else:
+            results[request_id] = response
+
+    keys = list(requests)
+    for start in range(0, len(keys), _CLASSROOM_BATCH_LIMIT):
+        chunk = keys[start:start + _CLASSROOM_BATCH_LIMIT]
+        batch = service.new_batch_http_request(callback=_callback)
+        for key in chunk:
+            batch.add(requests[key], request_id=key)
+        try:
+            batch.execute()
+        except (HttpError, BatchError):
+            # Falló el batch completo: todo lo que no respondió se pide por separado
+            failed.extend(key for key in chunk if key not in results and key not in failed)
+
+    for key in failed:
+        try:
+            results[key] = requests[key].execute()
+        except HttpError:
+            results[key] = None
+
+    return results
 
 
 def _ensure_aware(dt: Optional[datetime]) -> Optional[datetime]:
@@ -133,51 +201,40 @@ def _list_courses(service, **kwargs):
     return courses
 
 
-def _list_coursework(service, course_id: str, page_size: int = 10):
+def _list_coursework(service, course_id: str, page_size: int = 10, http=None):
     coursework = service.courses().courseWork().list(
         courseId=course_id,
         pageSize=page_size,
         orderBy="dueDate desc"
-    ).execute()
+    ).execute(http=http)
     return coursework.get("courseWork", [])
 
 
-def _list_announcements(service, course_id: str, page_size: int = 5):
+def _list_announcements(service, course_id: str, page_size: int = 5, http=None):
     announcements = service.courses().announcements().list(
         courseId=course_id,
         pageSize=page_size,
         orderBy="updateTime desc"
-    ).execute()
+    ).execute(http=http)
     return announcements.get("announcements", [])
 
 
-def get_student_dashboard_data(google_id: str) -> Dict[str, Any]:
-    credentials = get_credentials_for_user(google_id)
-    service = _build_service(credentials)
-
-    try:
-        courses = _list_courses(
-            service,
-            studentId="me",
-            courseStates=["ACTIVE"],
-            pageSize=10
-        )
-    except HttpError as exc:
-        raise HttpError(exc.resp, exc.content, uri=exc.uri) from exc
+def build_student_dashboard(
+    courses: List[Dict[str, Any]],
+    coursework_by_course: Dict[str, List[Dict[str, Any]]],
+    announcements_by_course: Dict[str, List[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """
+    Arma la respuesta del dashboard de alumno a partir de recursos con el formato de Classroom.
 
+    Se comparte entre la lectura en vivo y la lectura desde Postgres para que ambas respondan igual.
+    """
     upcoming_tasks: List[Dict[str, Any]] = []
     announcements: List[Dict[str, Any]] = []
     raw_upcoming_tasks: List[Dict[str, Any]] = []
 
-    badge_cycle = itertools.cycle(["blue", "green", "purple", "orange"])
-
     for course in itertools.islice(courses, 0, 5):
-        try:
-            coursework_items = _list_coursework(service, course["id"], page_size=10)
-        except HttpError:
-            coursework_items = []
-
-        for work in coursework_items:
+        for work in coursework_by_course.get(course["id"], []):
             due_dt = _parse_due_datetime(work.get("dueDate"), work.get("dueTime"))
             raw_upcoming_tasks.append({
                 "title": work.get("title", "Sin título"),
@@ -187,12 +244,7 @@ def get_student_dashboard_data(google_id: str) -> Dict[str, Any]:
                 "_due_dt": due_dt,
             })
 
-        try:
-            announcement_items = _list_announcements(service, course["id"], page_size=3)
-        except HttpError:
-            announcement_items = []
-
-        for announcement in announcement_items:
+        for announcement in announcements_by_course.get(course["id"], []):
             update_dt = _parse_iso_datetime(announcement.get("updateTime"))
             announcements.append({
                 "title": announcement.get("text", "Anuncio sin contenido"),
@@ -234,12 +286,50 @@ def get_student_dashboard_data(google_id: str) -> Dict[str, Any]:
     }
 
 
+def get_student_dashboard_data(google_id: str) -> Dict[str, Any]:
+    credentials = get_credentials_for_user(google_id)
+    service = _build_service(credentials, google_id)
+
+    try:
+        courses = _list_courses(
+            service,
+            studentId="me",
+            courseStates=["ACTIVE"],
+            pageSize=10
+        )
+    except HttpError as exc:
+        raise HttpError(exc.resp, exc.content, uri=exc.uri) from exc
+
+    selected_courses = list(itertools.islice(courses, 0, 5))
+
+    # Tareas y anuncios de todos los cursos se piden a la vez: la latencia total
+    # queda acotada por la llamada más lenta en lugar de la suma de todas.
+    fetchers: List[Callable[[AuthorizedHttp], List[Dict[str, Any]]]] = []
+    for course in selected_courses:
+        fetchers.append(
+            lambda http, course_id=course["id"]: _list_coursework(service, course_id, page_size=10, http=http)
+        )
+        fetchers.append(
+            lambda http, course_id=course["id"]: _list_announcements(service, course_id, page_size=3, http=http)
+        )
+    results = _fetch_concurrently(credentials, fetchers)
+
+    coursework_by_course = {
+        course["id"]: results[2 * index] for index, course in enumerate(selected_courses)
+    }
+    announcements_by_course = {
+        course["id"]: results[2 * index + 1] for index, course in enumerate(selected_courses)
+    }
+
+    return build_student_dashboard(courses, coursework_by_course, announcements_by_course)
+
+
 def get_student_courses(google_id: str) -> Dict[str, Any]:
     """
     Obtiene la lista completa de cursos del estudiante con información detallada.
     """
     credentials = get_credentials_for_user(google_id)
-    service = _build_service(credentials)
+    service = _build_service(credentials, google_id)
 
     try:
         courses = _list_courses(
@@ -251,26 +341,26 @@ def get_student_courses(google_id: str) -> Dict[str, Any]:
     except HttpError as exc:
         raise HttpError(exc.resp, exc.content, uri=exc.uri) from exc
 
+    # Alumnos y profesores de todos los cursos viajan en un solo batch request
+    roster_requests: Dict[str, Any] = {}
+    for course in courses:
+        roster_requests[f"students:{course['id']}"] = service.courses().students().list(courseId=course["id"])
+        roster_requests[f"teachers:{course['id']}"] = service.courses().teachers().list(courseId=course["id"])
+    roster_responses = _execute_batch(service, roster_requests)
+
     courses_list = []
     for course in courses:
         # Obtener el número de estudiantes
-        student_count = 0
-        try:
-            students_resp = service.courses().students().list(courseId=course["id"]).execute()
-            student_count = len(students_resp.get("students", []))
-        except HttpError:
-            pass
+        students_resp = roster_responses.get(f"students:{course['id']}") or {}
+        student_count = len(students_resp.get("students", []))
 
         # Obtener información del profesor
         teacher_name = None
-        try:
-            teachers_resp = service.courses().teachers().list(courseId=course["id"]).execute()
-            teachers = teachers_resp.get("teachers", [])
-            if teachers:
-                teacher_profile = teachers[0].get("profile", {})
-                teacher_name = teacher_profile.get("name", {}).get("fullName")
-        except HttpError:
-            pass
+        teachers_resp = roster_responses.get(f"teachers:{course['id']}") or {}
+        teachers = teachers_resp.get("teachers", [])
+        if teachers:
+            teacher_profile = teachers[0].get("profile", {})
+            teacher_name = teacher_profile.get("name", {}).get("fullName")
 
         courses_list.append({
             "id": course.get("id"),
@@ -292,7 +382,7 @@ def get_course_detail(google_id: str, course_id: str) -> Dict[str, Any]:
     Obtiene detalles completos de un curso específico incluyendo tareas, anuncios y materiales.
     """
     credentials = get_credentials_for_user(google_id)
-    service = _build_service(credentials)
+    service = _build_service(credentials, google_id)
 
     # Obtener información del curso
     try:
@@ -384,7 +474,7 @@ def get_assignment_detail(google_id: str, course_id: str, assignment_id: str) ->
     Obtiene detalles completos de una tarea específica incluyendo el estado de entrega del estudiante.
     """
     credentials = get_credentials_for_user(google_id)
-    service = _build_service(credentials)
+    service = _build_service(credentials, google_id)
 
     # Obtener información de la tarea
     try:
@@ -468,7 +558,7 @@ def get_assignment_detail(google_id: str, course_id: str, assignment_id: str) ->
 
 def get_teacher_dashboard_data(google_id: str) -> Dict[str, Any]:
     credentials = get_credentials_for_user(google_id)
-    service = _build_service(credentials)
+    service = _build_service(credentials, google_id)
 
     try:
         courses = _list_courses(
@@ -484,12 +574,24 @@ def get_teacher_dashboard_data(google_id: str) -> Dict[str, Any]:
     today_classes: List[Dict[str, Any]] = []
     pending_assignments: List[Dict[str, Any]] = []
 
-    for course in itertools.islice(courses, 0, 5):
-        try:
-            students_resp = service.courses().students().list(courseId=course["id"]).execute()
-            total_students += len(students_resp.get("students", []))
-        except HttpError:
-            pass
+    badge_cycle = itertools.cycle(["blue", "green", "purple", "orange"])
+
+    selected_courses = list(itertools.islice(courses, 0, 5))
+
+    # Roster y trabajos de todos los cursos se resuelven en un solo batch request
+    course_requests: Dict[str, Any] = {}
+    for course in selected_courses:
+        course_requests[f"students:{course['id']}"] = service.courses().students().list(courseId=course["id"])
+        course_requests[f"coursework:{course['id']}"] = service.courses().courseWork().list(
+            courseId=course["id"],
+            pageSize=10,
+            orderBy="dueDate desc"
+        )
+    course_responses = _execute_batch(service, course_requests)
+
+    for course in selected_courses:
+        students_resp = course_responses.get(f"students:{course['id']}") or {}
+        total_students += len(students_resp.get("students", []))
 
         section = course.get("section") or course.get("room") or "Sin sección"
         updated_at = _parse_iso_datetime(course.get("updateTime"))
@@ -500,10 +602,8 @@ def get_teacher_dashboard_data(google_id: str) -> Dict[str, Any]:
             "badge": next(badge_cycle),
         })
 
-        try:
-            coursework_items = _list_coursework(service, course["id"], page_size=10)
-        except HttpError:
-            coursework_items = []
+        coursework_resp = course_responses.get(f"coursework:{course['id']}") or {}
+        coursework_items = coursework_resp.get("courseWork", [])
 
         for work in coursework_items:
             due_dt = _parse_due_datetime(work.get("dueDate"), work.get("dueTime"))
@@ -539,12 +639,12 @@ def get_teacher_dashboard_data(google_id: str) -> Dict[str, Any]:
     }
 
 
-def get_prioritized_tasks_with_ai(google_id: str) -> Dict[str, Any]:
+def _collect_pending_tasks(google_id: str) -> List[Dict[str, Any]]:
     """
-    Obtiene las tareas del estudiante y las prioriza usando IA.
+    Obtiene de Classroom las tareas pendientes o próximas del estudiante.
     """
     credentials = get_credentials_for_user(google_id)
-    service = _build_service(credentials)
+    service = _build_service(credentials, google_id)
 
     try:
         courses = _list_courses(
@@ -558,12 +658,13 @@ def get_prioritized_tasks_with_ai(google_id: str) -> Dict[str, Any]:
 
     all_tasks: List[Dict[str, Any]] = []
 
-    for course in itertools.islice(courses, 0, 10):
-        try:
-            coursework_items = _list_coursework(service, course["id"], page_size=50)
-        except HttpError:
-            coursework_items = []
+    selected_courses = list(itertools.islice(courses, 0, 10))
+    results = _fetch_concurrently(credentials, [
+        lambda http, course_id=course["id"]: _list_coursework(service, course_id, page_size=50, http=http)
+        for course in selected_courses
+    ])
 
+    for course, coursework_items in zip(selected_courses, results):
         for work in coursework_items:
             due_dt = _parse_due_datetime(work.get("dueDate"), work.get("dueTime"))
 
@@ -583,13 +684,24 @@ def get_prioritized_tasks_with_ai(google_id: str) -> Dict[str, Any]:
 
     # Filtrar solo tareas pendientes/próximas
     now = datetime.now(timezone.utc)
-    pending_tasks = [
+    return [
         task for task in all_tasks
         if task.get("_due_dt") is None or _ensure_aware(task.get("_due_dt")) >= now - timedelta(days=1)
     ]
 
-    # Priorizar con IA
-    prioritized_tasks = prioritize_tasks_with_ai(pending_tasks)
+
+async def get_prioritized_tasks_with_ai(google_id: str) -> Dict[str, Any]:
+    """
+    Obtiene las tareas del estudiante y las prioriza usando IA.
+    """
+    loop = asyncio.get_running_loop()
+    pending_tasks = await loop.run_in_executor(None, _collect_pending_tasks, google_id)
+
+    # Orden local inmediato; la IA refina lo que alcance a anotar en AI_PRIORITY_WAIT_SECONDS
+    prioritized_tasks, refining = await prioritize_tasks_with_ai(
+        pending_tasks,
+        wait_seconds=settings.AI_PRIORITY_WAIT_SECONDS,
+    )
 
     # Remover campo temporal _due_dt
     for task in prioritized_tasks:
@@ -598,5 +710,7 @@ def get_prioritized_tasks_with_ai(google_id: str) -> Dict[str, Any]:
     return {
         "tasks": prioritized_tasks[:20],  # Limitar a 20 tareas más importantes
         "total_analyzed": len(pending_tasks),
-        "ai_powered": True
+        "ai_powered": any(task.get("ai_analyzed") for task in prioritized_tasks),
+        # El cliente puede volver a consultar para obtener el orden refinado por la IA
+        "ai_refining": refining > 0,
     }
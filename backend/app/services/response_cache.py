@@ -0,0 +1,215 @@
+import asyncio
+import functools
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.redis_client import get_async_redis, redis_errors
+
+logger = logging.getLogger(__name__)
+
+CACHE_HIT = "HIT"
+CACHE_MISS = "MISS"
+CACHE_STALE = "STALE"
+
+
+class MemoryBackend:
+    """
+    Almacén en proceso acotado por bytes; expulsa primero las entradas menos usadas.
+    """
+
+    def __init__(self, max_bytes: int):
+        self._max_bytes = max(1, max_bytes)
+        self._entries: "OrderedDict[str, Tuple[float, str, float]]" = OrderedDict()
+        self._size = 0
+
+    async def get(self, key: str) -> Optional[Tuple[float, str]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] <= time.time():
+            await self.delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[0], entry[1]
+
+    async def get_many(self, keys: List[str]) -> List[Optional[Tuple[float, str]]]:
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key: str, stored_at: float, payload: str, ttl_seconds: int) -> None:
+        await self.delete(key)
+
+        self._entries[key] = (stored_at, payload, stored_at + ttl_seconds)
+        self._size += len(payload)
+
+        while self._size > self._max_bytes and len(self._entries) > 1:
+            _, (_, evicted, _) = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    async def delete(self, key: str) -> None:
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous[1])
+
+
+class RedisBackend:
+    """
+    Guarda cada respuesta como JSON con expiración igual al TTL duro; Redis aplica su propia política LRU.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    async def get(self, key: str) -> Optional[Tuple[float, str]]:
+        raw = await self._client.get(key)
+        if raw is None:
+            return None
+        stored_at, _, payload = raw.partition("|")
+        return float(stored_at), payload
+
+    async def get_many(self, keys: List[str]) -> List[Optional[Tuple[float, str]]]:
+        if not keys:
+            return []
+        entries = []
+        for raw in await self._client.mget(keys):
+            if raw is None:
+                entries.append(None)
+                continue
+            stored_at, _, payload = raw.partition("|")
+            entries.append((float(stored_at), payload))
+        return entries
+
+    async def set(self, key: str, stored_at: float, payload: str, ttl_seconds: int) -> None:
+        await self._client.set(key, f"{stored_at}|{payload}", ex=ttl_seconds)
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(key)
+
+
+class ResponseCache:
+    """
+    Caché stale-while-revalidate para respuestas construidas desde Google Classroom.
+
+    - Antes del TTL suave se sirve la copia guardada (HIT).
+    - Entre el TTL suave y el duro se sirve la copia y se refresca en segundo plano (STALE).
+    - Sin copia o pasado el TTL duro se llama al loader en el momento (MISS).
+
+    Si Redis falla se usa el almacén en memoria, de modo que el caché nunca tumba un endpoint.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        soft_ttl_seconds: int,
+        hard_ttl_seconds: int,
+        max_bytes: int,
+        redis_client=None,
+    ):
+        self._namespace = namespace
+        self._soft_ttl = soft_ttl_seconds
+        self._hard_ttl = max(hard_ttl_seconds, soft_ttl_seconds)
+        self._memory = MemoryBackend(max_bytes)
+        self._redis = RedisBackend(redis_client) if redis_client is not None else None
+        self._inflight: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+        self._background: Set[asyncio.Task] = set()
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self._namespace, *parts))
+
+    async def _read(self, key: str) -> Optional[Tuple[float, str]]:
+        if self._redis is not None:
+            try:
+                return await self._redis.get(key)
+            except redis_errors() as exc:
+                logger.warning("Redis no disponible para leer %s: %s", key, exc)
+        return await self._memory.get(key)
+
+    async def _write(self, key: str, payload: str) -> None:
+        stored_at = time.time()
+        if self._redis is not None:
+            try:
+                await self._redis.set(key, stored_at, payload, self._hard_ttl)
+                return
+            except redis_errors() as exc:
+                logger.warning("Redis no disponible para escribir %s: %s", key, exc)
+        await self._memory.set(key, stored_at, payload, self._hard_ttl)
+
+    async def _load(self, key: str, loader: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Ejecuta el loader una sola vez por llave aunque lleguen varias peticiones a la vez.
+
+        La carga corre en su propia tarea y cada petición la espera con ``shield``: si un cliente
+        se desconecta solo se cancela su espera, no la carga que comparten los demás.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load_and_store(key, loader))
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._forget_load, key))
+        return await asyncio.shield(task)
+
+    async def _load_and_store(self, key: str, loader: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        data = await asyncio.get_running_loop().run_in_executor(None, loader)
+        await self._write(key, json.dumps(data, ensure_ascii=False, default=str))
+        return data
+
+    def _forget_load(self, key: str, task: "asyncio.Task[Dict[str, Any]]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Evita el warning de "exception was never retrieved" cuando nadie más esperaba
+        if not task.cancelled():
+            task.exception()
+
+    async def _refresh(self, key: str, loader: Callable[[], Dict[str, Any]]) -> None:
+        try:
+            await self._load(key, loader)
+        except Exception:
+            logger.exception("No se pudo refrescar en segundo plano la entrada %s", key)
+
+    async def fetch(
+        self,
+        key_parts: Tuple[str, ...],
+        loader: Callable[[], Dict[str, Any]],
+    ) -> Tuple[Dict[str, Any], str, int]:
+        """
+        Retorna ``(datos, estado, edad_en_segundos)`` para la llave indicada.
+        """
+        key = self._key(*key_parts)
+        entry = await self._read(key)
+
+        if entry is not None:
+            stored_at, payload = entry
+            age = max(0.0, time.time() - stored_at)
+            if age < self._hard_ttl:
+                status = CACHE_HIT
+                if age >= self._soft_ttl:
+                    status = CACHE_STALE
+                    if key not in self._inflight:
+                        task = asyncio.create_task(self._refresh(key, loader))
+                        self._background.add(task)
+                        task.add_done_callback(self._background.discard)
+                return json.loads(payload), status, int(age)
+
+        data = await self._load(key, loader)
+        return data, CACHE_MISS, 0
+
+    async def invalidate(self, *key_parts: str) -> None:
+        key = self._key(*key_parts)
+        if self._redis is not None:
+            try:
+                await self._redis.delete(key)
+            except redis_errors() as exc:
+                logger.warning("Redis no disponible para invalidar %s: %s", key, exc)
+        await self._memory.delete(key)
+
+
+dashboard_cache = ResponseCache(
+    namespace="dashboard",
+    soft_ttl_seconds=settings.DASHBOARD_CACHE_SOFT_TTL_SECONDS,
+    hard_ttl_seconds=settings.DASHBOARD_CACHE_HARD_TTL_SECONDS,
+    max_bytes=settings.DASHBOARD_CACHE_MAX_BYTES,
+    redis_client=get_async_redis(),
+)
@@ -0,0 +1,157 @@
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DIFFICULTY_LEVELS = ("BAJA", "MEDIA", "ALTA")
+ESTIMATED_TIMES = ("30min", "1h", "2h", "3h+")
+
+# Pesos en el mismo orden que DIFFICULTY_LEVELS / ESTIMATED_TIMES
+_DIFFICULTY_WEIGHTS = np.array([0.0, 0.5, 1.0])
+_ESTIMATED_TIME_WEIGHTS = np.array([0.0, 0.35, 0.7, 1.0])
+
+# Peso del tipo de trabajo de Classroom en la dificultad estimada
+_WORK_TYPE_WEIGHT = {
+    "ASSIGNMENT": 0.5,
+    "SHORT_ANSWER_QUESTION": 0.2,
+    "MULTIPLE_CHOICE_QUESTION": 0.1,
+}
+_DEFAULT_WORK_TYPE_WEIGHT = 0.35
+
+# Mismos criterios que se le dan al modelo: palabras que suben o bajan la complejidad
+_COMPLEX_KEYWORDS = re.compile(
+    r"\b(proyecto|investigacion|analisis|ensayo|reporte|informe|presentacion|exposicion|"
+    r"programa|practica|laboratorio|prototipo|tesis|monografia)"
+)
+_SIMPLE_KEYWORDS = re.compile(r"\b(lectura|leer|cuestionario|quiz|repaso|video|foro|resumen)")
+
+# Puntos a partir de los cuales una tarea se considera de máximo peso
+_POINTS_CEILING = np.log1p(100.0)
+_DESCRIPTION_CEILING = 600.0
+
+# (horas restantes máximas, urgencia); vencidas o para hoy cuentan como urgencia máxima
+_URGENCY_STEPS = ((6.0, 1.0), (30.0, 0.85), (48.0, 0.7), (24.0 * 7, 0.45))
+_URGENCY_FLOOR = 0.2
+
+
+_WITHOUT_ACCENTS = str.maketrans("áéíóúü", "aeiouu")
+
+
+@lru_cache(maxsize=4096)
+def _text_features(title: str, description: str) -> Tuple[int, int, int]:
+    """Conteo de palabras clave y longitud; memorizado porque el texto de una tarea casi no cambia."""
+    text = f"{title} {description}".lower().translate(_WITHOUT_ACCENTS)
+    return (
+        len(_COMPLEX_KEYWORDS.findall(text)),
+        len(_SIMPLE_KEYWORDS.findall(text)),
+        len(description),
+    )
+
+
+def _hours_remaining(tasks: List[Dict[str, Any]], now: datetime) -> np.ndarray:
+    timestamps = []
+    for task in tasks:
+        due_dt = task.get("_due_dt")
+        if due_dt is None:
+            timestamps.append(np.inf)
+        else:
+            if due_dt.tzinfo is None:
+                due_dt = due_dt.replace(tzinfo=timezone.utc)
+            timestamps.append(due_dt.timestamp())
+    return (np.array(timestamps) - now.timestamp()) / 3600
+
+
+def _urgency(hours: np.ndarray) -> np.ndarray:
+    conditions = [hours <= limit for limit, _ in _URGENCY_STEPS]
+    return np.select(conditions, [value for _, value in _URGENCY_STEPS], default=_URGENCY_FLOOR)
+
+
+def _heuristic_difficulty(tasks: List[Dict[str, Any]]) -> np.ndarray:
+    """Dificultad en [0, 1] a partir de puntos, tipo de trabajo, palabras clave y longitud."""
+    points = np.array([task.get("maxPoints") or 0 for task in tasks], dtype=float)
+    work_type = np.array([
+        _WORK_TYPE_WEIGHT.get(task.get("workType"), _DEFAULT_WORK_TYPE_WEIGHT)
+        for task in tasks
+    ])
+    text_features = np.array([
+        _text_features(task.get("title") or "", task.get("description") or "")
+        for task in tasks
+    ], dtype=float).reshape(len(tasks), 3)
+    complex_hits, simple_hits, description_length = text_features.T
+
+    points_score = np.clip(np.log1p(np.maximum(points, 0)) / _POINTS_CEILING, 0, 1)
+    length_score = np.clip(description_length / _DESCRIPTION_CEILING, 0, 1)
+    keyword_score = np.clip(0.5 + 0.35 * np.minimum(complex_hits, 2) - 0.3 * np.minimum(simple_hits, 2), 0, 1)
+
+    return np.clip(
+        0.3 * points_score + 0.2 * work_type + 0.35 * keyword_score + 0.15 * length_score,
+        0,
+        1,
+    )
+
+
+def rank_tasks(
+    tasks: List[Dict[str, Any]],
+    annotations: Optional[List[Optional[Dict[str, Any]]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Ordena las tareas por prioridad sin llamar a ningún modelo.
+
+    La urgencia sale de la fecha de entrega; el esfuerzo, de la anotación de IA cuando existe
+    o de una estimación local (puntos, tipo de trabajo, palabras clave) cuando no.
+    Agrega los campos ``ai_priority``, ``ai_difficulty``, ``ai_estimated_time``, ``ai_reason``
+    y ``ai_analyzed`` (True solo si la tarea tiene anotación de IA).
+    """
+    if not tasks:
+        return []
+    annotations = annotations or [None] * len(tasks)
+
+    now = datetime.now(timezone.utc)
+    urgency = _urgency(_hours_remaining(tasks, now))
+
+    heuristic = _heuristic_difficulty(tasks)
+    heuristic_difficulty = np.select([heuristic >= 0.6, heuristic >= 0.35], [2, 1], default=0)
+    heuristic_time = np.select([heuristic >= 0.75, heuristic >= 0.55, heuristic >= 0.35], [3, 2, 1], default=0)
+
+    # Las anotaciones de IA, cuando existen, reemplazan la estimación local
+    difficulty_index = np.array([
+        DIFFICULTY_LEVELS.index(annotation["difficulty"]) if annotation is not None else -1
+        for annotation in annotations
+    ])
+    time_index = np.array([
+        ESTIMATED_TIMES.index(annotation["estimated_time"]) if annotation is not None else -1
+        for annotation in annotations
+    ])
+    difficulty_index = np.where(difficulty_index >= 0, difficulty_index, heuristic_difficulty)
+    time_index = np.where(time_index >= 0, time_index, heuristic_time)
+
+    difficulty = _DIFFICULTY_WEIGHTS[difficulty_index]
+    estimated_time = _ESTIMATED_TIME_WEIGHTS[time_index]
+    effort = 0.6 * difficulty + 0.4 * estimated_time
+    score = 0.65 * urgency + 0.35 * effort
+
+    priority = np.select(
+        [(urgency >= 0.85) | (score >= 0.6), score >= 0.3],
+        [0, 1],
+        default=2,
+    )
+
+    # Orden estable: mayor puntaje primero, empates en el orden original
+    order = np.lexsort((np.arange(len(tasks)), -score))
+
+    ranked = []
+    for i in order:
+        annotation = annotations[i]
+        task_copy = tasks[i].copy()
+        task_copy["ai_priority"] = ("ALTA", "MEDIA", "BAJA")[priority[i]]
+        task_copy["ai_difficulty"] = DIFFICULTY_LEVELS[difficulty_index[i]]
+        task_copy["ai_estimated_time"] = ESTIMATED_TIMES[time_index[i]]
+        task_copy["ai_reason"] = (
+            annotation.get("reason", "") if annotation is not None
+            else "Estimación local según fecha de entrega, puntos y tipo de trabajo"
+        )
+        task_copy["ai_analyzed"] = annotation is not None
+        ranked.append(task_copy)
+    return ranked
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+import zlib
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from google.auth.exceptions import RefreshError
+
+from app.api.auth import list_token_users, refresh_token_entry, token_expires_within
+from app.core.config import settings
+from app.services.classroom_client import classroom_services
+from app.services.credential_store import CredentialStoreError, credential_store
+
+logger = logging.getLogger(__name__)
+
+
+class TokenRefreshWorker:
+    """
+    Tarea de fondo que refresca los tokens de Google antes de que expiren.
+
+    Cada usuario recibe un desfase fijo (jitter) dentro de la ventana para que los tokens
+    emitidos al mismo tiempo no se refresquen todos en el mismo barrido. Como el refresh del
+    almacén es single-flight, varios workers pueden barrer a la vez sin duplicar llamadas.
+
+    Si Google rechaza el refresh token (``invalid_grant``) se borra del almacén y el usuario deja
+    de barrerse hasta que vuelva a iniciar sesión; ante otros fallos se espera cada vez más.
+    """
+
+    def __init__(
+        self,
+        interval_seconds: int,
+        window_seconds: int,
+        jitter_seconds: int,
+        max_concurrency: int,
+    ):
+        self._interval = max(1, interval_seconds)
+        self._window = max(0, window_seconds)
+        self._jitter = max(0, jitter_seconds)
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._task: Optional[asyncio.Task] = None
+        # google_id -> (fallos seguidos, instante monotónico desde el que se reintenta)
+        self._backoff: Dict[str, Tuple[int, float]] = {}
+
+    def _margin_for(self, google_id: str) -> timedelta:
+        offset = zlib.crc32(google_id.encode()) % self._jitter if self._jitter else 0
+        return timedelta(seconds=self._window + offset)
+
+    def _backing_off(self, google_id: str) -> bool:
+        backoff = self._backoff.get(google_id)
+        return backoff is not None and backoff[1] > time.monotonic()
+
+    def _record_failure(self, google_id: str) -> None:
+        failures = self._backoff.get(google_id, (0, 0.0))[0] + 1
+        delay = min(self._interval * 2 ** failures, max(self._interval, self._window))
+        self._backoff[google_id] = (failures, time.monotonic() + delay)
+
+    def _due_users(self) -> List[str]:
+        due = []
+        for google_id in list_token_users():
+            if self._backing_off(google_id):
+                continue
+            try:
+                entry = credential_store.get(google_id)
+            except CredentialStoreError as exc:
+                logger.warning("No se pudo leer el token de %s: %s", google_id, exc)
+                continue
+            if entry and entry.get("refresh_token") and token_expires_within(entry, self._margin_for(google_id)):
+                due.append(google_id)
+        return due
+
+    def _refresh_sync(self, google_id: str) -> None:
+        margin = self._margin_for(google_id)
+        attempted: Dict[str, Optional[str]] = {}
+
+        def refresher(current):
+            attempted["refresh_token"] = current.get("refresh_token")
+            return refresh_token_entry(current)
+
+        try:
+            entry = credential_store.refresh(
+                google_id,
+                lambda current: token_expires_within(current, margin),
+                refresher,
+            )
+        except RefreshError as exc:
+            if getattr(exc, "retryable", False):
+                raise
+            # Refresh token revocado o vencido: reintentarlo no sirve, el usuario tendrá que volver a entrar
+            if credential_store.revoke_refresh_token(google_id, attempted.get("refresh_token")):
+                logger.warning("Google rechazó el refresh token de %s; se descarta: %s", google_id, exc)
+            return
+        if entry:
+            classroom_services.invalidate(google_id, current_token=entry.get("access_token"))
+
+    async def _refresh_one(self, google_id: str) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            try:
+                await loop.run_in_executor(None, self._refresh_sync, google_id)
+                self._backoff.pop(google_id, None)
+            except RefreshError as exc:
+                self._record_failure(google_id)
+                logger.warning("Google no pudo refrescar el token de %s; se reintentará más tarde: %s", google_id, exc)
+            except Exception:
+                self._record_failure(google_id)
+                logger.exception("Falló el refresh proactivo del token de %s", google_id)
+
+    async def refresh_due(self) -> None:
+        loop = asyncio.get_running_loop()
+        due = await loop.run_in_executor(None, self._due_users)
+        if due:
+            logger.info("Refrescando %d tokens de Google antes de su expiración", len(due))
+        await asyncio.gather(*(self._refresh_one(google_id) for google_id in due))
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh_due()
+            except Exception:
+                logger.exception("Falló el barrido de tokens por refrescar")
+            await asyncio.sleep(self._interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+token_refresh_worker = TokenRefreshWorker(
+    interval_seconds=settings.TOKEN_REFRESH_SCAN_INTERVAL_SECONDS,
+    window_seconds=settings.TOKEN_REFRESH_WINDOW_SECONDS,
+    jitter_seconds=settings.TOKEN_REFRESH_JITTER_SECONDS,
+    max_concurrency=settings.TOKEN_REFRESH_MAX_CONCURRENCY,
+)
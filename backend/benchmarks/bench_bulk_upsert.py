@@ -0,0 +1,85 @@
+"""
+Filas por segundo de bulk_upsert frente al upsert objeto por objeto del ORM.
+
+Se sincronizan ``--rows`` cursos falsos tres veces contra la base de DATABASE_URL: la primera
+pasada inserta, la segunda no cambia nada (omitidas) y la tercera cambia ``classroom_updated_at``
+(actualizaciones). Todo corre dentro de una transacción que se revierte al final.
+
+Uso (desde backend/, con las variables de entorno de la app y una base migrada):
+    python -m benchmarks.bench_bulk_upsert --rows 2000
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy.orm import Session
+
+from app.db.base import SessionLocal
+from app.db.bulk import bulk_upsert
+from app.models.curso import Curso
+
+
+def _rows(prefix: str, count: int, updated_at: datetime) -> List[Dict[str, Any]]:
+    return [
+        {
+            "classroom_id": f"{prefix}-{index}",
+            "nombre": f"Curso {index}",
+            "seccion": "A",
+            "estado": "ACTIVE",
+            "classroom_updated_at": updated_at,
+        }
+        for index in range(count)
+    ]
+
+
+def _orm_upsert(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Un SELECT por fila y un INSERT/UPDATE por objeto, como la sincronización original."""
+    for row in rows:
+        curso = db.query(Curso).filter(Curso.classroom_id == row["classroom_id"]).first()
+        if curso is None:
+            db.add(Curso(**row))
+        elif curso.classroom_updated_at != row["classroom_updated_at"]:
+            for column, value in row.items():
+                setattr(curso, column, value)
+        db.flush()
+
+
+def _bulk_upsert(db: Session, rows: List[Dict[str, Any]]) -> None:
+    bulk_upsert(db, Curso, rows)
+
+
+def _measure(strategy: Callable[[Session, List[Dict[str, Any]]], None], prefix: str, count: int) -> Dict[str, float]:
+    first = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    passes = {
+        "insert": _rows(prefix, count, first),
+        "skip": _rows(prefix, count, first),
+        "update": _rows(prefix, count, first + timedelta(days=1)),
+    }
+    db = SessionLocal()
+    try:
+        rates = {}
+        for name, rows in passes.items():
+            started = time.perf_counter()
+            strategy(db, rows)
+            db.flush()
+            rates[name] = count / (time.perf_counter() - started)
+        return rates
+    finally:
+        db.rollback()
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'estrategia':>12} {'insert':>10} {'skip':>10} {'update':>10}  (filas/s)")
+    for name, strategy in (("orm", _orm_upsert), ("bulk_upsert", _bulk_upsert)):
+        rates = _measure(strategy, f"bench-{name}", args.rows)
+        print(f"{name:>12} {rates['insert']:10.0f} {rates['skip']:10.0f} {rates['update']:10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Costo por petición de obtener un servicio de Classroom.
+
+Compara ``discovery.build`` en cada petición (comportamiento original), construir desde el
+discovery document ya parseado y un acierto del caché por usuario y token. No hace llamadas
+de red: se usa el discovery document estático de googleapiclient.
+
+Uso (desde backend/, con las variables de entorno de la app):
+    python -m benchmarks.bench_classroom_service --iterations 200
+"""
+import argparse
+import time
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from app.services.classroom_client import ClassroomServiceCache, _create_service, _get_discovery_document
+
+
+def _per_call_ms(function, iterations: int) -> float:
+    function()  # calentamiento
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    credentials = Credentials(token="bench-token")
+    _get_discovery_document()
+    cache = ClassroomServiceCache(max_entries=100, ttl_seconds=600)
+
+    results = {
+        "build() por petición": _per_call_ms(
+            lambda: build("classroom", "v1", credentials=credentials, cache_discovery=False, static_discovery=True),
+            args.iterations,
+        ),
+        "documento compartido": _per_call_ms(lambda: _create_service(credentials), args.iterations),
+        "acierto del caché": _per_call_ms(lambda: cache.get(credentials, google_id="bench"), args.iterations),
+    }
+    for name, milliseconds in results.items():
+        print(f"{name:>22}: {milliseconds:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Tiempo de get_student_dashboard_data contra un Classroom simulado, según el número de cursos.
+
+Cada llamada del servicio falso duerme ``--latency`` segundos. Se compara el fan-out concurrente
+actual con la versión secuencial (tareas y anuncios curso por curso).
+
+Uso (desde backend/, con las variables de entorno de la app):
+    python -m benchmarks.bench_dashboard_fanout --latency 0.1 --repeat 5
+"""
+import argparse
+import statistics
+import time
+from typing import Any, Dict, List
+from unittest import mock
+
+from app.services import google_classroom
+
+
+class _Request:
+    def __init__(self, payload: Dict[str, Any], latency: float):
+        self._payload = payload
+        self._latency = latency
+
+    def execute(self, http=None):
+        time.sleep(self._latency)
+        return self._payload
+
+
+class FakeClassroomService:
+    """Solo lo que usa el dashboard de alumno: cursos, tareas y anuncios."""
+
+    def __init__(self, course_count: int, latency: float):
+        self._course_count = course_count
+        self._latency = latency
+        self._resource = None
+
+    def courses(self):
+        self._resource = "courses"
+        return self
+
+    def courseWork(self):
+        self._resource = "courseWork"
+        return self
+
+    def announcements(self):
+        self._resource = "announcements"
+        return self
+
+    def list_next(self, request, response):
+        return None
+
+    def list(self, **kwargs):
+        if self._resource == "courses":
+            courses = [{"id": f"c{index}", "name": f"Curso {index}"} for index in range(self._course_count)]
+            return _Request({"courses": courses}, self._latency)
+        course_id = kwargs["courseId"]
+        if self._resource == "courseWork":
+            work = [
+                {"id": f"{course_id}-w{index}", "title": f"Tarea {index}",
+                 "dueDate": {"year": 2030, "month": 1, "day": 1 + index}}
+                for index in range(10)
+            ]
+            return _Request({"courseWork": work}, self._latency)
+        announcements = [
+            {"id": f"{course_id}-a{index}", "text": f"Anuncio {index}", "updateTime": "2030-01-01T10:00:00Z"}
+            for index in range(3)
+        ]
+        return _Request({"announcements": announcements}, self._latency)
+
+
+def _sequential(credentials, fetchers: List) -> List[List[Dict[str, Any]]]:
+    # Comportamiento anterior: una llamada tras otra
+    return [fetcher(None) for fetcher in fetchers]
+
+
+def _measure(course_count: int, latency: float, repeat: int, concurrent: bool) -> List[float]:
+    service = FakeClassroomService(course_count, latency)
+    patches = [
+        mock.patch.object(google_classroom, "get_credentials_for_user", return_value=object()),
+        mock.patch.object(google_classroom, "_build_service", return_value=service),
+        mock.patch.object(google_classroom, "_authorized_http", return_value=None),
+    ]
+    if not concurrent:
+        patches.append(mock.patch.object(google_classroom, "_fetch_concurrently", _sequential))
+
+    timings = []
+    for patch in patches:
+        patch.start()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            google_classroom.get_student_dashboard_data("bench")
+            timings.append(time.perf_counter() - started)
+    finally:
+        for patch in reversed(patches):
+            patch.stop()
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=0.1, help="segundos por llamada simulada")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"latencia por llamada {args.latency * 1000:.0f} ms, {args.repeat} repeticiones (mediana)")
+    print(f"{'cursos':>6}  {'secuencial':>10}  {'concurrente':>11}")
+    # El dashboard toma como máximo 5 cursos
+    for course_count in range(1, 6):
+        sequential = statistics.median(_measure(course_count, args.latency, args.repeat, concurrent=False))
+        concurrent = statistics.median(_measure(course_count, args.latency, args.repeat, concurrent=True))
+        print(f"{course_count:>6}  {sequential:>9.3f}s  {concurrent:>10.3f}s")
+
+
+if __name__ == "__main__":
+    main()
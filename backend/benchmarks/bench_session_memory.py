@@ -0,0 +1,76 @@
+"""
+Latencia por turno de SessionMemory (camino L1) según el número de sesiones activas.
+
+Se llena la memoria con 100, 1k, 10k y 100k sesiones y se mide un turno (``get_messages`` +
+``append_messages``) sobre sesiones al azar, sin Redis ni Postgres. La columna "antes" usa
+una subclase con la poda original, que recorría todas las sesiones en cada acceso.
+
+Uso (desde backend/, con las variables de entorno de la app):
+    python -m benchmarks.bench_session_memory --turns 2000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.services.chat_agent import SessionMemory
+
+SESSION_COUNTS = (100, 1_000, 10_000, 100_000)
+
+
+class _FullScanSessionMemory(SessionMemory):
+    """Poda como antes del cambio: O(sesiones) bajo el lock en cada lectura y escritura."""
+
+    def _prune_expired(self) -> None:
+        now = time.monotonic()
+        expired_keys = [
+            key for key, payload in self._sessions.items()
+            if payload.get("expires_at") and payload["expires_at"] <= now
+        ]
+        for key in expired_keys:
+            self._sessions.pop(key, None)
+
+
+def _filled(memory_class, session_count: int) -> SessionMemory:
+    # Se llena con la poda nueva: con la original llenar 100k sesiones sería cuadrático
+    seed = SessionMemory(max_messages=20, ttl_seconds=3600, max_sessions=session_count)
+    for index in range(session_count):
+        seed._store_local(f"s{index}", [HumanMessage(content="hola")], None, replace=True)
+    memory = memory_class(max_messages=20, ttl_seconds=3600, max_sessions=session_count)
+    memory._sessions = seed._sessions
+    return memory
+
+
+async def _turn_us(memory: SessionMemory, session_count: int, turns: int) -> float:
+    sessions = [f"s{random.randrange(session_count)}" for _ in range(turns)]
+    reply = [AIMessage(content="¿Cómo vas?")]
+    started = time.perf_counter()
+    for session_id in sessions:
+        await memory.get_messages(session_id)
+        await memory.append_messages(session_id, reply)
+    return (time.perf_counter() - started) / turns * 1_000_000
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--skip-before", action="store_true", help="no medir la poda original (lenta con 100k)")
+    args = parser.parse_args()
+
+    print(f"{'sesiones':>10} {'antes':>12} {'después':>12}")
+    for session_count in SESSION_COUNTS:
+        after = await _turn_us(_filled(SessionMemory, session_count), session_count, args.turns)
+        if args.skip_before:
+            before = "-"
+        else:
+            # La poda original es lineal: con pocas vueltas basta para ver la tendencia
+            turns = max(20, args.turns * 100 // session_count) if session_count > 100 else args.turns
+            before_us = await _turn_us(_filled(_FullScanSessionMemory, session_count), session_count, min(turns, args.turns))
+            before = f"{before_us:,.1f} us"
+        print(f"{session_count:>10,} {before:>12} {after:>9.1f} us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
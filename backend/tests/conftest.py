@@ -0,0 +1,14 @@
+import os
+
+# La configuración exige estas variables al importar app.*; las pruebas no tocan servicios reales
+for _name, _value in {
+    "DATABASE_URL": "postgresql+psycopg2://postgres@127.0.0.1:1/calma_test",
+    "SECRET_KEY": "test",
+    "GOOGLE_CLIENT_ID": "test",
+    "GOOGLE_CLIENT_SECRET": "test",
+    "GOOGLE_REDIRECT_URI": "http://localhost/callback",
+    "GOOGLE_CLASSROOM_SCOPES": "https://www.googleapis.com/auth/classroom.courses.readonly",
+    "OPENAI_API_KEY": "test",
+}.items():
+    os.environ.setdefault(_name, _value)
+os.environ.pop("REDIS_URL", None)
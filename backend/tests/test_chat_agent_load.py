@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from app.services.chat_agent import SessionMemory, StudentSupportAgent
+from app.services.chat_history import ConversationHistory
+
+LLM_LATENCY = 0.1
+
+
+class _SlowLLM:
+    """Imita a ChatOpenAI.ainvoke: espera la respuesta sin ocupar el event loop."""
+
+    def __init__(self, latency: float = LLM_LATENCY):
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.cancelled = 0
+
+    async def ainvoke(self, messages):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        return AIMessage(content="Hola!\n\nTodo bien.")
+
+
+def _agent(llm: _SlowLLM) -> StudentSupportAgent:
+    agent = StudentSupportAgent(
+        "fake",
+        0.0,
+        SessionMemory(max_messages=20, ttl_seconds=60, max_sessions=100),
+        ConversationHistory(token_budget=1500, max_messages=20, summarizer=None, max_sessions=100, ttl_seconds=60),
+    )
+    agent._llm = llm
+    return agent
+
+
+def test_concurrent_chats_overlap_llm_waits():
+    llm = _SlowLLM()
+    agent = _agent(llm)
+
+    async def scenario():
+        started = time.perf_counter()
+        replies = await asyncio.gather(*(agent.arun(f"alumno-{index}", "hola") for index in range(50)))
+        return replies, time.perf_counter() - started
+
+    replies, elapsed = asyncio.run(scenario())
+
+    assert len(replies) == 50
+    assert all(reply.content for reply in replies)
+    assert llm.max_in_flight == 50
+    # En serie serían 50 × 0.1 s = 5 s; concurrentes deben tardar poco más que una llamada
+    assert elapsed < 50 * LLM_LATENCY / 5
+
+
+def test_slow_llm_raises_timeout_and_leaves_no_reply_in_memory():
+    llm = _SlowLLM(latency=1.0)
+    agent = _agent(llm)
+    agent._timeout = 0.05
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await agent.arun("alumno", "hola")
+        return await agent.get_memory().get_messages("alumno")
+
+    history = asyncio.run(scenario())
+
+    assert llm.cancelled == 1
+    assert [message.type for message in history] == ["human"]
+
+
+def test_cancelling_the_request_cancels_the_llm_call():
+    llm = _SlowLLM(latency=1.0)
+    agent = _agent(llm)
+
+    async def scenario():
+        task = asyncio.create_task(agent.arun("alumno", "hola"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+
+    assert llm.cancelled == 1
+    assert llm.in_flight == 0
@@ -0,0 +1,72 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.services import chat_persistence
+from app.services.chat_persistence import ChatMessageWriter
+
+
+def _message(content: str):
+    return {"remitente": "user", "contenido": content, "metadata_json": None, "created_at": datetime.utcnow()}
+
+
+def _closed_port_sessions():
+    # Nada escucha en el puerto 1: asyncpg falla al conectar con OSError, no con SQLAlchemyError
+    engine = create_async_engine("postgresql+asyncpg://postgres@127.0.0.1:1/calma_test")
+    return engine, async_sessionmaker(engine, expire_on_commit=False)
+
+
+def test_writer_keeps_rows_and_survives_database_outage(monkeypatch):
+    async def scenario():
+        engine, sessions = _closed_port_sessions()
+        monkeypatch.setattr(chat_persistence, "AsyncSessionLocal", sessions)
+        writer = ChatMessageWriter(batch_size=2, flush_interval_seconds=0.02, max_queue=100)
+        writer.start()
+
+        conversation_id = uuid.uuid4()
+        await writer.submit(conversation_id, [_message("hola"), _message("sigo aquí")])
+        await writer.submit(conversation_id, [_message("¿me lees?")])
+        await asyncio.sleep(0.2)
+
+        stats = writer.stats()
+        assert not writer._task.done()
+        assert stats["queued_rows"] == 3
+        assert stats["failures"] >= 1
+        assert stats["oldest_queued_ms"] >= 150
+
+        # La base vuelve: el siguiente ciclo escribe lo pendiente en orden
+        written = []
+
+        async def write(rows):
+            written.extend(row["contenido"] for row in rows)
+
+        monkeypatch.setattr(writer, "_write", write)
+        await asyncio.sleep(0.1)
+        await writer.stop()
+        await engine.dispose()
+
+        assert written == ["hola", "sigo aquí", "¿me lees?"]
+        assert writer.stats()["queued_rows"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_failed_retry_keeps_original_enqueue_time(monkeypatch):
+    async def scenario():
+        writer = ChatMessageWriter(batch_size=1, flush_interval_seconds=1, max_queue=100)
+
+        async def unavailable(rows):
+            raise ConnectionRefusedError(111, "Connect call failed")
+
+        monkeypatch.setattr(writer, "_write", unavailable)
+        # Se encola a mano para no escribir en línea (la tarea de fondo no está corriendo)
+        writer._rows = [(0.0, {"contenido": "viejo"}), (1.0, {"contenido": "nuevo"})]
+        try:
+            await writer.flush()
+        except ConnectionRefusedError:
+            pass
+        assert [enqueued_at for enqueued_at, _ in writer._rows] == [0.0, 1.0]
+
+    asyncio.run(scenario())
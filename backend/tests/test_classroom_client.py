@@ -0,0 +1,48 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from google.oauth2.credentials import Credentials
+
+from app.services.classroom_client import ClassroomServiceCache
+
+
+def _credentials(token: str = "token-1") -> Credentials:
+    return Credentials(token=token)
+
+
+def test_service_is_shared_across_threads_for_the_same_user_and_token():
+    cache = ClassroomServiceCache(max_entries=10, ttl_seconds=60)
+    credentials = _credentials()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        services = list(executor.map(lambda _: cache.get(credentials, google_id="g1"), range(16)))
+
+    assert all(service is services[0] for service in services)
+    assert len(cache._entries) == 1
+
+
+def test_requests_from_different_threads_do_not_share_http():
+    cache = ClassroomServiceCache(max_entries=10, ttl_seconds=60)
+    service = cache.get(_credentials(), google_id="g1")
+    transports = {}
+
+    def build_request(name):
+        request = service.courses().list(pageSize=1)
+        transports[name] = request.http.http
+
+    threads = [threading.Thread(target=build_request, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert transports["a"] is not transports["b"]
+
+
+def test_invalidate_drops_entries_for_other_tokens():
+    cache = ClassroomServiceCache(max_entries=10, ttl_seconds=60)
+    old = cache.get(_credentials("old"), google_id="g1")
+
+    cache.invalidate("g1", current_token="new")
+
+    assert cache.get(_credentials("old"), google_id="g1") is not old
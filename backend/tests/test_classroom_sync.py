@@ -0,0 +1,50 @@
+from datetime import datetime, timezone
+
+from app.services.classroom_sync import _below_first_skipped, _list_ids, _max_update_time
+
+
+def _submission(submission_id: str, update_time: str):
+    return {"id": submission_id, "courseWorkId": f"cw-{submission_id}", "updateTime": update_time}
+
+
+def test_submission_watermark_stops_before_first_skipped():
+    early = _submission("a", "2026-03-01T10:00:00Z")
+    skipped = _submission("b", "2026-03-02T10:00:00Z")
+    late = _submission("c", "2026-03-03T10:00:00Z")
+
+    advancing = _below_first_skipped([early, late], [late, skipped, early])
+
+    assert advancing == [early]
+    assert _max_update_time(advancing, None) == datetime(2026, 3, 1, 10, tzinfo=timezone.utc)
+
+
+def test_submission_watermark_uses_all_when_nothing_skipped():
+    items = [_submission("a", "2026-03-01T10:00:00Z"), _submission("b", "2026-03-02T10:00:00Z")]
+    assert _below_first_skipped(items, items) == items
+
+
+class _Page:
+    def __init__(self, response):
+        self._response = response
+
+    def execute(self):
+        return self._response
+
+
+def test_list_ids_follows_every_page():
+    pages = {
+        None: {"courseWork": [{"id": "a"}, {"id": "b"}], "nextPageToken": "2"},
+        "2": {"courseWork": [{"id": "c"}]},
+    }
+    requested = []
+
+    def request_factory(token):
+        requested.append(token)
+        return _Page(pages[token])
+
+    assert _list_ids(request_factory, "courseWork") == {"a", "b", "c"}
+    assert requested == [None, "2"]
+
+
+def test_list_ids_of_an_empty_course_is_empty():
+    assert _list_ids(lambda token: _Page({}), "announcements") == set()
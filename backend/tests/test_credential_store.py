@@ -0,0 +1,80 @@
+import gc
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from cryptography.fernet import Fernet
+
+from app.services.credential_store import (
+    CredentialStore,
+    CredentialStoreError,
+    _MemoryCredentialBackend,
+    _RedisCredentialBackend,
+    _TokenCipher,
+)
+
+
+class _DictRedis:
+    """Solo GET/SET, que es lo que usan load y save del backend de Redis."""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+def _entry():
+    return {
+        "access_token": "ya29.acceso",
+        "refresh_token": "1//refresco",
+        "expiry": datetime.now(timezone.utc) + timedelta(hours=1),
+        "scopes": ["classroom"],
+    }
+
+
+def test_redis_backend_stores_tokens_encrypted():
+    client = _DictRedis()
+    backend = _RedisCredentialBackend(client, lock_timeout_seconds=1, cipher=_TokenCipher([Fernet.generate_key()]))
+
+    backend.save("alumno", _entry())
+
+    raw = client.values["credentials:alumno"]
+    assert "1//refresco" not in raw and "ya29.acceso" not in raw
+    loaded = backend.load("alumno")
+    assert loaded["refresh_token"] == "1//refresco"
+    assert loaded["access_token"] == "ya29.acceso"
+
+
+def test_legacy_plaintext_entries_still_load():
+    client = _DictRedis()
+    client.values["credentials:alumno"] = json.dumps({"access_token": "ya29.viejo", "refresh_token": "1//viejo"})
+    backend = _RedisCredentialBackend(client, lock_timeout_seconds=1, cipher=_TokenCipher([Fernet.generate_key()]))
+
+    assert backend.load("alumno")["refresh_token"] == "1//viejo"
+
+
+def test_rotated_key_still_decrypts_and_unknown_key_fails():
+    old_key, new_key = Fernet.generate_key(), Fernet.generate_key()
+    client = _DictRedis()
+    _RedisCredentialBackend(client, 1, _TokenCipher([old_key])).save("alumno", _entry())
+
+    rotated = _RedisCredentialBackend(client, 1, _TokenCipher([new_key, old_key]))
+    assert rotated.load("alumno")["refresh_token"] == "1//refresco"
+
+    with pytest.raises(CredentialStoreError):
+        _RedisCredentialBackend(client, 1, _TokenCipher([new_key])).load("alumno")
+
+
+def test_refresh_locks_are_dropped_once_released():
+    store = CredentialStore(_MemoryCredentialBackend(), cache_ttl_seconds=30)
+    for index in range(100):
+        store.save(f"alumno-{index}", _entry())
+        store.refresh(f"alumno-{index}", lambda entry: True, lambda entry: dict(entry, access_token="nuevo"))
+
+    gc.collect()
+    assert len(store._refresh_locks) == 0
+    assert store.get("alumno-7")["access_token"] == "nuevo"
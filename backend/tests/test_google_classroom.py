@@ -0,0 +1,110 @@
+import json
+import re
+from urllib.parse import unquote
+
+import httplib2
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpMock
+
+from app.services.google_classroom import _execute_batch
+
+_BOUNDARY = "batch_test_boundary"
+
+
+class ClassroomBatchTransport(HttpMock):
+    """
+    Transporte falso que entiende el endpoint de batch de Google.
+
+    Responde cada sub-petición según ``statuses`` (por id de curso; 200 si no aparece) y
+    registra los batch enviados y las llamadas individuales de reintento.
+    """
+
+    def __init__(self, statuses=None, retry_statuses=None, batch_status=200):
+        super().__init__(headers={"status": "200"})
+        self.statuses = statuses or {}
+        self.retry_statuses = retry_statuses or {}
+        self.batch_status = batch_status
+        self.batch_sizes = []
+        self.single_calls = []
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=1, connection_type=None):
+        if "/batch" in uri:
+            return self._batch(body)
+        course_id = unquote(uri.split("/courses/")[1].split("?")[0])
+        self.single_calls.append(course_id)
+        return self._response(self.retry_statuses.get(course_id, 200), course_id)
+
+    def _response(self, status, course_id):
+        payload = {"id": course_id} if status == 200 else {"error": {"code": status, "message": "falla"}}
+        return httplib2.Response({"status": str(status), "content-type": "application/json"}), json.dumps(payload).encode()
+
+    def _batch(self, body):
+        body = body.decode() if isinstance(body, bytes) else body
+        parts = re.findall(r"Content-ID: <([^>]+)>\s+(\w+) (\S+)", body)
+        self.batch_sizes.append(len(parts))
+        if self.batch_status != 200:
+            return httplib2.Response({"status": str(self.batch_status)}), b'{"error": {"code": 503}}'
+
+        chunks = []
+        for content_id, _, path in parts:
+            course_id = unquote(path.split("/courses/")[1].split("?")[0])
+            status = self.statuses.get(course_id, 200)
+            payload = {"id": course_id} if status == 200 else {"error": {"code": status, "message": "falla"}}
+            chunks.append(
+                f"--{_BOUNDARY}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                "Content-Type: application/json\r\n\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        content = "".join(chunks) + f"--{_BOUNDARY}--\r\n"
+        headers = {"status": "200", "content-type": f"multipart/mixed; boundary={_BOUNDARY}"}
+        return httplib2.Response(headers), content.encode()
+
+
+def _service(transport):
+    return build("classroom", "v1", http=transport, static_discovery=True, cache_discovery=False)
+
+
+def _course_requests(service, count):
+    return {f"course:{index}": service.courses().get(id=f"c{index}") for index in range(count)}
+
+
+def test_execute_batch_groups_requests_in_batches_of_fifty():
+    transport = ClassroomBatchTransport()
+    service = _service(transport)
+
+    results = _execute_batch(service, _course_requests(service, 120))
+
+    assert transport.batch_sizes == [50, 50, 20]
+    assert transport.single_calls == []
+    assert results["course:0"] == {"id": "c0"}
+    assert results["course:119"] == {"id": "c119"}
+
+
+def test_execute_batch_retries_failed_sub_requests_individually():
+    transport = ClassroomBatchTransport(
+        statuses={"c3": 500, "c7": 404},
+        retry_statuses={"c7": 404},
+    )
+    service = _service(transport)
+
+    results = _execute_batch(service, _course_requests(service, 10))
+
+    assert transport.batch_sizes == [10]
+    assert sorted(transport.single_calls) == ["c3", "c7"]
+    # c3 se recupera en el reintento; c7 vuelve a fallar y queda en None
+    assert results["course:3"] == {"id": "c3"}
+    assert results["course:7"] is None
+    assert all(results[f"course:{index}"] == {"id": f"c{index}"} for index in (0, 1, 2, 4, 5, 6, 8, 9))
+
+
+def test_execute_batch_falls_back_to_single_calls_when_whole_batch_fails():
+    transport = ClassroomBatchTransport(batch_status=503)
+    service = _service(transport)
+
+    results = _execute_batch(service, _course_requests(service, 3))
+
+    assert sorted(transport.single_calls) == ["c0", "c1", "c2"]
+    assert results == {f"course:{index}": {"id": f"c{index}"} for index in range(3)}
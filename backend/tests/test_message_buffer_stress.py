@@ -0,0 +1,44 @@
+import asyncio
+
+from app.services.chat_agent import MessageBuffer
+
+SESSIONS = 3000
+MESSAGES_PER_SESSION = 3
+
+
+def test_thousands_of_sessions_each_get_one_complete_bundle():
+    # Ventana holgada: con miles de tareas el loop se atrasa y los 20 ms entre mensajes se estiran
+    buffer = MessageBuffer(window_seconds=1.0)
+
+    async def student(index: int):
+        session_id = f"alumno-{index}"
+        calls = []
+        for turn in range(MESSAGES_PER_SESSION):
+            calls.append(asyncio.create_task(buffer.collect(session_id, f"{session_id}:{turn}")))
+            await asyncio.sleep(0.01)
+        return session_id, await asyncio.gather(*calls)
+
+    async def scenario():
+        # Los alumnos llegan repartidos en ~0.5 s para que se abran y cierren ventanas a la vez
+        async def staggered(index: int):
+            await asyncio.sleep((index % 50) * 0.01)
+            return await student(index)
+
+        return await asyncio.gather(*(staggered(index) for index in range(SESSIONS)))
+
+    results = asyncio.run(scenario())
+
+    primaries = {}
+    for session_id, collected in results:
+        expected = [f"{session_id}:{turn}" for turn in range(MESSAGES_PER_SESSION)]
+        bundles = {id(bundle) for bundle, _ in collected}
+        assert len(bundles) == 1
+        assert collected[0][0]["utterances"] == expected
+        primaries[session_id] = sum(primary for _, primary in collected)
+
+    assert set(primaries.values()) == {1}
+    stats = buffer.stats()
+    assert stats["open_sessions"] == 0
+    assert stats["queued_messages"] == 0
+    assert stats["flushes"] == SESSIONS
+    assert stats["messages_per_flush_avg"] == MESSAGES_PER_SESSION
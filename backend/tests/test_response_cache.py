@@ -0,0 +1,62 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.services.response_cache import CACHE_MISS, ResponseCache
+
+
+def _cache() -> ResponseCache:
+    return ResponseCache("test", soft_ttl_seconds=60, hard_ttl_seconds=120, max_bytes=10_000)
+
+
+def test_disconnected_client_does_not_cancel_coalesced_waiters():
+    cache = _cache()
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return {"cursos": 3}
+
+    async def scenario():
+        first = asyncio.create_task(cache.fetch(("alumno",), loader))
+        await asyncio.sleep(0.05)
+        second = asyncio.create_task(cache.fetch(("alumno",), loader))
+        await asyncio.sleep(0.05)
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        release.set()
+        return await second
+
+    data, status, _ = asyncio.run(scenario())
+
+    assert data == {"cursos": 3}
+    assert status == CACHE_MISS
+    assert len(calls) == 1
+
+
+def test_loader_failure_reaches_every_waiter_and_is_not_cached():
+    cache = _cache()
+    release = threading.Event()
+
+    def failing_loader():
+        release.wait(5)
+        raise RuntimeError("Classroom no responde")
+
+    async def scenario():
+        waiters = [asyncio.create_task(cache.fetch(("alumno",), failing_loader)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        retry = await cache.fetch(("alumno",), lambda: {"cursos": 1})
+        return results, retry
+
+    results, retry = asyncio.run(scenario())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retry[0] == {"cursos": 1}
+    assert not cache._inflight
@@ -0,0 +1,57 @@
+import asyncio
+
+import fakeredis
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.services.chat_agent import SessionMemory
+
+
+def _worker(server) -> SessionMemory:
+    client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    return SessionMemory(max_messages=20, ttl_seconds=60, max_sessions=100, redis_client=client)
+
+
+def _contents(messages):
+    return [message.content for message in messages]
+
+
+def test_append_racing_another_worker_does_not_leave_l1_stale():
+    server = fakeredis.FakeServer()
+    worker_a, worker_b = _worker(server), _worker(server)
+
+    async def scenario():
+        await worker_a.append_messages("sesion", [HumanMessage(content="hola", id="1")])
+        await worker_b.get_messages("sesion")
+
+        # B escribe justo entre la lectura de A y su append en Redis
+        original_append = worker_a._redis.append
+
+        async def append_after_other_worker(session_id, messages):
+            await worker_b.append_messages(session_id, [AIMessage(content="respuesta de B", id="2")])
+            return await original_append(session_id, messages)
+
+        worker_a._redis.append = append_after_other_worker
+        returned = await worker_a.append_messages("sesion", [HumanMessage(content="sigo aquí", id="3")])
+        worker_a._redis.append = original_append
+        return returned, await worker_a.get_messages("sesion"), await worker_b.get_messages("sesion")
+
+    returned, seen_by_a, seen_by_b = asyncio.run(scenario())
+
+    expected = ["hola", "respuesta de B", "sigo aquí"]
+    assert _contents(returned) == expected
+    assert _contents(seen_by_a) == expected
+    assert _contents(seen_by_b) == expected
+
+
+def test_local_history_reseeds_redis_after_it_loses_the_session():
+    server = fakeredis.FakeServer()
+    worker = _worker(server)
+
+    async def scenario():
+        await worker.append_messages("sesion", [HumanMessage(content="hola", id="1")])
+        # Redis desaloja la sesión (TTL o maxmemory) mientras la copia local sigue viva
+        await worker._redis.delete("sesion")
+        await worker.append_messages("sesion", [AIMessage(content="¿cómo vas?", id="2")])
+        return await _worker(server).get_messages("sesion")
+
+    assert _contents(asyncio.run(scenario())) == ["hola", "¿cómo vas?"]
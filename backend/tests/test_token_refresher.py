@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from google.auth.exceptions import RefreshError
+
+from app.services import token_refresher
+from app.services.credential_store import CredentialStore, _MemoryCredentialBackend
+from app.services.token_refresher import TokenRefreshWorker
+
+
+def _setup(monkeypatch, error: RefreshError):
+    store = CredentialStore(_MemoryCredentialBackend(), cache_ttl_seconds=0)
+    store.save("alumno", {
+        "access_token": "ya29.viejo",
+        "refresh_token": "1//revocado",
+        "expiry": datetime.now(timezone.utc) + timedelta(seconds=30),
+        "scopes": ["classroom"],
+    })
+    calls = []
+
+    def failing_refresh(entry):
+        calls.append(entry["refresh_token"])
+        raise error
+
+    monkeypatch.setattr(token_refresher, "credential_store", store)
+    monkeypatch.setattr(token_refresher, "list_token_users", store.list_users)
+    monkeypatch.setattr(token_refresher, "refresh_token_entry", failing_refresh)
+    worker = TokenRefreshWorker(interval_seconds=60, window_seconds=600, jitter_seconds=0, max_concurrency=2)
+    return store, worker, calls
+
+
+def test_invalid_grant_drops_the_refresh_token_and_stops_retrying(monkeypatch):
+    store, worker, calls = _setup(monkeypatch, RefreshError("invalid_grant: Token has been expired or revoked."))
+
+    async def scenario():
+        await worker.refresh_due()
+        await worker.refresh_due()
+
+    asyncio.run(scenario())
+
+    assert calls == ["1//revocado"]
+    entry = store.get("alumno")
+    assert entry["refresh_token"] is None
+    assert entry["access_token"] == "ya29.viejo"
+
+
+def test_revocation_keeps_a_token_saved_by_a_new_login(monkeypatch):
+    store, _, _ = _setup(monkeypatch, RefreshError("invalid_grant"))
+    store.save("alumno", dict(store.get("alumno"), refresh_token="1//nuevo"))
+
+    assert not store.revoke_refresh_token("alumno", "1//revocado")
+    assert store.get("alumno")["refresh_token"] == "1//nuevo"
+
+
+def test_retryable_errors_back_off_instead_of_revoking(monkeypatch):
+    store, worker, calls = _setup(monkeypatch, RefreshError("backendError", retryable=True))
+
+    async def scenario():
+        await worker.refresh_due()
+        await worker.refresh_due()
+
+    asyncio.run(scenario())
+
+    assert calls == ["1//revocado"]
+    assert store.get("alumno")["refresh_token"] == "1//revocado"
+    assert worker._backoff["alumno"][0] == 1
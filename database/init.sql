@@ -42,6 +42,7 @@ CREATE TABLE IF NOT EXISTS cursos (
     seccion VARCHAR(255),
     sala VARCHAR(255),
     estado VARCHAR(50) DEFAULT 'ACTIVE',
+    classroom_updated_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
@@ -72,6 +73,7 @@ CREATE TABLE IF NOT EXISTS tareas (
     fecha_limite TIMESTAMP WITH TIME ZONE,
     puntos_maximos DECIMAL(10,2),
     estado task_status DEFAULT 'pendiente',
+    classroom_updated_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
@@ -82,6 +84,7 @@ CREATE TABLE IF NOT EXISTS tareas (
 -- ============================================
 CREATE TABLE IF NOT EXISTS entregas (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    classroom_id VARCHAR(255) UNIQUE,
     tarea_id UUID REFERENCES tareas(id) ON DELETE CASCADE,
     estudiante_id UUID REFERENCES users(id) ON DELETE CASCADE,
     fecha_entrega TIMESTAMP WITH TIME ZONE,
@@ -90,6 +93,7 @@ CREATE TABLE IF NOT EXISTS entregas (
     comentarios TEXT,
     retrasada BOOLEAN DEFAULT false,
     minutos_retraso INTEGER DEFAULT 0,
+    classroom_updated_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     UNIQUE(tarea_id, estudiante_id)
@@ -191,10 +195,38 @@ CREATE TABLE IF NOT EXISTS anuncios (
     profesor_id UUID REFERENCES users(id) ON DELETE CASCADE,
     titulo VARCHAR(500),
     contenido TEXT NOT NULL,
+    classroom_updated_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- ============================================
+-- TABLA: estado_sincronizacion
+-- Marcas de agua (updateTime) de la sincronización incremental con Classroom
+-- ============================================
+CREATE TABLE IF NOT EXISTS estado_sincronizacion (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    usuario_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    curso_id UUID NOT NULL REFERENCES cursos(id) ON DELETE CASCADE,
+    recurso VARCHAR(50) NOT NULL,
+    marca_agua TIMESTAMP WITH TIME ZONE,
+    sincronizado_en TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_estado_sincronizacion UNIQUE(usuario_id, curso_id, recurso)
+);
+
+-- ============================================
+-- TABLA: credenciales_google
+-- Tokens OAuth de Google compartidos entre los workers del backend
+-- ============================================
+CREATE TABLE IF NOT EXISTS credenciales_google (
+    google_id VARCHAR(255) PRIMARY KEY,
+    access_token TEXT NOT NULL,
+    refresh_token TEXT,
+    expiry TIMESTAMP WITH TIME ZONE,
+    scopes JSONB,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
 -- ============================================
 -- TABLA: metricas_estudiante
 -- Métricas calculadas por IA sobre el rendimiento
@@ -232,8 +264,11 @@ CREATE INDEX idx_alertas_estudiante_id ON alertas(estudiante_id);
 CREATE INDEX idx_alertas_nivel ON alertas(nivel);
 CREATE INDEX idx_alertas_leida ON alertas(leida);
 CREATE INDEX idx_conversaciones_estudiante_id ON conversaciones_chat(estudiante_id);
-CREATE INDEX idx_mensajes_conversacion_id ON mensajes_chat(conversacion_id);
+CREATE INDEX idx_conversaciones_estudiante_activa ON conversaciones_chat(estudiante_id, created_at DESC) WHERE activa;
+CREATE INDEX idx_mensajes_conversacion_creacion ON mensajes_chat(conversacion_id, created_at, id);
 CREATE INDEX idx_metricas_estudiante_id ON metricas_estudiante(estudiante_id);
+CREATE INDEX idx_estado_sincronizacion_usuario_id ON estado_sincronizacion(usuario_id);
+CREATE INDEX idx_anuncios_curso_actualizacion ON anuncios(curso_id, classroom_updated_at DESC);
 
 -- ============================================
 -- FUNCIÓN: Actualizar timestamp automáticamente